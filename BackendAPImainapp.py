@@ -15,12 +15,14 @@ import logging
 
 from app.config import settings
 from app.database import engine, create_tables
+from app.core.redis_pool import init_redis, close_redis
 from app.core.middleware import (
     SecurityHeadersMiddleware,
     LoggingMiddleware,
     RateLimitMiddleware
 )
 from app.core.exceptions import APIException, api_exception_handler
+from app.core.metrics import render_latest, mark_process_dead
 from app.api import auth, chat, medical, patients, calendar, websocket
 
 
@@ -41,6 +43,9 @@ async def lifespan(app: FastAPI):
     # Create database tables
     await create_tables()
     
+    # Shared Redis pool (rate limiter, caches, health checks)
+    await init_redis()
+    
     # Initialize AI models
     from app.ai.llm_client import initialize_llm_models
     await initialize_llm_models()
@@ -49,6 +54,26 @@ async def lifespan(app: FastAPI):
     from app.ai.vector_store import initialize_vector_store
     await initialize_vector_store()
     
+    # Load + warm up ASR workers so the first dictation doesn't pay the model load
+    from app.services.stt_service import start_asr
+    await start_asr()
+    
+    # DICOM de-identification workers (spawned and warmed here, not on the first upload)
+    from app.services.dicom_ingest import get_dicom_pool
+    await get_dicom_pool().start()
+    
+    # Background dependency probes for /health/detailed
+    from app.services.health_service import health_monitor
+    health_monitor.start()
+    
+    # Websocket fan-out: this worker's single Redis pub/sub subscription
+    from app.services.ws_hub import ws_hub
+    ws_hub.start()
+    
+    # Batched audit_log writer (flushes on size/time, spills to disk if the DB is down)
+    from app.services.audit_service import audit_writer
+    audit_writer.start()
+    
     logger.info("✅ AI MedKit API started successfully")
     
     yield
@@ -57,7 +82,20 @@ async def lifespan(app: FastAPI):
     logger.info("🛑 Shutting down AI MedKit API...")
     
     # Cleanup resources
+    await health_monitor.stop()
+    from app.services.stt_service import shutdown_asr
+    await shutdown_asr()
+    from app.ai.llm_client import close_llm_client
+    await close_llm_client()
+    from app.ai.embeddings import shutdown_embeddings
+    await shutdown_embeddings()
+    from app.services.dicom_ingest import shutdown_dicom
+    await shutdown_dicom()
+    await ws_hub.close()
+    await audit_writer.close()  # before the engine goes away
+    await close_redis()
     await engine.dispose()
+    mark_process_dead()
     
     logger.info("✅ AI MedKit API shutdown complete")
 
@@ -150,58 +188,9 @@ async def health_check():
 
 @app.get("/health/detailed", tags=["system"])
 async def detailed_health_check():
-    """Detailed health check with dependencies"""
-    from app.database import check_database_connection
-    from app.services.medical_ai_service import check_ai_models
-    
-    health_status = {
-        "status": "healthy",
-        "timestamp": time.time(),
-        "checks": {}
-    }
-    
-    # Check database connection
-    try:
-        db_healthy = await check_database_connection()
-        health_status["checks"]["database"] = {
-            "status": "healthy" if db_healthy else "unhealthy",
-            "response_time_ms": None  # TODO: Add timing
-        }
-    except Exception as e:
-        health_status["checks"]["database"] = {
-            "status": "unhealthy",
-            "error": str(e)
-        }
-        health_status["status"] = "degraded"
-    
-    # Check AI models
-    try:
-        ai_healthy = await check_ai_models()
-        health_status["checks"]["ai_models"] = {
-            "status": "healthy" if ai_healthy else "unhealthy"
-        }
-    except Exception as e:
-        health_status["checks"]["ai_models"] = {
-            "status": "unhealthy",
-            "error": str(e)
-        }
-        health_status["status"] = "degraded"
-    
-    # Check Redis connection
-    try:
-        from app.services.auth_service import check_redis_connection
-        redis_healthy = await check_redis_connection()
-        health_status["checks"]["redis"] = {
-            "status": "healthy" if redis_healthy else "unhealthy"
-        }
-    except Exception as e:
-        health_status["checks"]["redis"] = {
-            "status": "unhealthy",
-            "error": str(e)
-        }
-        health_status["status"] = "degraded"
-    
-    return health_status
+    """Detailed health check with dependencies (latest background snapshot)"""
+    from app.services.health_service import health_monitor
+    return await health_monitor.snapshot()
 
 
 # API Routers
@@ -257,14 +246,9 @@ async def root():
 # Metrics endpoint for monitoring
 @app.get("/metrics", tags=["system"])
 async def metrics():
-    """Prometheus metrics endpoint"""
-    # TODO: Implement proper Prometheus metrics
-    return {
-        "active_sessions": 0,  # Get from Redis
-        "total_requests": 0,   # Get from middleware counter
-        "ai_requests_today": 0,
-        "average_response_time": 0
-    }
+    """Prometheus metrics endpoint (text exposition format, aggregated across workers)"""
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
 
 
 if __name__ == "__main__":
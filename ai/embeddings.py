@@ -0,0 +1,348 @@
+# app/ai/embeddings.py
+"""
+Embedding service feeding ai/vector_store.
+
+Callers await `embed(texts)`; concurrent requests are merged into one model call
+(flushed at `max_batch_size` texts or `max_wait_ms` after the first), identical texts
+in flight are encoded once, and vectors are cached on disk keyed by
+sha256(model, text), so a reindex only encodes what changed. The cache holds digests
+and vectors, never the text.
+
+Bulk backfill of chat_messages and lab_results (runs as the DB owner, outside RLS):
+
+    python -m app.ai.embeddings --backfill
+"""
+from typing import AsyncIterator, Callable, Optional, Sequence
+import argparse, asyncio, hashlib, os, re, sqlite3, threading, time
+
+import numpy as np
+
+from app.config import settings
+
+Encoder = Callable[[list[str]], np.ndarray]
+
+def text_digest(model: str, text: str) -> bytes:
+    return hashlib.sha256(model.encode() + b"\0" + text.encode()).digest()
+
+class EmbeddingCache:
+    """Content-addressed float32 vectors in SQLite (WAL: API workers and a backfill can share it)."""
+
+    def __init__(self, path: str, dim: int):
+        self.dim = dim
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS vectors (digest BLOB PRIMARY KEY, vec BLOB NOT NULL) WITHOUT ROWID")
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get_many(self, digests: Sequence[bytes]) -> dict[bytes, np.ndarray]:
+        found: dict[bytes, np.ndarray] = {}
+        with self._lock:
+            for s in range(0, len(digests), 500):  # stay under SQLite's bound-parameter limit
+                part = digests[s:s + 500]
+                rows = self._db.execute(
+                    f"SELECT digest, vec FROM vectors WHERE digest IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for digest, blob in rows:
+                    found[digest] = np.frombuffer(blob, dtype=np.float32)
+        self.hits += len(found)
+        self.misses += len(set(digests)) - len(found)
+        return found
+
+    def put_many(self, items: Sequence[tuple[bytes, np.ndarray]]):
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO vectors VALUES (?, ?)",
+                [(d, np.asarray(v, dtype=np.float32).tobytes()) for d, v in items],
+            )
+
+    def close(self):
+        self._db.close()
+
+def _sentence_transformer(model_name: str) -> Encoder:
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(texts: list[str]) -> np.ndarray:
+        return model.encode(texts, batch_size=len(texts), normalize_embeddings=True, convert_to_numpy=True)
+
+    return encode
+
+class EmbeddingService:
+    """
+    Same scheduling as the ASR batcher: one encode runs at a time off the event loop,
+    and while it runs the queue fills the next batch, so batch size follows load.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        dim: int,
+        max_batch_size: int = 64,
+        max_wait_ms: int = 10,
+        cache: Optional[EmbeddingCache] = None,
+        encode: Optional[Encoder] = None,
+    ):
+        self.model_name = model_name
+        self.dim = dim
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0, max_wait_ms) / 1000
+        self.cache = cache
+        self._encode = encode
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._pending: dict[bytes, asyncio.Future] = {}
+        self.encoded = self.deduplicated = self.batches = 0
+
+    def _ensure_started(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    def _encoder(self) -> Encoder:
+        if self._encode is None:
+            self._encode = _sentence_transformer(self.model_name)
+        return self._encode
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """(len(texts), dim) float32, L2-normalized, in input order."""
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        if not texts:
+            return out
+        digests = [text_digest(self.model_name, t) for t in texts]
+        cached = await asyncio.to_thread(self.cache.get_many, digests) if self.cache is not None else {}
+        self._ensure_started()
+        futures: dict[bytes, asyncio.Future] = {}
+        for digest, text in zip(digests, texts):
+            if digest in cached or digest in futures:
+                continue
+            fut = self._pending.get(digest)
+            if fut is not None:
+                self.deduplicated += 1
+            else:
+                fut = self._pending[digest] = asyncio.get_running_loop().create_future()
+                self._queue.put_nowait((digest, text))
+            futures[digest] = fut
+        if futures:
+            # shield: one caller giving up must not cancel a vector another caller is waiting on
+            await asyncio.gather(*(asyncio.shield(f) for f in futures.values()))
+        for i, digest in enumerate(digests):
+            out[i] = cached[digest] if digest in cached else futures[digest].result()
+        return out
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._encode_batch(batch)
+
+    async def _encode_batch(self, batch: list[tuple[bytes, str]]):
+        try:
+            vecs = await asyncio.to_thread(self._encoder(), [text for _, text in batch])
+            vecs = np.asarray(vecs, dtype=np.float32)
+            if self.cache is not None:
+                await asyncio.to_thread(self.cache.put_many, [(d, v) for (d, _), v in zip(batch, vecs)])
+        except Exception as exc:
+            for digest, _ in batch:
+                fut = self._pending.pop(digest, None)
+                if fut is not None and not fut.done():
+                    fut.set_exception(exc)
+            return
+        self.batches += 1
+        self.encoded += len(batch)
+        for (digest, _), vec in zip(batch, vecs):
+            fut = self._pending.pop(digest, None)
+            if fut is not None and not fut.done():
+                fut.set_result(vec)
+
+    def stats(self) -> dict:
+        return {
+            "encoded": self.encoded, "batches": self.batches, "deduplicated": self.deduplicated,
+            "cache_hits": self.cache.hits if self.cache else 0, "queue_depth": self._queue.qsize() if self._queue else 0,
+        }
+
+    async def aclose(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+_SERVICE: Optional[EmbeddingService] = None
+
+def get_embedding_service() -> EmbeddingService:
+    global _SERVICE
+    if _SERVICE is None:
+        _SERVICE = EmbeddingService(
+            settings.EMBEDDING_MODEL,
+            settings.VECTOR_DIM,
+            settings.EMBEDDING_MAX_BATCH_SIZE,
+            settings.EMBEDDING_MAX_WAIT_MS,
+            cache=EmbeddingCache(settings.EMBEDDING_CACHE_PATH, settings.VECTOR_DIM),
+        )
+    return _SERVICE
+
+async def shutdown_embeddings():
+    global _SERVICE
+    if _SERVICE is not None:
+        await _SERVICE.aclose()
+        if _SERVICE.cache is not None:
+            _SERVICE.cache.close()
+        _SERVICE = None
+
+def chunk_text(text: str, max_chars: int = 1000) -> list[str]:
+    """Split on paragraph, then sentence, then word boundaries into chunks of at most max_chars."""
+    text = text.strip()
+    if len(text) <= max_chars:
+        return [text] if text else []
+    chunks, current = [], ""
+    for piece in _pieces(text, max_chars):
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _pieces(text: str, max_chars: int) -> list[str]:
+    out = []
+    for para in re.split(r"\n\s*\n", text):
+        for sent in re.split(r"(?<=[.!?])\s+", para.strip()):
+            while len(sent) > max_chars:
+                cut = sent.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                out.append(sent[:cut])
+                sent = sent[cut:].lstrip()
+            if sent:
+                out.append(sent)
+    return out
+
+# Backfill: (source, id, doctor_id, patient_id, text) per document, streamed with a
+# server-side cursor so memory stays bounded by yield_per, not by table size.
+_SOURCES = {
+    "chat_messages": (
+        "SELECT m.id::text, s.doctor_id::text, s.patient_id::text, m.content "
+        "FROM chat_messages m JOIN medical_sessions s ON s.id = m.session_id "
+        "WHERE m.message_type <> 'system'"
+    ),
+    "lab_results": (
+        "SELECT id::text, doctor_id::text, patient_id::text, "
+        "concat_ws(E'\\n', test_name, test_type, results::text, ai_interpretation, raw_data) "
+        "FROM lab_results"
+    ),
+}
+
+async def _documents(table: str, yield_per: int) -> AsyncIterator[tuple]:
+    from sqlalchemy import text
+    from app.database import SessionLocal
+    async with SessionLocal() as session:
+        result = await session.stream(text(_SOURCES[table]).execution_options(yield_per=yield_per))
+        async for partition in result.partitions():
+            for row in partition:
+                yield (table,) + tuple(row)
+
+async def backfill(
+    service: EmbeddingService,
+    store,
+    tables: Sequence[str] = tuple(_SOURCES),
+    batch_texts: int = 256,
+    yield_per: int = 500,
+    chunk_chars: int = 1000,
+) -> dict:
+    """
+    Embed every row of `tables` into `store` (ids "<table>:<row id>:<chunk>").
+    DB reads overlap with encoding through a queue of at most two batches. Once every
+    row has been read, the store's ids under `tables` that this run did not write
+    (chunks past a document's new count, documents since deleted or emptied) are removed.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=2)
+    stats = {"documents": 0, "chunks": 0, "removed": 0}
+    written: set[str] = set()
+
+    async def produce():
+        batch: list[tuple] = []
+        size = 0
+        try:
+            for table in tables:
+                async for source, id_, doctor_id, patient_id, body in _documents(table, yield_per):
+                    chunks = chunk_text(body or "", chunk_chars)
+                    if not chunks:
+                        continue
+                    batch.append((f"{source}:{id_}", doctor_id, patient_id, chunks))
+                    size += len(chunks)
+                    if size >= batch_texts:
+                        await queue.put(batch)
+                        batch, size = [], 0
+            if batch:
+                await queue.put(batch)
+        except asyncio.CancelledError:
+            raise  # the consumer is gone; nobody waits for the end marker
+        except BaseException:
+            await queue.put(None)  # wake the consumer; it re-raises this from `await producer`
+            raise
+        await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    start = time.perf_counter()
+    encoded_before = service.encoded
+    try:
+        while (batch := await queue.get()) is not None:
+            vecs = await service.embed([c for _, _, _, chunks in batch for c in chunks])
+            i = 0
+            for key, doctor_id, patient_id, chunks in batch:
+                ids = [f"{key}:{n}" for n in range(len(chunks))]
+                store.add(ids, vecs[i:i + len(chunks)], doctor_id, patient_id)
+                written.update(ids)
+                i += len(chunks)
+            stats["documents"] += len(batch)
+            stats["chunks"] += i
+        await producer
+    finally:
+        producer.cancel()
+    sources = set(tables)
+    stats["removed"] = store.remove([id_ for id_ in store.ids() if id_.split(":", 1)[0] in sources and id_ not in written])
+    elapsed = time.perf_counter() - start
+    stats.update({
+        "encoded": service.encoded - encoded_before,
+        "seconds": round(elapsed, 2),
+        "texts_per_s": round(stats["chunks"] / elapsed, 1) if elapsed else 0.0,
+    })
+    return stats
+
+async def _main():
+    from app.ai.vector_store import get_vector_store
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backfill", action="store_true", required=True)
+    ap.add_argument("--tables", nargs="+", default=list(_SOURCES), choices=list(_SOURCES))
+    ap.add_argument("--batch-texts", type=int, default=256)
+    args = ap.parse_args()
+
+    store = get_vector_store()
+    service = get_embedding_service()
+    stats = await backfill(service, store, args.tables, args.batch_texts, chunk_chars=settings.EMBEDDING_CHUNK_CHARS)
+    store.build_index()
+    store.save(settings.VECTOR_STORE_PATH)
+    print(stats, service.stats())
+    await shutdown_embeddings()
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -1,3 +1,472 @@
+# app/ai/llm_client.py
+"""
+LLM backends behind one streaming interface: `stream()` is an async iterator of text
+chunks in arrival order. Callers pull at their own pace, so a slow consumer slows the
+upstream read instead of buffering a whole completion, and closing the iterator
+(client went away) aborts the upstream call. LLM_BACKEND selects the backend;
+"fake" needs no network and is what tests and benchmarks run against.
+
+Provider backends are LLMClient instances: one shared pooled httpx client, an
+exact-prompt LRU cache, coalescing of identical in-flight prompts, a per-provider
+concurrency cap, and retries with full-jitter exponential backoff on 429/5xx.
+Coalesced streams are read upstream once and fanned out to every reader, so there
+the upstream read runs at the pace of the model, not of the slowest reader (the
+buffer is one completion).
+"""
+from typing import Any, AsyncIterator, Callable, Optional, Protocol
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import aclosing
+import asyncio, hashlib, json, random, re, time
+
+import httpx
+
+from app.config import settings
+
+class LLMBackend(Protocol):
+    name: str
+
+    def stream(self, prompt: str, *, system: Optional[str] = None, max_tokens: int = 1024) -> AsyncIterator[str]:
+        ...
+
+    async def complete(self, prompt: str, *, system: Optional[str] = None, max_tokens: int = 1024) -> str:
+        ...
+
+# Prompts that want the fake backend to draft a note put the transcript after this marker
+TRANSCRIPT_MARKER = "Transcript:\n"
+
+_HEADINGS = {
+    "en": ("Subjective", "Objective", "Assessment", "Plan"),
+    "fr": ("Subjectif", "Objectif", "Évaluation", "Plan"),
+}
+
+def _fake_soap_completion(prompt: str, language: str = "en") -> str:
+    from app.services.soap_extractor import DEFAULT_EXTRACTOR
+    transcript = prompt.split(TRANSCRIPT_MARKER, 1)[-1]
+    sections = DEFAULT_EXTRACTOR.extract(transcript).sections
+    out = []
+    for heading, lines in zip(_HEADINGS.get(language, _HEADINGS["en"]), sections.values()):
+        out.append(f"## {heading}")
+        out.extend(f"- {ln}" for ln in lines or ["…"])
+    return "\n".join(out) + "\n"
+
+class FakeLLMBackend:
+    """
+    Deterministic local stand-in. Drafts a SOAP note from the transcript in the prompt
+    (lexicon extractor) and streams it a word at a time with model-like pacing.
+    `respond` replaces the drafting step with any prompt -> completion function.
+    """
+    name = "fake"
+
+    def __init__(
+        self,
+        first_token_s: float = 0.2,
+        token_s: float = 0.02,
+        respond: Optional[Callable[[str], str]] = None,
+    ):
+        self.first_token_s = first_token_s
+        self.token_s = token_s
+        self.respond = respond
+        self.calls = 0
+
+    async def stream(self, prompt: str, *, system: Optional[str] = None, max_tokens: int = 1024) -> AsyncIterator[str]:
+        self.calls += 1
+        if self.respond is not None:
+            text = self.respond(prompt)
+        else:
+            lang = "fr" if system and "français" in system else "en"
+            text = _fake_soap_completion(prompt, lang)
+        await asyncio.sleep(self.first_token_s)
+        for i, token in enumerate(re.findall(r"\S+\s*|\s+", text)[:max_tokens]):
+            if i:
+                await asyncio.sleep(self.token_s)
+            yield token
+
+    async def complete(self, prompt: str, *, system: Optional[str] = None, max_tokens: int = 1024) -> str:
+        return "".join([tok async for tok in self.stream(prompt, system=system, max_tokens=max_tokens)])
+
+class LLMError(Exception):
+    def __init__(self, provider: str, detail: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(f"{provider}: {detail}")
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status is None or self.status in _RETRY_STATUS
+
+# 529 = Anthropic "overloaded"; None above = transport error (connect/read timeout, reset)
+_RETRY_STATUS = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+
+_HTTP: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """One keep-alive pool for every provider: TLS handshakes are paid once per connection, not per call."""
+    global _HTTP
+    if _HTTP is None:
+        _HTTP = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=30,
+            ),
+            timeout=httpx.Timeout(settings.LLM_TIMEOUT_S, connect=5.0),
+        )
+    return _HTTP
+
+async def close_llm_client():
+    global _HTTP
+    if _HTTP is not None:
+        await _HTTP.aclose()
+        _HTTP = None
+
+def _retry_after(resp: httpx.Response) -> Optional[float]:
+    try:
+        return float(resp.headers["retry-after"])
+    except (KeyError, ValueError):
+        return None
+
+class HTTPProvider(ABC):
+    """Request/response shapes for one vendor API; LLMClient does the rest."""
+    name = "http"
+
+    def __init__(self, base_url: str, api_key: str, model: str, http: Optional[httpx.AsyncClient] = None):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self._http = http
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        return self._http or get_http_client()
+
+    @abstractmethod
+    def request(self, prompt: str, system: Optional[str], max_tokens: int, stream: bool) -> tuple[str, dict, dict]:
+        """(path, headers, JSON payload) of one call."""
+
+    @abstractmethod
+    def text(self, body: dict) -> str:
+        """The completion text of a non-streamed response."""
+
+    @abstractmethod
+    def delta(self, event: dict) -> Optional[str]:
+        """The text carried by one streamed event, if any."""
+
+    async def complete(self, prompt: str, system: Optional[str], max_tokens: int) -> str:
+        path, headers, payload = self.request(prompt, system, max_tokens, stream=False)
+        try:
+            resp = await self.http.post(self.base_url + path, headers=headers, json=payload)
+        except httpx.TransportError as exc:
+            raise LLMError(self.name, type(exc).__name__) from exc
+        if resp.status_code >= 400:
+            raise LLMError(self.name, f"HTTP {resp.status_code}", resp.status_code, _retry_after(resp))
+        return self.text(resp.json())
+
+    async def stream(self, prompt: str, system: Optional[str], max_tokens: int) -> AsyncIterator[str]:
+        path, headers, payload = self.request(prompt, system, max_tokens, stream=True)
+        try:
+            async with self.http.stream("POST", self.base_url + path, headers=headers, json=payload) as resp:
+                if resp.status_code >= 400:
+                    await resp.aread()
+                    raise LLMError(self.name, f"HTTP {resp.status_code}", resp.status_code, _retry_after(resp))
+                async for line in resp.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = self.delta(json.loads(data))
+                    if chunk:
+                        yield chunk
+        except httpx.TransportError as exc:
+            raise LLMError(self.name, type(exc).__name__) from exc
+
+class OpenAIProvider(HTTPProvider):
+    name = "openai"
+
+    def request(self, prompt, system, max_tokens, stream):
+        messages = ([{"role": "system", "content": system}] if system else []) + [{"role": "user", "content": prompt}]
+        payload = {"model": self.model, "messages": messages, "max_tokens": max_tokens, "stream": stream}
+        return "/chat/completions", {"Authorization": f"Bearer {self.api_key}"}, payload
+
+    def text(self, body):
+        return body["choices"][0]["message"]["content"] or ""
+
+    def delta(self, event):
+        choices = event.get("choices") or [{}]
+        return choices[0].get("delta", {}).get("content")
+
+class AnthropicProvider(HTTPProvider):
+    name = "anthropic"
+
+    def request(self, prompt, system, max_tokens, stream):
+        payload: dict[str, Any] = {
+            "model": self.model, "max_tokens": max_tokens, "stream": stream,
+            "messages": [{"role": "user", "content": prompt}],
+        }
+        if system:
+            payload["system"] = system
+        return "/messages", {"x-api-key": self.api_key, "anthropic-version": "2023-06-01"}, payload
+
+    def text(self, body):
+        return "".join(block.get("text", "") for block in body.get("content", []))
+
+    def delta(self, event):
+        if event.get("type") == "content_block_delta":
+            return event.get("delta", {}).get("text")
+        return None
+
+_WS = re.compile(r"\s+")
+
+class _SharedStream:
+    """
+    One upstream stream read by every identical request that arrives while it runs.
+    Chunks are kept, so a reader that joins late first gets what it missed. When the
+    last reader leaves before the end, the upstream call is aborted.
+    """
+
+    def __init__(self):
+        self.parts: list[str] = []
+        self.done = False
+        self.abandoned = False
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Task] = None
+        self._readers = 0
+        self._waiter: Optional[asyncio.Future] = None
+
+    def _notify(self):
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def push(self, chunk: str):
+        self.parts.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done, self.error = True, error
+        self._notify()
+
+    async def read(self) -> AsyncIterator[str]:
+        self._readers += 1
+        i = 0
+        try:
+            while True:
+                if i < len(self.parts):
+                    i += 1
+                    yield self.parts[i - 1]
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    if self._waiter is None:
+                        self._waiter = asyncio.get_running_loop().create_future()
+                    await asyncio.shield(self._waiter)  # one reader leaving must not cancel the others' wait
+        finally:
+            self._readers -= 1
+            if not self._readers and not self.done:
+                self.abandoned = True
+                self.task.cancel()
+
+class LLMClient:
+    """
+    Exact cache: prompts are keyed after whitespace normalization (model, system prompt
+    and max_tokens included), so re-drafting the same transcript is free; there is no
+    semantic matching, since two clinically different transcripts can embed close together.
+    """
+
+    def __init__(
+        self,
+        provider: HTTPProvider,
+        max_concurrency: int = 8,
+        max_retries: int = 3,
+        cache_size: int = 512,
+        cache_ttl_s: float = 900,
+        backoff_base_s: float = 0.25,
+        backoff_max_s: float = 8.0,
+    ):
+        self.provider = provider
+        self.name = provider.name
+        self.max_retries = max_retries
+        self.cache_size = cache_size
+        self.cache_ttl_s = cache_ttl_s
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._cache: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._streams: dict[str, _SharedStream] = {}
+        self.hits = self.misses = self.coalesced = self.upstream_calls = self.retries = 0
+
+    def key(self, prompt: str, system: Optional[str], max_tokens: int) -> str:
+        raw = json.dumps([self.name, self.provider.model, _WS.sub(" ", system or "").strip(),
+                          _WS.sub(" ", prompt).strip(), max_tokens])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _cached(self, key: str) -> Optional[str]:
+        item = self._cache.get(key)
+        if item is None:
+            return None
+        if item[0] < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return item[1]
+
+    def _store(self, key: str, text: str):
+        if self.cache_size <= 0:
+            return
+        self._cache[key] = (time.monotonic() + self.cache_ttl_s, text)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _backoff(self, attempt: int, exc: LLMError) -> float:
+        # Full jitter spreads a burst of 429s instead of retrying in lockstep
+        delay = random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2 ** attempt))
+        return max(delay, exc.retry_after or 0.0)
+
+    async def _call(self, prompt: str, system: Optional[str], max_tokens: int) -> str:
+        attempt = 0
+        while True:
+            try:
+                async with self._slots:
+                    self.upstream_calls += 1
+                    return await self.provider.complete(prompt, system, max_tokens)
+            except LLMError as exc:
+                if not exc.retryable or attempt >= self.max_retries:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt, exc))
+                attempt += 1
+
+    async def complete(self, prompt: str, *, system: Optional[str] = None, max_tokens: int = 1024) -> str:
+        key = self.key(prompt, system, max_tokens)
+        text = self._cached(key)
+        if text is not None:
+            self.hits += 1
+            return text
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.coalesced += 1
+            return await asyncio.shield(fut)
+        shared = self._streams.get(key)
+        if shared is not None and not shared.abandoned:
+            self.coalesced += 1
+            async with aclosing(shared.read()) as chunks:
+                return "".join([chunk async for chunk in chunks])
+        self.misses += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            text = await self._call(prompt, system, max_tokens)
+        except BaseException as exc:
+            # A cancelled leader fails its followers too; they see an LLMError, not their own cancellation
+            fut.set_exception(exc if isinstance(exc, Exception) else LLMError(self.name, "Cancelled"))
+            fut.exception()  # followers may be gone; don't warn about an unretrieved exception
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        self._store(key, text)
+        fut.set_result(text)
+        return text
+
+    async def stream(self, prompt: str, *, system: Optional[str] = None, max_tokens: int = 1024) -> AsyncIterator[str]:
+        """
+        Cache hits (and identical prompts already in flight via complete()) arrive as
+        one chunk; identical streams in flight share one upstream call. Retries only
+        happen before the first chunk; after that a failure is the caller's, since
+        part of the text has already been shown.
+        """
+        key = self.key(prompt, system, max_tokens)
+        text = self._cached(key)
+        if text is None and key in self._inflight:
+            self.coalesced += 1
+            text = await asyncio.shield(self._inflight[key])
+        elif text is not None:
+            self.hits += 1
+        if text is not None:
+            yield text
+            return
+        shared = self._streams.get(key)
+        if shared is None or shared.abandoned:
+            self.misses += 1
+            shared = self._streams[key] = _SharedStream()
+            shared.task = asyncio.create_task(self._pump(key, shared, prompt, system, max_tokens))
+        else:
+            self.coalesced += 1
+        async with aclosing(shared.read()) as chunks:  # leaving now, not at garbage collection
+            async for chunk in chunks:
+                yield chunk
+
+    async def _pump(self, key: str, shared: _SharedStream, prompt: str, system: Optional[str], max_tokens: int):
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with self._slots:
+                        self.upstream_calls += 1
+                        async for chunk in self.provider.stream(prompt, system, max_tokens):
+                            shared.push(chunk)
+                    break
+                except LLMError as exc:
+                    if shared.parts or not exc.retryable or attempt == self.max_retries:
+                        raise
+                    self.retries += 1
+                    await asyncio.sleep(self._backoff(attempt, exc))
+            self._store(key, "".join(shared.parts))
+            shared.finish()
+        except Exception as exc:
+            shared.finish(exc)
+        finally:
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+
+    def stats(self) -> dict:
+        return {
+            "provider": self.name, "cached": len(self._cache), "in_flight": len(self._inflight) + len(self._streams),
+            "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+            "upstream_calls": self.upstream_calls, "retries": self.retries,
+        }
+
+def _provider_client(provider: HTTPProvider) -> LLMClient:
+    return LLMClient(
+        provider,
+        max_concurrency=settings.LLM_MAX_CONCURRENCY,
+        max_retries=settings.LLM_MAX_RETRIES,
+        cache_size=settings.LLM_CACHE_SIZE,
+        cache_ttl_s=settings.LLM_CACHE_TTL_S,
+    )
+
+_FACTORIES: dict[str, Callable[[], LLMBackend]] = {
+    "fake": lambda: FakeLLMBackend(settings.LLM_FAKE_FIRST_TOKEN_MS / 1000, settings.LLM_FAKE_TOKEN_MS / 1000),
+    "openai": lambda: _provider_client(
+        OpenAIProvider(settings.OPENAI_BASE_URL, settings.OPENAI_API_KEY, settings.OPENAI_MODEL)
+    ),
+    "anthropic": lambda: _provider_client(
+        AnthropicProvider(settings.ANTHROPIC_BASE_URL, settings.ANTHROPIC_API_KEY, settings.ANTHROPIC_MODEL)
+    ),
+}
+_BACKEND: Optional[LLMBackend] = None
+
+def register_backend(name: str, factory: Callable[[], LLMBackend]):
+    _FACTORIES[name] = factory
+
+def get_llm_backend() -> LLMBackend:
+    global _BACKEND
+    if _BACKEND is None:
+        try:
+            factory = _FACTORIES[settings.LLM_BACKEND]
+        except KeyError:
+            raise RuntimeError(f"Unknown LLM_BACKEND {settings.LLM_BACKEND!r}; known: {sorted(_FACTORIES)}")
+        _BACKEND = factory()
+    return _BACKEND
+
+def set_llm_backend(backend: Optional[LLMBackend]):
+    # Tests/benchmarks swap in a configured fake; None resets to LLM_BACKEND on next use
+    global _BACKEND
+    _BACKEND = backend
+
 async def initialize_llm_models():
-    # Warm-up loaders or clients; keep async signature for lifespan hook
-    return
+    # Build the configured backend at startup so a bad LLM_BACKEND fails the boot, not the first note
+    get_llm_backend()
@@ -1,3 +1,421 @@
+# app/ai/vector_store.py
+"""
+In-process vector store for per-doctor retrieval: no network round trip for corpora
+that fit in memory.
+
+Embeddings live in one contiguous float32 matrix (L2-normalized, so dot = cosine).
+Every search is scoped to a doctor_id (optionally a patient_id), mirroring the
+doctor isolation RLS policies enforce in Postgres. Exact search is one matrix
+product over that doctor's rows plus `argpartition` top-k. Above VECTOR_ANN_MIN_ROWS
+rows an optional IVF (NumPy, always available) or HNSW (hnswlib, if installed) index
+proposes candidates that are re-scored exactly; rows added after the last
+`build_index()` are scanned exactly, so results never miss fresh data. The index is
+global, so a doctor holding a small share of the rows gets a proportionally wider
+probe, and when too few candidates survive the owner filter the search falls back
+to exact over that doctor's rows.
+
+`save()` writes the matrix as a raw file that `open()` memory-maps read-only: worker
+processes share the page cache and start without reading the file.
+"""
+from typing import Optional, Sequence, Union
+import json, os, time
+
+import numpy as np
+
+from app.config import settings
+
+try:
+    import hnswlib
+except ImportError:  # optional; "hnsw" falls back to IVF
+    hnswlib = None
+
+_CHUNK = 65536  # rows per block when assigning/scanning large matrices
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = np.ascontiguousarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    # Indices of the k best per row, best first: O(n) selection, then sort only k
+    if k < scores.shape[1]:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+class _Vocab:
+    """Interns doctor/patient ids to int32 codes so filters are vectorized comparisons."""
+
+    def __init__(self, values: Sequence[str] = ()):
+        self.values = list(values)
+        self.codes = {v: i for i, v in enumerate(self.values)}
+
+    def code(self, value: str) -> int:
+        c = self.codes.get(value)
+        if c is None:
+            c = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return c
+
+    def get(self, value: Optional[str]) -> int:
+        return -1 if value is None else self.codes.get(value, -2)
+
+class IVFIndex:
+    """Spherical k-means coarse quantizer; a query only scans its `nprobe` nearest lists."""
+    kind = "ivf"
+
+    def __init__(self, nlist: int, nprobe: int = 16, iters: int = 10, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iters = iters
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self._order = self._offsets = None
+
+    def _assign(self, vecs: np.ndarray) -> np.ndarray:
+        out = np.empty(len(vecs), dtype=np.int32)
+        for s in range(0, len(vecs), _CHUNK):
+            out[s:s + _CHUNK] = np.argmax(vecs[s:s + _CHUNK] @ self.centroids.T, axis=1)
+        return out
+
+    def build(self, vecs: np.ndarray):
+        rnd = np.random.default_rng(self.seed)
+        sample = vecs[rnd.choice(len(vecs), min(len(vecs), self.nlist * 64), replace=False)]
+        self.centroids = sample[rnd.choice(len(sample), self.nlist, replace=False)].copy()
+        for _ in range(self.iters):
+            assign = np.argmax(sample @ self.centroids.T, axis=1)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assign, sample)
+            empty = np.bincount(assign, minlength=self.nlist) == 0
+            sums[empty] = sample[rnd.choice(len(sample), int(empty.sum()))]
+            self.centroids = _normalize(sums)
+        self._set_lists(self._assign(vecs))
+
+    def _set_lists(self, assign: np.ndarray):
+        self._order = np.argsort(assign, kind="stable").astype(np.int64)
+        self._offsets = np.searchsorted(assign[self._order], np.arange(self.nlist + 1))
+
+    def candidates(self, q: np.ndarray, k: int, share: float = 1.0) -> np.ndarray:
+        """Rows of the lists nearest to `q`; `share` (the caller's fraction of rows) widens the probe."""
+        nprobe = min(self.nlist, int(np.ceil(self.nprobe / max(share, 1e-9))))
+        probes = np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe]
+        return np.concatenate([self._order[self._offsets[p]:self._offsets[p + 1]] for p in probes])
+
+    def state(self) -> dict:
+        return {"ivf_centroids": self.centroids, "ivf_order": self._order, "ivf_offsets": self._offsets}
+
+    def load(self, state: dict):
+        self.centroids, self._order, self._offsets = state["ivf_centroids"], state["ivf_order"], state["ivf_offsets"]
+        self.nlist = len(self.centroids)
+
+class HNSWIndex:
+    """hnswlib graph; filtered searches over-fetch, then the store drops foreign rows."""
+    kind = "hnsw"
+
+    def __init__(self, dim: int, m: int = 16, ef_construction: int = 200, ef: int = 128):
+        self.dim, self.m, self.ef_construction, self.ef = dim, m, ef_construction, ef
+        self._index = None
+
+    def build(self, vecs: np.ndarray):
+        self._index = hnswlib.Index(space="ip", dim=self.dim)
+        self._index.init_index(max_elements=len(vecs), M=self.m, ef_construction=self.ef_construction)
+        self._index.add_items(vecs, np.arange(len(vecs)))
+        self._index.set_ef(self.ef)
+
+    def candidates(self, q: np.ndarray, k: int, share: float = 1.0) -> np.ndarray:
+        n = min(self._index.get_current_count(), int(np.ceil(max(self.ef, k * 8) / max(share, 1e-9))))
+        self._index.set_ef(max(self.ef, n))
+        labels, _ = self._index.knn_query(q, k=n)
+        return labels[0].astype(np.int64)
+
+    def save(self, path: str):
+        self._index.save_index(path)
+
+    def load(self, path: str, count: int):
+        self._index = hnswlib.Index(space="ip", dim=self.dim)
+        self._index.load_index(path, max_elements=count)
+        self._index.set_ef(self.ef)
+
+Query = Union[np.ndarray, Sequence[float]]
+Hit = tuple[str, float]
+
+class VectorStore:
+    def __init__(
+        self,
+        dim: int,
+        capacity: int = 1024,
+        index: str = "flat",
+        ann_min_rows: int = 50_000,
+        nprobe: int = 16,
+    ):
+        if index not in ("flat", "ivf", "hnsw"):
+            raise ValueError(f"Unknown vector index {index!r}")
+        self.dim = dim
+        self.index_kind = "ivf" if index == "hnsw" and hnswlib is None else index
+        self.ann_min_rows = ann_min_rows
+        self.nprobe = nprobe
+        self._vecs = np.empty((capacity, dim), dtype=np.float32)
+        self._doctor = np.empty(capacity, dtype=np.int32)
+        self._patient = np.empty(capacity, dtype=np.int32)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._n = 0
+        self._ids: Union[list[str], np.ndarray] = []  # ndarray straight after open()
+        self._row_of_map: Optional[dict[str, int]] = {}
+        self.doctors, self.patients = _Vocab(), _Vocab()
+        self._doctor_rows: dict[int, np.ndarray] = {}  # cached alive rows per doctor code
+        self._ann: Union[IVFIndex, HNSWIndex, None] = None
+        self._indexed = 0  # rows [0, _indexed) are covered by _ann; later rows are scanned exactly
+        self.path: Optional[str] = None
+        self.loaded_at = 0.0
+
+    @property
+    def _row_of(self) -> dict[str, int]:
+        # id -> row is only needed to write; a freshly opened (read-only) store never builds it
+        if self._row_of_map is None:
+            self._ids = [str(i) for i in self._ids]
+            self._row_of_map = {id_: i for i, id_ in enumerate(self._ids) if self._alive[i]}
+        return self._row_of_map
+
+    def __len__(self) -> int:
+        return int(self._alive[: self._n].sum())
+
+    def _reserve(self, extra: int):
+        need = self._n + extra
+        if need <= len(self._alive) and self._vecs.flags.writeable:
+            return
+        cap = max(need, len(self._alive) * 2, 1024)
+        # Also the copy-on-first-write path for a store opened from a read-only memmap
+        vecs = np.empty((cap, self.dim), dtype=np.float32)
+        vecs[: self._n] = self._vecs[: self._n]
+        self._vecs = vecs
+        for name in ("_doctor", "_patient", "_alive"):
+            old = getattr(self, name)
+            new = np.zeros(cap, dtype=old.dtype)
+            new[: self._n] = old[: self._n]
+            setattr(self, name, new)
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray, doctor_id: str, patient_id: Optional[str] = None):
+        """Insert or replace rows. All rows in one call share an owner (one document's chunks)."""
+        vectors = _normalize(np.atleast_2d(vectors))
+        if vectors.shape != (len(ids), self.dim):
+            raise ValueError(f"Expected {len(ids)} vectors of dim {self.dim}, got {vectors.shape}")
+        self._reserve(len(ids))
+        dcode = self.doctors.code(doctor_id)
+        pcode = self.patients.code(patient_id) if patient_id is not None else -1
+        rows = np.empty(len(ids), dtype=np.int64)
+        row_of = self._row_of
+        for i, id_ in enumerate(ids):
+            row = row_of.get(id_)
+            if row is None:
+                row = row_of[id_] = self._n
+                self._ids.append(id_)
+                self._n += 1
+            else:
+                self._doctor_rows.pop(int(self._doctor[row]), None)
+            rows[i] = row
+        self._vecs[rows] = vectors
+        self._doctor[rows] = dcode
+        self._patient[rows] = pcode
+        self._alive[rows] = True
+        self._doctor_rows.pop(dcode, None)
+
+    def remove(self, ids: Sequence[str]) -> int:
+        removed = 0
+        for id_ in ids:
+            row = self._row_of.pop(id_, None)
+            if row is not None and self._alive[row]:
+                self._alive[row] = False
+                self._doctor_rows.pop(int(self._doctor[row]), None)
+                removed += 1
+        return removed
+
+    def ids(self) -> list[str]:
+        """Ids of the live rows."""
+        return [str(self._ids[r]) for r in np.flatnonzero(self._alive[: self._n]).tolist()]
+
+    def _rows(self, dcode: int) -> np.ndarray:
+        rows = self._doctor_rows.get(dcode)
+        if rows is None:
+            rows = self._doctor_rows[dcode] = np.flatnonzero(
+                (self._doctor[: self._n] == dcode) & self._alive[: self._n]
+            )
+        return rows
+
+    def build_index(self):
+        """(Re)build the ANN index over all current rows; call after bulk loads."""
+        if self.index_kind == "flat" or self._n == 0:
+            return
+        vecs = self._vecs[: self._n]
+        if self.index_kind == "hnsw":
+            ann = HNSWIndex(self.dim)
+        else:
+            ann = IVFIndex(nlist=max(1, int(np.sqrt(self._n))), nprobe=self.nprobe)
+        ann.build(vecs)
+        self._ann, self._indexed = ann, self._n
+
+    def search(
+        self,
+        query: Query,
+        doctor_id: str,
+        k: int = 10,
+        patient_id: Optional[str] = None,
+        exact: bool = False,
+    ) -> Union[list[Hit], list[list[Hit]]]:
+        """
+        Top-k (id, cosine) among `doctor_id`'s rows (and `patient_id`'s, if given).
+        A 2-D query returns one list per row; exact searches score the batch in one product.
+        """
+        q = _normalize(np.atleast_2d(np.asarray(query, dtype=np.float32)))
+        single = np.ndim(query) == 1
+        dcode, pcode = self.doctors.get(doctor_id), self.patients.get(patient_id)
+        if dcode < 0 or pcode == -2:
+            return [] if single else [[] for _ in q]
+        rows = self._rows(dcode)
+        if patient_id is not None:
+            rows = rows[self._patient[rows] == pcode]
+
+        if exact or self._ann is None or len(rows) < self.ann_min_rows:
+            results = self._exact(q, rows, k)
+        else:
+            results = [self._approx(qi, rows, dcode, pcode if patient_id is not None else None, k) for qi in q]
+        return results[0] if single else results
+
+    def _hits(self, rows: np.ndarray, scores: np.ndarray) -> list[Hit]:
+        ids = self._ids
+        return [(str(ids[r]), float(s)) for r, s in zip(rows.tolist(), scores.tolist())]
+
+    def _exact(self, q: np.ndarray, rows: np.ndarray, k: int) -> list[list[Hit]]:
+        if len(rows) == 0:
+            return [[] for _ in q]
+        k = min(k, len(rows))
+        if len(rows) == self._n:
+            scores = q @ self._vecs[: self._n].T  # every row: no gather copy
+        else:
+            scores = q @ self._vecs[rows].T
+        top = _top_k(scores, k)
+        return [self._hits(rows[t], scores[i, t]) for i, t in enumerate(top)]
+
+    def _approx(self, q: np.ndarray, rows: np.ndarray, dcode: int, pcode: Optional[int], k: int) -> list[Hit]:
+        cand = self._ann.candidates(q, k, len(rows) / max(1, self._indexed))
+        tail = np.arange(self._indexed, self._n)
+        cand = np.concatenate([cand[cand < self._indexed], tail]) if len(tail) else cand
+        keep = self._alive[cand] & (self._doctor[cand] == dcode)
+        if pcode is not None:
+            keep &= self._patient[cand] == pcode
+        cand = cand[keep]
+        if len(cand) < min(len(rows), k * 8):
+            return self._exact(q[None, :], rows, k)[0]  # the filter left too little to rank
+        if len(cand) == 0:
+            return []
+        scores = self._vecs[cand] @ q  # re-score exactly against current vectors
+        top = _top_k(scores[None, :], min(k, len(cand)))[0]
+        return self._hits(cand[top], scores[top])
+
+    # Persistence: <path>/vectors.f32 (raw rows, memory-mapped on open), meta.npz, header.json.
+    # Files are replaced atomically; processes that mapped the old file keep a valid view.
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        n = self._n
+
+        def replace(name: str, write):
+            tmp = os.path.join(path, f".{name}.tmp")
+            write(tmp)
+            os.replace(tmp, os.path.join(path, name))
+
+        def write_npz(tmp: str):
+            arrays = {
+                "ids": np.array(self._ids, dtype=str), "doctor": self._doctor[:n],
+                "patient": self._patient[:n], "alive": self._alive[:n],
+            }
+            if isinstance(self._ann, IVFIndex):
+                arrays.update(self._ann.state())
+            with open(tmp, "wb") as f:
+                np.savez(f, **arrays)
+
+        def write_header(tmp: str):
+            with open(tmp, "w") as f:
+                json.dump({
+                    "dim": self.dim, "count": n, "indexed": self._indexed,
+                    "index": self._ann.kind if self._ann is not None else "flat",
+                    "doctors": self.doctors.values, "patients": self.patients.values,
+                }, f)
+
+        replace("vectors.f32", self._vecs[:n].tofile)
+        replace("meta.npz", write_npz)
+        if isinstance(self._ann, HNSWIndex):
+            replace("hnsw.bin", self._ann.save)
+        replace("header.json", write_header)  # last: readers only see complete sets
+        self.path, self.loaded_at = path, time.time()
+
+    @classmethod
+    def open(cls, path: str, mmap: bool = True, **kwargs) -> "VectorStore":
+        with open(os.path.join(path, "header.json")) as f:
+            header = json.load(f)
+        n, dim = header["count"], header["dim"]
+        kwargs.setdefault("index", header["index"])
+        store = cls(dim, capacity=0, **kwargs)
+        vec_path = os.path.join(path, "vectors.f32")
+        if mmap and n:
+            store._vecs = np.memmap(vec_path, dtype=np.float32, mode="r", shape=(n, dim))
+        else:
+            store._vecs = np.fromfile(vec_path, dtype=np.float32, count=n * dim).reshape(n, dim)
+        with np.load(os.path.join(path, "meta.npz")) as meta:
+            store._ids = meta["ids"]
+            store._doctor, store._patient, store._alive = meta["doctor"], meta["patient"], meta["alive"].copy()
+            if header["index"] == "ivf" and "ivf_centroids" in meta:
+                store._ann = IVFIndex(nlist=1, nprobe=store.nprobe)
+                store._ann.load({k: meta[k] for k in ("ivf_centroids", "ivf_order", "ivf_offsets")})
+        if header["index"] == "hnsw" and hnswlib is not None:
+            store._ann = HNSWIndex(dim)
+            store._ann.load(os.path.join(path, "hnsw.bin"), header["indexed"])
+        store._indexed = header["indexed"] if store._ann is not None else 0
+        store._n = n
+        store._row_of_map = None
+        store.doctors, store.patients = _Vocab(header["doctors"]), _Vocab(header["patients"])
+        store.path, store.loaded_at = path, time.time()
+        return store
+
+    def stats(self) -> dict:
+        return {
+            "rows": len(self), "dim": self.dim, "doctors": len(self.doctors.values),
+            "index": self._ann.kind if self._ann is not None else "flat",
+            "unindexed": self._n - self._indexed if self._ann is not None else 0,
+            "mmap": isinstance(self._vecs, np.memmap),
+        }
+
+_STORE: Optional[VectorStore] = None
+
+def _header_mtime(path: str) -> float:
+    try:
+        return os.stat(os.path.join(path, "header.json")).st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+def _load() -> VectorStore:
+    path = settings.VECTOR_STORE_PATH
+    opts = dict(index=settings.VECTOR_INDEX, ann_min_rows=settings.VECTOR_ANN_MIN_ROWS, nprobe=settings.VECTOR_IVF_NPROBE)
+    if _header_mtime(path):
+        return VectorStore.open(path, **opts)
+    store = VectorStore(settings.VECTOR_DIM, **opts)
+    store.path = path
+    return store
+
+def get_vector_store() -> VectorStore:
+    """Process-wide store; re-opened when another process (e.g. a backfill) saved a newer one."""
+    global _STORE
+    if _STORE is None:
+        _STORE = _load()
+    elif time.time() - _STORE.loaded_at > settings.VECTOR_RELOAD_S:
+        if _header_mtime(_STORE.path) > _STORE.loaded_at:
+            _STORE = _load()
+        else:
+            _STORE.loaded_at = time.time()
+    return _STORE
+
 async def initialize_vector_store():
-    # Prepare vector DB client/collections; keep async signature
-    return
+    # Maps the saved matrix (no read) so the first retrieval doesn't pay for it
+    get_vector_store()
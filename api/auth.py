@@ -3,7 +3,8 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
 from uuid import UUID, uuid5, NAMESPACE_URL
-from app.core.security import create_access_token, hash_password, verify_password
+from app.core.security import create_access_token, hash_password, verify_password, revoke_token
+from app.deps.auth import oauth2_scheme
 # from app.models import User  # TODO: integrate your ORM model
 
 router = APIRouter()
@@ -31,6 +32,14 @@ async def login(form: OAuth2PasswordRequestForm = Depends()):
     token = create_access_token({"sub": user_id, "email": f"{form.username}@example.local", "role": "doctor"})
     return TokenResponse(access_token=token)
 
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT, tags=["auth"])
+async def logout(token: str = Depends(oauth2_scheme)):
+    """Revoke the presented token on every worker (cached verifications included)."""
+    try:
+        await revoke_token(token)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
 @router.get("/me")
 async def me(token: TokenResponse = Depends()):
     return {"status": "ok"}  # placeholder; you'll likely return CurrentUser
@@ -1,7 +1,154 @@
-from fastapi import APIRouter
+# app/api/calendar.py
+from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import date, datetime, timedelta
+from uuid import UUID
+from app.config import settings
+from app.core.exceptions import APIException
+from app.deps.auth import audited, get_current_user, CurrentUser
+from app.services.calendar_index import (
+    book, calendar_index, cancel, cancel_series, create_series, from_minute, skip_occurrence, to_minute,
+)
 
 router = APIRouter()
 
+# Times are clinic wall-clock (appointments.appointment_datetime is TIMESTAMP without time zone);
+# an offset on the way in is dropped, not converted.
+
+class AppointmentCreate(BaseModel):
+    title: str = Field(..., max_length=255)
+    start: datetime
+    duration_minutes: int = Field(30, ge=5, le=720)
+    patient_id: Optional[UUID] = None
+    description: Optional[str] = None
+    appointment_type: Optional[str] = Field(None, max_length=50)  # consultation | follow_up | procedure
+    location: Optional[str] = Field(None, max_length=255)
+    is_virtual: bool = False
+
+class SeriesCreate(BaseModel):
+    title: str = Field(..., max_length=255)
+    start: datetime                          # the first occurrence
+    duration_minutes: int = Field(30, ge=5, le=720)
+    every_days: int = Field(7, ge=1, le=365)
+    occurrences: Optional[int] = Field(None, ge=1, le=1000)
+    until: Optional[date] = None             # neither: open-ended
+    patient_id: Optional[UUID] = None
+    appointment_type: Optional[str] = Field(None, max_length=50)
+
+class Appointment(BaseModel):
+    id: str
+    appointment_datetime: datetime
+    end: datetime
+    duration_minutes: Optional[int] = None
+    status: Optional[str] = None
+
+class AppointmentSeries(BaseModel):
+    id: str
+    first_datetime: datetime
+    end: datetime                            # of the first occurrence
+    duration_minutes: Optional[int] = None
+    every_days: int
+    occurrences: Optional[int] = None
+    until_date: Optional[date] = None
+    skip_dates: Optional[List[date]] = None
+    status: Optional[str] = None
+
+class Slot(BaseModel):
+    start: datetime
+    end: datetime
+
+class SlotList(BaseModel):
+    slots: List[Slot]
+
+class Availability(BaseModel):
+    available: bool
+    conflicts: List[str]                     # appointment ids; "<series id>:<date>" for series occurrences
+
+def _wall(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=None)
+
+@router.post(
+    "/appointments", response_model=Appointment, status_code=201,
+    dependencies=[Depends(audited("create_appointment", "appointment"))],
+)
+async def create_appointment(body: AppointmentCreate, user: CurrentUser = Depends(get_current_user)):
+    """Book one appointment; 409 if it overlaps an existing one or a series occurrence."""
+    return await book(user.id, {
+        "title": body.title, "start": _wall(body.start), "duration": body.duration_minutes,
+        "patient_id": str(body.patient_id) if body.patient_id else None, "description": body.description,
+        "appointment_type": body.appointment_type, "location": body.location, "is_virtual": body.is_virtual,
+    })
+
+@router.delete(
+    "/appointments/{appointment_id}", response_model=Appointment,
+    dependencies=[Depends(audited("cancel_appointment", "appointment", "appointment_id"))],
+)
+async def cancel_appointment(appointment_id: UUID, user: CurrentUser = Depends(get_current_user)):
+    """Marks the appointment cancelled (the row stays); its time is free again."""
+    return await cancel(user.id, str(appointment_id))
+
+@router.post(
+    "/appointment-series", response_model=AppointmentSeries, status_code=201,
+    dependencies=[Depends(audited("create_appointment", "appointment_series"))],
+)
+async def create_appointment_series(body: SeriesCreate, user: CurrentUser = Depends(get_current_user)):
+    """
+    One row for the whole series; occurrences are computed when a day is looked at.
+    409 if an occurrence in the next CALENDAR_SEARCH_DAYS overlaps something.
+    """
+    return await create_series(user.id, {
+        "title": body.title, "start": _wall(body.start), "duration": body.duration_minutes,
+        "every_days": body.every_days, "occurrences": body.occurrences, "until": body.until,
+        "patient_id": str(body.patient_id) if body.patient_id else None, "appointment_type": body.appointment_type,
+    })
+
+@router.delete(
+    "/appointment-series/{series_id}", response_model=AppointmentSeries,
+    dependencies=[Depends(audited("cancel_appointment", "appointment_series", "series_id"))],
+)
+async def cancel_appointment_series(series_id: UUID, user: CurrentUser = Depends(get_current_user)):
+    return await cancel_series(user.id, str(series_id))
+
+@router.delete(
+    "/appointment-series/{series_id}/occurrences/{day}", response_model=AppointmentSeries,
+    dependencies=[Depends(audited("cancel_appointment", "appointment_series", "series_id"))],
+)
+async def skip_series_occurrence(series_id: UUID, day: date, user: CurrentUser = Depends(get_current_user)):
+    """Drop one occurrence; to move it, book the new time as its own appointment afterwards."""
+    return await skip_occurrence(user.id, str(series_id), day)
+
+@router.get("/availability/next", response_model=SlotList)
+async def next_free_slots(
+    duration_minutes: int = Query(30, ge=5, le=720),
+    after: Optional[datetime] = None,
+    count: int = Query(5, ge=1, le=50),
+    user: CurrentUser = Depends(get_current_user),
+):
+    """The earliest free slots from `after` (default: now) within CALENDAR_SEARCH_DAYS, non-overlapping."""
+    now = datetime.now()
+    if after and _wall(after) > now + timedelta(days=settings.CALENDAR_SEARCH_DAYS):
+        raise APIException(f"`after` must be within {settings.CALENDAR_SEARCH_DAYS} days", status_code=422)
+    cal = await calendar_index.get(user.id)
+    start = to_minute(_wall(after) if after else now)
+    found = cal.slots(start, duration_minutes, count, settings.CALENDAR_SEARCH_DAYS)
+    return {"slots": [
+        {"start": from_minute(s), "end": from_minute(s) + timedelta(minutes=duration_minutes)} for s in found
+    ]}
+
+@router.get("/availability/check", response_model=Availability)
+async def check_availability(
+    start: datetime,
+    duration_minutes: int = Query(30, ge=5, le=720),
+    ignore: Optional[UUID] = None,
+    user: CurrentUser = Depends(get_current_user),
+):
+    """Whether [start, start + duration) is clear; `ignore` leaves one appointment out (rescheduling it)."""
+    cal = await calendar_index.get(user.id)
+    s = to_minute(_wall(start))
+    clash = cal.conflicts(s, s + duration_minutes, str(ignore) if ignore else None)
+    return {"available": not clash, "conflicts": clash}
+
 @router.get("/ping")
 async def ping():
     return {"calendar": "ok"}
@@ -1,7 +1,112 @@
-from fastapi import APIRouter
+# app/api/chat.py
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import Any, List, Optional
+from datetime import datetime
+from uuid import UUID
+from app.core.pagination import keyset_page, keyset_sql, ndjson_rows, stringify_ids
+from app.deps.auth import audited, get_current_user, get_db_session, CurrentUser
 
 router = APIRouter()
 
+# Heavy free text (present_illness, ai_summary, exam/plan JSON) stays out of list views
+SESSION_COLUMNS = (
+    "SELECT id, patient_id, session_type, session_status, appointment_datetime, duration_minutes, "
+    "chief_complaint, has_voice_recording, created_at, updated_at FROM medical_sessions"
+)
+# content_encrypted is never fetched; chat_messages rows are visible only for the doctor's own sessions (RLS)
+MESSAGE_COLUMNS = (
+    "SELECT id, parent_message_id, message_type, content, ai_model, tokens_used, "
+    "contains_pii, anonymized, created_at FROM chat_messages"
+)
+
+class SessionSummary(BaseModel):
+    id: str
+    patient_id: Optional[str] = None
+    session_type: Optional[str] = None
+    session_status: Optional[str] = None
+    appointment_datetime: Optional[datetime] = None
+    duration_minutes: Optional[int] = None
+    chief_complaint: Optional[str] = None
+    has_voice_recording: Optional[bool] = False
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+class SessionPage(BaseModel):
+    items: List[SessionSummary]
+    next_cursor: Optional[str] = None
+
+class MessageSummary(BaseModel):
+    id: str
+    parent_message_id: Optional[str] = None
+    message_type: str
+    content: str
+    ai_model: Optional[str] = None
+    tokens_used: Optional[int] = None
+    contains_pii: Optional[bool] = False
+    anonymized: Optional[bool] = False
+    created_at: datetime
+
+class MessagePage(BaseModel):
+    items: List[MessageSummary]
+    next_cursor: Optional[str] = None
+
+def _session_filter(user_id: str, patient_id: Optional[UUID]) -> tuple[str, dict]:
+    where, params = "doctor_id = CAST(:uid AS uuid)", {"uid": user_id}
+    if patient_id is not None:
+        where += " AND patient_id = CAST(:pid AS uuid)"
+        params["pid"] = str(patient_id)
+    return where, params
+
+@router.get(
+    "/sessions",
+    response_model=SessionPage,
+    dependencies=[Depends(audited("list_sessions", "session"))],
+)
+async def list_sessions(
+    patient_id: Optional[UUID] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    user: CurrentUser = Depends(get_current_user),
+    session = Depends(get_db_session),
+):
+    """The current doctor's sessions, newest first, optionally for one patient."""
+    where, params = _session_filter(user.id, patient_id)
+    page = await keyset_page(session, SESSION_COLUMNS, where, params, cursor, limit)
+    return stringify_ids(page, "id", "patient_id")
+
+@router.get(
+    "/sessions/{session_id}/messages",
+    response_model=MessagePage,
+    dependencies=[Depends(audited("view_session", "session", "session_id"))],
+)
+async def list_messages(
+    session_id: UUID,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    user: CurrentUser = Depends(get_current_user),
+    session = Depends(get_db_session),
+):
+    """Newest first; an unknown or foreign session yields an empty page."""
+    page = await keyset_page(
+        session, MESSAGE_COLUMNS, "session_id = CAST(:sid AS uuid)", {"sid": str(session_id)}, cursor, limit
+    )
+    return stringify_ids(page, "id", "parent_message_id")
+
+@router.get(
+    "/sessions/{session_id}/messages/export",
+    dependencies=[Depends(audited("export_data", "session", "session_id"))],
+)
+async def export_messages(session_id: UUID, user: CurrentUser = Depends(get_current_user)):
+    """Every message of the session as NDJSON, streamed newest first."""
+    sql = keyset_sql(MESSAGE_COLUMNS, "session_id = CAST(:sid AS uuid)", after_cursor=False)
+    return StreamingResponse(
+        ndjson_rows(sql, {"sid": str(session_id)}, user.id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="session-{session_id}.ndjson"'},
+    )
+
 @router.get("/ping")
 async def ping():
     return {"chat": "ok"}
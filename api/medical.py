@@ -1,9 +1,18 @@
 # app/api/medical.py
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+from uuid import UUID
+from dataclasses import asdict
+from fastapi.responses import StreamingResponse
+import json
+from app.config import settings
+from app.core.uploads import AUDIO_TYPES, read_upload
 from app.deps.auth import get_current_user, get_db_session, CurrentUser
 from app.services.stt_service import transcribe_bytes
+from app.services.soap_extractor import DEFAULT_EXTRACTOR
+from app.services.note_stream import note_slots, stream_note
+from app.services.dicom_ingest import ingest_study
 
 router = APIRouter()
 
@@ -16,38 +25,60 @@ class NoteRequest(BaseModel):
     transcript: str
     language: Optional[str] = "en"
 
+class IngestedImage(BaseModel):
+    id: str
+    file_path: str
+    preview_path: Optional[str] = None
+    modality: Optional[str] = None
+    instance_number: Optional[int] = None
+
+class StudyIngestResponse(BaseModel):
+    studies: List[str]            # de-identified StudyInstanceUIDs
+    series: int
+    ingested: int
+    rejected: List[dict] = []     # {"filename", "error"} per slice that was not stored
+    images: List[IngestedImage]
+
 class NoteDraft(BaseModel):
     soap: dict
+    entities: List[dict] = []  # matched lexicon terms: text, category, section, start/end offsets, line, value
 
-@router.post("/stt", response_model=STTResponse)
-async def stt_endpoint(
-    audio: UploadFile = File(..., description="audio/webm|wav|m4a"),
-    language: Optional[str] = Form(None),
-    user: CurrentUser = Depends(get_current_user),
-):
+# The body is parsed by core.uploads, not by FastAPI: describe the form for the docs
+_STT_FORM = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object",
+    "required": ["audio"],
+    "properties": {
+        "audio": {"type": "string", "format": "binary", "description": "audio/webm|wav|ogg|m4a|flac|mp3"},
+        "language": {"type": "string"},
+    },
+}}}}}
+
+@router.post("/stt", response_model=STTResponse, openapi_extra=_STT_FORM)
+async def stt_endpoint(request: Request, user: CurrentUser = Depends(get_current_user)):
     """
     Transcribe audio → text (Whisper-style via HF pipeline).
     Requires Bearer token; current_user enforced for RLS elsewhere.
+    The upload is streamed: 413 past STT_MAX_UPLOAD_MB, 415 if it is not audio.
     """
-    data = await audio.read()
-    if not data:
-        raise HTTPException(400, "Empty audio")
-    text = await transcribe_bytes(data, language)
+    upload, fields = await read_upload(request, "audio", settings.STT_MAX_UPLOAD_MB << 20, AUDIO_TYPES)
+    with upload:
+        if not upload.size:
+            raise HTTPException(400, "Empty audio")
+        language = fields.get("language") or None
+        text = await transcribe_bytes(upload.view(), language, digest=upload.digest)
     return STTResponse(model="transformers:asr", transcript=text, language=language)
 
-def _naive_soap(transcript: str, lang: str) -> dict:
-    # Minimal rules-based SOAP scaffold. Replace with LLM later.
-    lines = [ln.strip("-•: ").strip() for ln in transcript.splitlines() if ln.strip()]
-    subj = [ln for ln in lines if any(k in ln.lower() for k in ["pain", "douleur", "mal", "symptom", "symptôme"])]
-    obj  = [ln for ln in lines if any(k in ln.lower() for k in ["bp", "hr", "temp", "tension", "examen"])]
-    assess = ["Differential Dx (draft): …"]
-    plan = ["Tests: …", "Rx: …", "Follow-up: …"]
-    return {
-        "subjective": subj or lines[:3],
-        "objective": obj or lines[3:6],
-        "assessment": assess,
-        "plan": plan,
-    }
+def _soap_note(transcript: str, lang: str) -> tuple[dict, list[dict]]:
+    # Lexicon-driven SOAP scaffold (EN/FR, both handled by one automaton). Replace with LLM later.
+    result = DEFAULT_EXTRACTOR.extract(transcript)
+    sections = result.sections
+    if not (sections["subjective"] and sections["objective"]):
+        lines = [ln.strip("-•: ").strip() for ln in transcript.splitlines() if ln.strip()]
+        sections["subjective"] = sections["subjective"] or lines[:3]
+        sections["objective"] = sections["objective"] or lines[3:6]
+    sections["assessment"] = sections["assessment"] or ["Differential Dx (draft): …"]
+    sections["plan"] = sections["plan"] or ["Tests: …", "Rx: …", "Follow-up: …"]
+    return sections, [asdict(e) for e in result.entities]
 
 @router.post("/note-from-transcript", response_model=NoteDraft)
 async def note_from_transcript(
@@ -59,8 +90,60 @@ async def note_from_transcript(
     Build a draft SOAP note from transcript.
     *Intentionally deterministic & simple for MVP; swap with LLM later.*
     """
-    soap = _naive_soap(body.transcript, body.language or "en")
-    return NoteDraft(soap=soap)
+    soap, entities = _soap_note(body.transcript, body.language or "en")
+    return NoteDraft(soap=soap, entities=entities)
+
+class _SlotResponse(StreamingResponse):
+    # The slot goes back however the response ends, even if its body never started
+    def __init__(self, content, slot, **kwargs):
+        super().__init__(content, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send):
+        with self.slot:
+            await super().__call__(scope, receive, send)
+
+@router.post("/note-from-transcript/stream")
+async def note_from_transcript_stream(body: NoteRequest, user: CurrentUser = Depends(get_current_user)):
+    """
+    Same draft as /note-from-transcript, written by the LLM backend and streamed as
+    Server-Sent Events (`event: section|delta|section_done|done|error`) so sections
+    appear as they are generated. Disconnecting cancels the generation.
+    429 when the user already has LLM_MAX_STREAMS_PER_USER drafts running.
+    """
+    slot = note_slots.acquire(user.id)
+    events = stream_note(body.transcript, body.language or "en", slot=slot)
+
+    async def sse():
+        try:
+            async for ev in events:
+                yield f"event: {ev['type']}\ndata: {json.dumps(ev, ensure_ascii=False)}\n\n"
+        except Exception:
+            yield 'event: error\ndata: {"type": "error", "detail": "Note generation failed"}\n\n'
+        finally:
+            await events.aclose()
+
+    return _SlotResponse(
+        sse(), slot, media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/imaging/studies", response_model=StudyIngestResponse)
+async def ingest_imaging_study(
+    request: Request,
+    patient_id: UUID,
+    session_id: Optional[UUID] = None,
+    user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Upload a study as multipart/form-data, one DICOM file per part (any field name).
+    Parts are streamed to disk as they arrive and de-identified in a process pool;
+    only the PHI-stripped copies and their previews are stored.
+    """
+    return await ingest_study(
+        request.stream(), request.headers.get("content-type", ""), user.id,
+        str(patient_id), str(session_id) if session_id else None,
+    )
 
 @router.get("/ping")
 async def ping():
@@ -1,7 +1,96 @@
-from fastapi import APIRouter
+# app/api/patients.py
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import Any, List, Optional
+from datetime import datetime
+from uuid import UUID
+from app.core.pagination import keyset_page, keyset_sql, ndjson_rows, stringify_ids
+from app.deps.auth import audited, get_current_user, get_db_session, CurrentUser
+from app.services.lab_trends import lab_trends
 
 router = APIRouter()
 
+# List/export projection: no *_encrypted columns (names, DOB, contact details stay in the DB)
+PATIENT_COLUMNS = (
+    "SELECT id, patient_external_id, gender, blood_type, allergies, chronic_conditions, "
+    "current_medications, anonymized, created_at, updated_at, last_accessed FROM patients"
+)
+
+class PatientSummary(BaseModel):
+    id: str
+    patient_external_id: Optional[str] = None
+    gender: Optional[str] = None
+    blood_type: Optional[str] = None
+    allergies: Any = []
+    chronic_conditions: Any = []
+    current_medications: Any = []
+    anonymized: Optional[bool] = False
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    last_accessed: Optional[datetime] = None
+
+class PatientPage(BaseModel):
+    items: List[PatientSummary]
+    next_cursor: Optional[str] = None
+
+class AnalyteTrend(BaseModel):
+    analyte: str
+    unit: Optional[str] = None
+    count: int
+    latest: Optional[float] = None
+    latest_date: str
+    reference_low: Optional[float] = None
+    reference_high: Optional[float] = None
+    status: str                   # normal | low | high | critical_low | critical_high | unknown (no range)
+    delta: Optional[float] = None  # vs the previous result
+    rate_per_day: Optional[float] = None
+    slope_per_year: Optional[float] = None
+    trend: str                    # rising | stable | falling
+    run: int                      # consecutive moves in the latest direction
+    alerts: List[str] = []        # critical | delta | worsening | approaching_critical
+    series: Optional[dict] = None  # {"dates", "values", "flags"} with ?series=true
+
+class LabTrendReport(BaseModel):
+    analytes: List[AnalyteTrend]
+    alerts: List[dict]
+    observations: int
+
+@router.get("", response_model=PatientPage, dependencies=[Depends(audited("list_patients", "patient"))])
+async def list_patients(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    user: CurrentUser = Depends(get_current_user),
+    session = Depends(get_db_session),
+):
+    """Newest first. Pass `next_cursor` back as `cursor` for the following page."""
+    page = await keyset_page(session, PATIENT_COLUMNS, "doctor_id = CAST(:uid AS uuid)", {"uid": user.id}, cursor, limit)
+    return stringify_ids(page, "id")
+
+@router.get("/export", dependencies=[Depends(audited("export_data", "patient"))])
+async def export_patients(user: CurrentUser = Depends(get_current_user)):
+    """Every patient of the current doctor as NDJSON (one object per line), streamed."""
+    sql = keyset_sql(PATIENT_COLUMNS, "doctor_id = CAST(:uid AS uuid)", after_cursor=False)
+    return StreamingResponse(
+        ndjson_rows(sql, {"uid": user.id}, user.id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="patients.ndjson"'},
+    )
+
+@router.get(
+    "/{patient_id}/labs/trends",
+    response_model=LabTrendReport,
+    dependencies=[Depends(audited("view_lab_results", "patient", "patient_id"))],
+)
+async def lab_trends_report(
+    patient_id: UUID,
+    series: bool = False,
+    user: CurrentUser = Depends(get_current_user),
+):
+    """Latest status, rate of change and trend per analyte, plus the alerts to act on."""
+    history = await lab_trends.get(user.id, str(patient_id))
+    return history.report(with_series=series)
+
 @router.get("/ping")
 async def ping():
     return {"patients": "ok"}
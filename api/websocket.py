@@ -1,14 +1,261 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from typing import Optional
+from uuid import UUID
+import asyncio, json, logging
+import numpy as np
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from sqlalchemy import text
+from app.core.security import CachedToken, is_token_revoked, token_cache
+from app.database import RLS_CONTEXT_SQL, SessionLocal
+from app.services.ws_hub import ws_hub
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+_SAMPLE_RATES = range(8000, 96001)  # accepted client PCM rates, Hz
+
+async def _authenticate(ws: WebSocket, ctl) -> Optional[CachedToken]:
+    """
+    The verified token of a start message. Otherwise closes the socket (1008 when the
+    message is malformed, 4401 for a bad or revoked token) and returns None.
+    """
+    token = ctl.get("token") if isinstance(ctl, dict) else None
+    if not isinstance(token, str):
+        await ws.close(code=status.WS_1008_POLICY_VIOLATION)
+        return None
+    try:
+        entry = token_cache.decode(token)
+    except ValueError:
+        entry = None
+    if entry is None or await is_token_revoked(entry.digest):
+        await ws.close(code=4401)
+        return None
+    return entry
+
+def _user_id(entry: CachedToken) -> str:
+    return str(entry.claims.get("sub") or entry.claims.get("user_id") or "")
 
 @router.websocket("/stream")
 async def ws_stream(ws: WebSocket):
+    """
+    Text frames are echoed. Streaming STT mode:
+      -> {"type": "start", "token": "<jwt>", "language": "fr", "sample_rate": 16000}
+      -> binary frames of mono PCM s16le
+      <- {"type": "partial"|"final", "text": ..., "start": s, "end": s}
+      -> {"type": "stop"}   (flushes the tail, then {"type": "end"})
+      <- {"type": "error", "detail": ...} if transcription fails; the socket stays open
+    Closes with 1008 on a malformed start message (including a sample_rate that is not
+    an int in 8000-96000), 4401 on a bad token.
+    """
     await ws.accept()
     await ws.send_text("connected")
+    stream = None
+    src_rate = 16000
+    pending: Optional[asyncio.Task] = None
+
+    async def emit(events: list[dict]):
+        for ev in events:
+            await ws.send_json(ev)
+
+    async def transcribe(step):
+        # a failed decode is reported to the client instead of killing the socket
+        try:
+            await emit(await step())
+        except Exception:
+            logger.exception("streaming transcription failed")
+            try:
+                await ws.send_json({"type": "error", "detail": "Transcription failed"})
+            except Exception:
+                pass  # the socket is gone; the receive loop will see it
+
+    async def run_step():
+        await transcribe(stream.step_once)
+        if stream.ready:  # audio kept arriving while we decoded
+            await run_step()
+
     try:
         while True:
-            msg = await ws.receive_text()
-            await ws.send_text(f"echo:{msg}")
+            msg = await ws.receive()
+            if msg["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(msg.get("code", 1000))
+            if msg.get("bytes") is not None:
+                if stream is None:
+                    await ws.send_json({"type": "error", "detail": "Send a start message first"})
+                    continue
+                samples = np.frombuffer(msg["bytes"][: len(msg["bytes"]) & ~1], dtype="<i2").astype(np.float32) / 32768.0
+                if src_rate != stream.rate:
+                    from app.services.audio_decode import resample
+                    samples = resample(samples, src_rate, stream.rate)
+                if stream.feed(samples) and (pending is None or pending.done()):
+                    pending = asyncio.create_task(run_step())
+                continue
+
+            text = msg.get("text") or ""
+            try:
+                ctl = json.loads(text)
+            except ValueError:
+                ctl = None
+            if not isinstance(ctl, dict) or ctl.get("type") not in ("start", "stop"):
+                await ws.send_text(f"echo:{text}")
+                continue
+
+            if ctl["type"] == "start":
+                if await _authenticate(ws, ctl) is None:
+                    return
+                rate = ctl.get("sample_rate")
+                rate = 16000 if rate is None else rate
+                if type(rate) is not int or rate not in _SAMPLE_RATES:
+                    await ws.close(code=status.WS_1008_POLICY_VIOLATION)
+                    return
+                from app.services.stt_service import sampling_rate
+                from app.services.stt_stream import StreamingTranscriber
+                src_rate = rate
+                stream = StreamingTranscriber(sampling_rate(), ctl.get("language"))
+                await ws.send_json({"type": "ready"})
+            elif stream is not None:
+                if pending is not None:
+                    await pending
+                    pending = None
+                await transcribe(stream.flush)
+                await ws.send_json({"type": "end"})
+                stream = None
     except WebSocketDisconnect:
         return
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+@router.websocket("/note")
+async def ws_note(ws: WebSocket):
+    """
+    Streaming SOAP note over a websocket (same events as the SSE endpoint):
+      -> {"type": "start", "token": "<jwt>", "transcript": "...", "language": "en"}
+      <- {"type": "section"|"delta"|"section_done"|"done", ...}
+      -> {"type": "cancel"}   (or disconnect) stops generation
+    Closes with 1008 on a malformed start message, 4401 on a bad token, 4429 when the
+    per-user cap is reached.
+    """
+    from app.services.note_stream import NoteStreamBusy, note_slots, stream_note
+
+    await ws.accept()
+    try:
+        ctl = await ws.receive_json()
+    except (ValueError, WebSocketDisconnect):
+        return
+    entry = await _authenticate(ws, ctl)
+    if entry is None:
+        return
+    uid = _user_id(entry)
+    if not uid:
+        await ws.close(code=4401)
+        return
+    try:
+        slot = note_slots.acquire(uid)
+    except NoteStreamBusy as exc:
+        await ws.send_json({"type": "error", "detail": exc.detail})
+        await ws.close(code=4429)
+        return
+
+    async def pump():
+        events = stream_note(str(ctl.get("transcript") or ""), ctl.get("language") or "en", slot=slot)
+        try:
+            async for ev in events:
+                await ws.send_json(ev)  # waits on the socket: a slow client slows token reads
+        finally:
+            await events.aclose()
+
+    async def watch():
+        # Anything but a disconnect or {"type": "cancel"} is ignored while drafting
+        while True:
+            msg = await ws.receive()
+            if msg["type"] == "websocket.disconnect":
+                return False
+            try:
+                if json.loads(msg.get("text") or "null").get("type") == "cancel":
+                    return True
+            except (ValueError, AttributeError):
+                pass
+
+    with slot:
+        gen, ctrl = asyncio.create_task(pump()), asyncio.create_task(watch())
+        try:
+            await asyncio.wait({gen, ctrl}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (gen, ctrl):
+                task.cancel()
+            await asyncio.gather(gen, ctrl, return_exceptions=True)
+    if ctrl.done() and not ctrl.cancelled() and ctrl.result() is False:
+        return  # client went away; generation already stopped
+    try:
+        if gen.done() and not gen.cancelled() and gen.exception() is not None:
+            await ws.send_json({"type": "error", "detail": "Note generation failed"})
+        elif ctrl.done() and not ctrl.cancelled():
+            await ws.send_json({"type": "cancelled"})
+        await ws.close()
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+
+async def _owned_sessions(user_id: str, session_ids: list) -> list[str]:
+    ids = []
+    for sid in session_ids:
+        try:
+            ids.append(str(UUID(str(sid))))
+        except ValueError:
+            pass
+    if not ids:
+        return []
+    async with SessionLocal() as session:
+        await session.execute(RLS_CONTEXT_SQL, {"uid": user_id})
+        rows = await session.execute(
+            text("SELECT id FROM medical_sessions WHERE doctor_id = CAST(:uid AS uuid) AND id = ANY(CAST(:ids AS uuid[]))"),
+            {"uid": user_id, "ids": ids},
+        )
+        return [str(r[0]) for r in rows]
+
+@router.websocket("/events")
+async def ws_events(ws: WebSocket):
+    """
+    Live updates for the signed-in doctor, from any worker (services.ws_hub):
+      -> {"type": "start", "token": "<jwt>", "sessions": ["<session id>", ...]}
+      <- {"type": "ready", "sessions": [...]}   (the sessions actually subscribed)
+      <- events; queued ones arrive together as {"type": "batch", "events": [...]}.
+         {"type": "dropped", "count": n} or {"type": "resync"}: some were lost, refetch
+      -> {"type": "subscribe"|"unsubscribe", "session_id": "..."}
+    Closes with 1008 on a malformed start message, 4401 on a bad token, 1013 when the
+    client cannot keep up.
+    """
+    await ws.accept()
+    try:
+        ctl = await ws.receive_json()
+    except (ValueError, WebSocketDisconnect):
+        return
+    entry = await _authenticate(ws, ctl)
+    if entry is None:
+        return
+    uid = _user_id(entry)
+    if not uid:
+        await ws.close(code=4401)
+        return
+
+    sub = await ws_hub.connect(uid, ws.send_text, lambda code: ws.close(code=code))
+    try:
+        sessions = await _owned_sessions(uid, list(ctl.get("sessions") or [])[:50])
+        for sid in sessions:
+            await ws_hub.subscribe(sub, f"session:{sid}")
+        await ws.send_json({"type": "ready", "sessions": sessions})
+        while not sub.closed:
+            msg = await ws.receive()
+            if msg["type"] == "websocket.disconnect":
+                return
+            try:
+                ctl = json.loads(msg.get("text") or "null")
+                op, sid = ctl.get("type"), str(UUID(str(ctl.get("session_id"))))
+            except (ValueError, AttributeError):
+                continue
+            if op == "subscribe" and await _owned_sessions(uid, [sid]):
+                await ws_hub.subscribe(sub, f"session:{sid}")
+            elif op == "unsubscribe":
+                await ws_hub.unsubscribe(sub, f"session:{sid}")
+    except (WebSocketDisconnect, RuntimeError):
+        return
+    finally:
+        await ws_hub.disconnect(sub)
@@ -0,0 +1,168 @@
+# benchmarks/calendar_slots.py
+"""
+"Next free slot" and conflict checks over a year of dense schedules,
+services.calendar_index vs walking the sorted appointment list:
+
+    python -m app.benchmarks.calendar_slots --doctors 20 --fill 0.97 --queries 2000
+
+Each doctor has a year of workdays booked back to back with 15-60 minute visits
+(--fill of the bookable time taken), a few weekly / fortnightly series (staff meeting,
+ward round, dialysis clinic) and about one free afternoon a month. Queries ask for
+the next 15, 30, 60 or 120 minutes from a random point in the year; the long ones
+usually have to skip weeks.
+
+  walk     what a query per check does: the doctor's rows from `after` on (series
+           expanded into rows up front), merged day by day until a gap fits
+  index    DoctorCalendar.next_free: the day's own gaps, then one descent of the
+           gap tree to the first day that fits
+
+Every answer is checked against the walk. Also timed: building a doctor's index from
+rows (what a cold read costs), a conflict check, and a booking + cancellation (a
+write updates one day and its tree path).
+"""
+import argparse, random, time
+from bisect import bisect_left
+
+from app.services.calendar_index import DAY, DoctorCalendar, Series, WorkHours
+
+HOURS = WorkHours("08:00", "18:00", [0, 1, 2, 3, 4], 15)
+
+
+def schedule(days: int, origin: int, fill: float, rnd: random.Random) -> tuple[list, list]:
+    series = [
+        Series("staff", (origin + 4) * DAY + 8 * 60, 60, 7),            # Mondays 08:00
+        Series("round", (origin + 1) * DAY + 13 * 60, 90, 14),          # every other Friday
+        Series("dialysis", (origin + 2) * DAY + 16 * 60, 120, 7, occurrences=30),
+    ]
+    appts = []
+    for day in range(origin, origin + days):
+        lo, hi = HOURS.window(day)
+        if lo == hi:
+            continue
+        if rnd.random() < 1 / 22:
+            hi = lo + 300  # a free afternoon
+        t = lo
+        while t < hi:
+            length = rnd.choice((15, 30, 30, 45, 60))
+            if rnd.random() < fill and not any(s.on(day) and s.offset <= t % DAY < s.offset + s.duration for s in series):
+                appts.append((t, min(t + length, hi)))
+            t += length
+    return appts, series
+
+
+def build(appts: list, series: list, origin: int) -> DoctorCalendar:
+    cal = DoctorCalendar(HOURS, origin)
+    for i, (s, e) in enumerate(appts):
+        cal.add(str(i), s, e)
+    for sr in series:
+        cal.add_series(sr)
+    return cal
+
+
+def expand(appts: list, series: list, origin: int, days: int) -> list:
+    rows = list(appts)
+    for sr in series:
+        for day in sr.days(origin, origin + days):
+            if sr.on(day):
+                rows.append((day * DAY + sr.offset, day * DAY + sr.offset + sr.duration))
+    rows.sort()
+    return rows
+
+
+def walk(rows: list, after: int, duration: int, last_day: int):
+    i = bisect_left(rows, (after - 24 * 60,))  # nothing runs longer than a day
+    day = after // DAY
+    while day <= last_day:
+        lo, hi = HOURS.window(day)
+        t = HOURS.align(max(lo, after))
+        while i < len(rows) and rows[i][0] < day * DAY:
+            i += 1
+        j = i
+        if t < hi:
+            while j < len(rows) and rows[j][0] < hi:
+                s, e = rows[j]
+                if s - t >= duration:
+                    return t
+                t = max(t, HOURS.align(e))
+                j += 1
+            if hi - t >= duration:
+                return t
+        day += 1
+    return None
+
+
+def run_ms(fn, items) -> float:
+    t0 = time.perf_counter()
+    for item in items:
+        fn(*item)
+    return (time.perf_counter() - t0) * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--doctors", type=int, default=20)
+    ap.add_argument("--days", type=int, default=366)
+    ap.add_argument("--fill", type=float, default=0.97)
+    ap.add_argument("--queries", type=int, default=2000, help="per doctor")
+    args = ap.parse_args()
+
+    rnd = random.Random(0)
+    origin = 20454  # 2026-01-01
+    last = origin + args.days
+    durations = (15, 30, 60, 120)
+    totals = {"build": 0.0, "conflicts": 0.0, "write": 0.0}
+    totals.update({(kind, d): 0.0 for kind in ("walk", "index") for d in durations})
+    n_rows = mismatches = found = 0
+    counts, skipped = dict.fromkeys(durations, 0), dict.fromkeys(durations, 0)
+    for _ in range(args.doctors):
+        appts, series = schedule(args.days, origin, args.fill, rnd)
+        rows = expand(appts, series, origin, args.days)
+        n_rows += len(rows)
+        t0 = time.perf_counter()
+        cal = build(appts, series, origin)
+        cal._ensure(last)
+        totals["build"] += (time.perf_counter() - t0) * 1000
+
+        queries = [
+            (origin * DAY + rnd.randrange(args.days // 2 * DAY), rnd.choice(durations))
+            for _ in range(args.queries)
+        ]
+        expected = [walk(rows, a, d, last) for a, d in queries]
+        got = [cal._next_free(a, d, last) for a, d in queries]
+        mismatches += sum(x != y for x, y in zip(expected, got))
+        for (a, d), x in zip(queries, got):
+            if x is not None:
+                counts[d] += 1
+                skipped[d] += x // DAY - a // DAY
+        found += sum(x is not None for x in got)
+        for d in durations:
+            some = [x for x in queries if x[1] == d]
+            totals["walk", d] += run_ms(lambda a, d: walk(rows, a, d, last), some)
+            totals["index", d] += run_ms(lambda a, d: cal._next_free(a, d, last), some)
+
+        probes = [(a, a + d) for a, d in queries]
+        totals["conflicts"] += run_ms(cal.conflicts, probes)
+        writes = [(a - a % 15, d) for a, d in queries]
+
+        def book_cancel(start, duration):
+            cal.add("bench", start, start + duration)
+            cal.remove("bench")
+
+        totals["write"] += run_ms(book_cancel, writes)
+
+    q = args.doctors * args.queries
+    print(f"{args.doctors} doctors x {args.days} days, {n_rows / args.doctors:.0f} bookings each "
+          f"({args.fill:.0%} filled), {q} next-slot queries: {found} found, "
+          f"{'all match' if not mismatches else f'{mismatches} MISMATCHED'}")
+    print(f"{'next slot, minutes':>18} {'days ahead':>11} {'walk us':>9} {'index us':>9}")
+    for d in durations:
+        n = max(counts[d], 1)
+        print(f"{d:>18} {skipped[d] / n:>11.1f} {totals['walk', d] * 1000 / n:>9.1f} "
+              f"{totals['index', d] * 1000 / n:>9.1f}")
+    print(f"{'conflict check us':>18} {totals['conflicts'] * 1000 / q:>11.1f}")
+    print(f"{'book + cancel us':>18} {totals['write'] * 1000 / q:>11.1f}")
+    print(f"{'build ms/doctor':>18} {totals['build'] / args.doctors:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# benchmarks/dicom_ingest.py
+"""
+Slices/sec and peak RSS per study for imaging ingest, on synthetic CT series:
+
+    python -m app.benchmarks.dicom_ingest --slices 300 --workers 1 2 4
+
+  naive      per slice: full dcmread (pixels decoded), strip PHI, save_as, Pillow
+             thumbnail from pixel_array; sequential, in the API process
+  pipeline   services.dicom_ingest: the study streamed as one multipart body in 64 KB
+             chunks, parts staged as they complete and handed to the process pool
+             (header-only parse, pixels copied from the mapping, strided preview)
+
+Each mode runs in a fresh interpreter. "API +MB" is the API process's peak RSS above
+its RSS after imports (what one study adds); "worker MB" is the largest pool process,
+imports included. The pool is warmed before timing, as at API startup. No DB: rows
+are built but not inserted.
+"""
+import argparse, asyncio, json, os, resource, shutil, subprocess, sys, tempfile, time, uuid
+
+import numpy as np
+
+
+def synthetic_series(n: int, out_dir: str, size: int = 512) -> int:
+    """n CT slices with PHI and a private tag; returns total bytes."""
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import CTImageStorage, ExplicitVRLittleEndian, generate_uid
+
+    os.makedirs(out_dir, exist_ok=True)
+    study, series, frame = generate_uid(), generate_uid(), generate_uid()
+    rnd = np.random.default_rng(0)
+    yy, xx = np.mgrid[:size, :size]
+    body = ((yy - size / 2) ** 2 + (xx - size / 2) ** 2) < (size * 0.4) ** 2
+    total = 0
+    for i in range(n):
+        meta = FileMetaDataset()
+        meta.MediaStorageSOPClassUID = CTImageStorage
+        meta.MediaStorageSOPInstanceUID = generate_uid()
+        meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds = Dataset()
+        ds.file_meta = meta
+        ds.preamble = b"\0" * 128
+        ds.is_little_endian, ds.is_implicit_VR = True, False
+        ds.SOPClassUID, ds.SOPInstanceUID = CTImageStorage, meta.MediaStorageSOPInstanceUID
+        ds.StudyInstanceUID, ds.SeriesInstanceUID, ds.FrameOfReferenceUID = study, series, frame
+        ds.PatientName, ds.PatientID, ds.PatientBirthDate = "Doe^Jane", "MRN-0042", "19610203"
+        ds.InstitutionName, ds.ReferringPhysicianName, ds.AccessionNumber = "General Hospital", "House^G", "A1"
+        ds.Modality, ds.BodyPartExamined, ds.StudyDate = "CT", "CHEST", "20240115"
+        ds.SeriesNumber, ds.InstanceNumber = 2, i + 1
+        ds.SliceThickness, ds.SliceLocation = 1.0, float(i)
+        ds.ImagePositionPatient, ds.PixelSpacing = [0, 0, float(i)], [0.7, 0.7]
+        ds.Rows = ds.Columns = size
+        ds.SamplesPerPixel, ds.PhotometricInterpretation = 1, "MONOCHROME2"
+        ds.BitsAllocated, ds.BitsStored, ds.HighBit, ds.PixelRepresentation = 16, 12, 11, 1
+        ds.RescaleSlope, ds.RescaleIntercept = 1, -1024
+        ds.WindowCenter, ds.WindowWidth = 40, 400
+        ds.add_new(0x00090010, "LO", "VENDOR")  # private creator + element
+        ds.add_new(0x00091001, "LO", "Doe^Jane scanned by tech 7")
+        pixels = np.where(body, 1024 + 40 + rnd.normal(0, 20, body.shape), 0).astype(np.int16)
+        ds.PixelData = pixels.tobytes()
+        path = os.path.join(out_dir, f"slice{i:04d}.dcm")
+        ds.save_as(path, write_like_original=False)
+        total += os.path.getsize(path)
+    return total
+
+
+def naive(src: str, out: str, thumb_px: int) -> int:
+    import pydicom
+    from PIL import Image
+    from app.services.dicom_workers import strip_phi
+
+    n = 0
+    for name in sorted(os.listdir(src)):
+        ds = pydicom.dcmread(os.path.join(src, name))
+        strip_phi(ds, "bench")
+        arr = ds.pixel_array.astype(np.float32) * float(ds.RescaleSlope) + float(ds.RescaleIntercept)
+        lo, hi = float(ds.WindowCenter) - float(ds.WindowWidth) / 2, float(ds.WindowCenter) + float(ds.WindowWidth) / 2
+        img = Image.fromarray(np.clip((arr - lo) / (hi - lo) * 255, 0, 255).astype(np.uint8), "L")
+        img.thumbnail((thumb_px, thumb_px))
+        img.save(os.path.join(out, f"{n}.png"))
+        ds.save_as(os.path.join(out, f"{n}.dcm"))
+        n += 1
+    return n
+
+
+async def multipart_body(src: str, boundary: str, chunk: int = 64 * 1024):
+    """The study as an HTTP client would send it, in network-sized chunks."""
+    for name in sorted(os.listdir(src)):
+        yield (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"files\"; filename=\"{name}\"\r\n"
+            "Content-Type: application/dicom\r\n\r\n"
+        ).encode()
+        with open(os.path.join(src, name), "rb") as f:
+            while data := f.read(chunk):
+                yield data
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        return next(int(l.split()[1]) for l in f if l.startswith("VmRSS:")) / 1024
+
+
+async def pipeline(src: str, out: str, workers: int, thumb_px: int) -> tuple[int, float]:
+    from app.services.dicom_ingest import DicomWorkerPool, _is_dicom, stream_parts
+
+    pool = DicomWorkerPool(workers)
+    await pool.start()  # the API warms its pool at startup
+    boundary = uuid.uuid4().hex
+    tasks = []
+    t0 = time.perf_counter()
+    async for _, path in stream_parts(
+        multipart_body(src, boundary), f"multipart/form-data; boundary={boundary}",
+        os.path.join(out, ".incoming"), 64 << 20, 10_000,
+    ):
+        if await asyncio.to_thread(_is_dicom, path):
+            tasks.append(asyncio.create_task(pool.process(path, out, "patient", "bench", thumb_px)))
+    rows = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - t0
+    await pool.aclose()
+    return len(rows), elapsed
+
+
+def run_one(args):
+    out = tempfile.mkdtemp()
+    try:
+        if args.run == "naive":
+            import pydicom, PIL.Image  # noqa: F401  (imports are not part of the study)
+            from app.services.dicom_workers import strip_phi  # noqa: F401
+            base = rss_mb()
+            t0 = time.perf_counter()
+            n = naive(args.src, out, args.thumb_px)
+            elapsed = time.perf_counter() - t0
+        else:
+            import app.services.dicom_ingest  # noqa: F401
+            base = rss_mb()
+            n, elapsed = asyncio.run(pipeline(args.src, out, args.workers[0], args.thumb_px))
+    finally:
+        shutil.rmtree(out)
+    print(json.dumps({
+        "slices": n, "seconds": elapsed,
+        "study_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 - base,
+        "workers_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--slices", type=int, default=300)
+    ap.add_argument("--size", type=int, default=512)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--thumb-px", type=int, default=128)
+    ap.add_argument("--run", choices=("naive", "pipeline"), help=argparse.SUPPRESS)
+    ap.add_argument("--src", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.run:
+        return run_one(args)
+
+    src = tempfile.mkdtemp()
+    try:
+        total = synthetic_series(args.slices, src, args.size)
+        print(f"{args.slices} slices {args.size}x{args.size} int16, {total / 2**20:.0f} MB, {os.cpu_count()} CPUs")
+        print(f"{'mode':>14} {'slices/s':>9} {'API +MB':>8} {'worker MB':>10}")
+        runs = [("naive", ["--run", "naive"])] + [
+            (f"pipeline x{w}", ["--run", "pipeline", "--workers", str(w)]) for w in args.workers
+        ]
+        for label, extra in runs:
+            cmd = [sys.executable, "-m", "app.benchmarks.dicom_ingest", "--src", src, "--thumb-px", str(args.thumb_px), *extra]
+            r = json.loads(subprocess.run(cmd, check=True, capture_output=True, text=True).stdout.strip().splitlines()[-1])
+            print(f"{label:>14} {r['slices'] / r['seconds']:>9.0f} {r['study_mb']:>8.1f} {r['workers_mb']:>10.0f}")
+    finally:
+        shutil.rmtree(src)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# benchmarks/embedding_throughput.py
+"""
+Texts/sec through ai.embeddings.EmbeddingService:
+
+    python -m app.benchmarks.embedding_throughput --texts 4000
+    python -m app.benchmarks.embedding_throughput --model sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2
+
+Without --model a stand-in encoder sleeps `call_ms + per_text_ms * n` per call (the
+shape of a CPU transformer forward pass: fixed overhead, then roughly linear), so the
+numbers show scheduling effects, not model speed.
+
+  one-at-a-time    encode([text]) per text, what a naive indexer does
+  service          64 concurrent callers with one text each, merged by the batcher
+  service, dups    same, 30% of texts repeated (deduplicated in flight or by the disk cache)
+  bulk, cold       backfill-style embed() of 256-text batches, empty disk cache
+  bulk, reindex    same corpus again: every vector comes from the disk cache
+"""
+import argparse, asyncio, os, random, shutil, tempfile, time
+
+import numpy as np
+
+from app.ai.embeddings import EmbeddingCache, EmbeddingService, _sentence_transformer
+from app.benchmarks.soap_extract import SENTENCES
+
+
+def stand_in(dim: int, call_ms: float, per_text_ms: float):
+    def encode(texts: list[str]) -> np.ndarray:
+        time.sleep((call_ms + per_text_ms * len(texts)) / 1000)
+        rnd = np.random.default_rng(abs(hash(texts[0])) % 2**32)
+        v = rnd.normal(size=(len(texts), dim)).astype(np.float32)
+        return v / np.linalg.norm(v, axis=1, keepdims=True)
+    return encode
+
+
+def corpus(n: int, dup_share: float = 0.0, seed: int = 5) -> list[str]:
+    rnd = random.Random(seed)
+    texts: list[str] = []
+    for i in range(n):
+        if texts and rnd.random() < dup_share:
+            texts.append(rnd.choice(texts))
+        else:
+            texts.append(f"{rnd.choice(SENTENCES)} (note {i})")
+    return texts
+
+
+async def concurrent(service: EmbeddingService, texts: list[str], callers: int) -> float:
+    queue = list(texts)
+
+    async def caller():
+        while queue:
+            await service.embed([queue.pop()])
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(callers)))
+    return len(texts) / (time.perf_counter() - t0)
+
+
+async def bulk(service: EmbeddingService, texts: list[str], batch: int = 256) -> float:
+    t0 = time.perf_counter()
+    for s in range(0, len(texts), batch):
+        await service.embed(texts[s:s + batch])
+    return len(texts) / (time.perf_counter() - t0)
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--texts", type=int, default=4000)
+    ap.add_argument("--model", default=None, help="sentence-transformers model (default: stand-in encoder)")
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--call-ms", type=float, default=15)
+    ap.add_argument("--per-text-ms", type=float, default=1.5)
+    ap.add_argument("--callers", type=int, default=64)
+    args = ap.parse_args()
+
+    encode = _sentence_transformer(args.model) if args.model else stand_in(args.dim, args.call_ms, args.per_text_ms)
+    name = args.model or "stand-in"
+    texts = corpus(args.texts)
+    tmp = tempfile.mkdtemp()
+    print(f"{args.texts} texts, encoder: {name}")
+    print(f"{'mode':>16} {'texts/s':>9} {'encoded':>8} {'batches':>8}")
+    try:
+        n = max(200, args.texts // 10)  # the naive path is slow; time a slice
+        t0 = time.perf_counter()
+        for t in texts[:n]:
+            encode([t])
+        print(f"{'one-at-a-time':>16} {n / (time.perf_counter() - t0):>9.0f} {n:>8} {n:>8}")
+
+        def service(cache=None):
+            return EmbeddingService(name, args.dim, max_batch_size=64, max_wait_ms=10, cache=cache, encode=encode)
+
+        for label, data, cache in (
+            ("service", texts, None),
+            ("service, dups", corpus(args.texts, 0.3), EmbeddingCache(os.path.join(tmp, "dups.sqlite"), args.dim)),
+        ):
+            svc = service(cache)
+            rate = await concurrent(svc, data, args.callers)
+            print(f"{label:>16} {rate:>9.0f} {svc.encoded:>8} {svc.batches:>8}")
+            await svc.aclose()
+
+        cache = EmbeddingCache(os.path.join(tmp, "emb.sqlite"), args.dim)
+        for label in ("bulk, cold", "bulk, reindex"):
+            svc = service(cache)
+            rate = await bulk(svc, texts)
+            print(f"{label:>16} {rate:>9.0f} {svc.encoded:>8} {svc.batches:>8}")
+            await svc.aclose()
+        cache.close()
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,220 @@
+# benchmarks/lab_trends.py
+"""
+Lab trend / critical-value analysis of a 20-year history, services.lab_trends vs a
+per-row Python loop computing the same report:
+
+    python -m app.benchmarks.lab_trends --years 20 --iterations 20
+
+The synthetic patient has a monthly panel (BMP + CBC + lipids + HbA1c, mixed result
+shapes) plus a few admissions with daily labs, a slowly failing kidney, and some
+acute events; the current admission ends with a critical glucose, a haemoglobin drop,
+and creatinine and potassium climbing, so every alert kind fires. Timings exclude the
+DB: rows are dicts as the driver returns them.
+
+  naive         per row: parse, append to per-analyte lists; per analyte: Python loops
+  load+analyze  LabHistory.add_rows + analyze (cold cache: parse into arrays, one pass)
+  analyze       trend_pass alone over the loaded arrays
+  incremental   one new panel folded into a warm history (what a cached read costs)
+
+Both reports are compared analyte by analyte.
+"""
+import argparse, math, random, time, uuid
+from datetime import datetime, timedelta
+from statistics import median
+
+from app.config import settings
+from app.services.lab_trends import (
+    CRITICAL_HIGH, CRITICAL_LOW, DELTA, DELTA_RULES, HIGH, LOW, LabHistory, _limits, analyte_key,
+    iter_analytes, parse_range, parse_value,
+)
+
+PANEL = [  # name, unit, range, baseline, noise
+    ("Sodium", "mmol/L", "135-145", 140, 2), ("Potassium", "mmol/L", "3.5-5.1", 4.2, 0.3),
+    ("Chloride", "mmol/L", "98-107", 102, 2), ("Bicarbonate", "mmol/L", "22-29", 25, 1.5),
+    ("BUN", "mg/dL", "7-20", 14, 3), ("Creatinine", "mg/dL", "0.6-1.2", 0.9, 0.05),
+    ("Glucose", "mg/dL", "70-99", 92, 10), ("Calcium", "mg/dL", "8.6-10.2", 9.4, 0.3),
+    ("Magnesium", "mg/dL", "1.7-2.2", 2.0, 0.1), ("Phosphate", "mg/dL", "2.5-4.5", 3.5, 0.4),
+    ("Albumin", "g/dL", "3.5-5.0", 4.2, 0.2), ("ALT", "U/L", "7-56", 25, 6), ("AST", "U/L", "10-40", 22, 5),
+    ("Hemoglobin", "g/dL", "13.5-17.5", 15, 0.6), ("WBC", "10^9/L", "4.5-11", 7, 1.2),
+    ("Platelets", "10^9/L", "150-400", 250, 30), ("Hematocrit", "%", "41-53", 45, 2),
+    ("MCV", "fL", "80-100", 90, 3), ("RDW", "%", "11.5-14.5", 13, 0.5),
+    ("Total cholesterol", "mg/dL", "<200", 190, 15), ("LDL", "mg/dL", "<130", 115, 12),
+    ("HDL", "mg/dL", ">40", 50, 5), ("Triglycerides", "mg/dL", "<150", 130, 25),
+    ("HbA1c", "%", "4.0-5.6", 5.6, 0.2), ("TSH", "mIU/L", "0.4-4.0", 2, 0.5), ("INR", "", "0.8-1.2", 1.0, 0.05),
+]
+
+
+def history(years: int, seed: int = 0) -> list[dict]:
+    rnd = random.Random(seed)
+    start = datetime(2005, 1, 1)
+    end = start + timedelta(days=365 * years)
+    draws = []
+    day = start
+    while day < end - timedelta(days=10):
+        draws.append(day)
+        day += timedelta(days=30)
+    for a in range(years // 4):  # admissions: daily labs for 10 days
+        adm = start + timedelta(days=rnd.randrange(365 * years - 30))
+        draws += [adm + timedelta(days=i, hours=6) for i in range(10)]
+    final = end - timedelta(days=10)  # the current admission: kidneys failing, a bleed on the last day
+    draws += [final + timedelta(days=i, hours=6) for i in range(10)]
+    draws.sort()
+    rows = []
+    for i, when in enumerate(draws):
+        frac = (when - start).days / (end - start).days
+        analytes = []
+        for name, unit, rng, base, noise in PANEL:
+            v = base + rnd.gauss(0, noise)
+            if name == "Creatinine":
+                v += 1.6 * frac ** 3  # CKD progression in the last years
+            if name == "Potassium" and frac > 0.9:
+                v += 8 * (frac - 0.9)  # rising with it
+            if name == "Hemoglobin" and rnd.random() < 0.01:
+                v -= 4  # acute bleed
+            if when > final:
+                k = (when - final).days
+                v = {"Creatinine": 2.0 + 0.15 * k, "Potassium": 5.0 + 0.14 * k}.get(name, v)
+                if k == 9:
+                    v = {"Hemoglobin": 10.5, "Glucose": 480}.get(name, v)
+            analytes.append({"name": name, "value": round(v, 2), "unit": unit, "reference_range": rng})
+        shape = i % 3  # the stored JSON shapes vary by lab
+        if shape == 0:
+            results = {"analytes": analytes}
+        elif shape == 1:
+            results = {a["name"]: {k: a[k] for k in ("value", "unit", "reference_range")} for a in analytes}
+        else:
+            results = analytes
+        rows.append({
+            "id": uuid.uuid4(), "test_name": "Panel", "test_date": when, "reference_range": None,
+            "results": results, "updated_at": when,
+        })
+    return rows
+
+
+def naive(rows: list[dict]) -> dict:
+    series: dict = {}
+    for row in rows:
+        day = (row["test_date"] - datetime(1970, 1, 1)).total_seconds() / 86400
+        for name, value, unit, rng in iter_analytes(row["test_name"], row.get("reference_range"), row["results"]):
+            x = parse_value(value)
+            if math.isnan(x):
+                continue
+            lo, hi = parse_range(rng)
+            series.setdefault((analyte_key(name), unit.strip().lower()), (name, unit, []))[2].append((day, x, lo, hi))
+    out = {}
+    for (key, unit_key), (name, unit, pts) in series.items():
+        pts.sort()
+        clo, chi = _limits(key, unit)
+        rule_days, rule_delta = DELTA_RULES.get(key, (math.nan, math.nan))
+        flags, steps = [], []
+        for i, (t, v, lo, hi) in enumerate(pts):
+            f = (LOW if v < lo else 0) | (HIGH if v > hi else 0) | (CRITICAL_LOW if v < clo else 0) | (CRITICAL_HIGH if v > chi else 0)
+            step = 0
+            if i:
+                pt, pv = pts[i - 1][0], pts[i - 1][1]
+                dv, dt = v - pv, t - pt
+                rule = dt <= rule_days and math.copysign(1, rule_delta) * dv >= abs(rule_delta)
+                generic = dt <= settings.LAB_DELTA_DAYS and abs(dv) >= settings.LAB_DELTA_PCT * abs(pv) and pv != 0
+                if rule or generic:
+                    f |= DELTA
+                step = (dv > 0) - (dv < 0)
+            flags.append(f)
+            steps.append(step)
+        t_last, v_last, lo, hi = pts[-1]
+        win = [(t - t_last, v) for t, v, _, _ in pts if t - t_last >= -settings.LAB_TREND_WINDOW_DAYS]
+        n = len(win)
+        st = sum(t for t, _ in win)
+        sv = sum(v for _, v in win)
+        stt = sum(t * t for t, _ in win)
+        stv = sum(t * v for t, v in win)
+        den = n * stt - st * st
+        slope = (n * stv - st * sv) / den if n >= 2 and den > 0 else math.nan
+        run = 0
+        if steps[-1]:
+            for s in reversed(steps[1:]):
+                if s != steps[-1]:
+                    break
+                run += 1
+        lf = flags[-1]
+        scale = hi - lo if math.isfinite(hi - lo) else abs(sv / n)
+        change = slope * settings.LAB_TREND_WINDOW_DAYS
+        trend = "stable" if math.isnan(slope) or abs(change) <= 0.1 * scale else ("rising" if change > 0 else "falling")
+        alerts = []
+        if lf & (CRITICAL_HIGH | CRITICAL_LOW):
+            alerts.append("critical")
+        if lf & DELTA:
+            alerts.append("delta")
+        away = (lf & (HIGH | CRITICAL_HIGH) and steps[-1] > 0) or (lf & (LOW | CRITICAL_LOW) and steps[-1] < 0)
+        if away and run >= settings.LAB_TREND_MIN_RUN:
+            alerts.append("worsening")
+        horizon = settings.LAB_TREND_HORIZON_DAYS
+        ahead = lambda d: 0 < d <= horizon
+        if run >= settings.LAB_TREND_MIN_RUN and not lf & (CRITICAL_LOW | CRITICAL_HIGH) and slope == slope and (
+            (slope > 0 and ahead((chi - v_last) / slope)) or (slope < 0 and ahead((clo - v_last) / slope))
+        ):
+            alerts.append("approaching_critical")
+        status = next((s for bit, s in ((CRITICAL_HIGH, "critical_high"), (CRITICAL_LOW, "critical_low"),
+                                         (HIGH, "high"), (LOW, "low")) if lf & bit), "normal")
+        out[name] = {"status": status, "trend": trend, "run": run, "alerts": alerts, "count": len(pts)}
+    return out
+
+
+def best_ms(fn, iterations: int) -> float:
+    times = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return median(times)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--years", type=int, default=20)
+    ap.add_argument("--iterations", type=int, default=20)
+    args = ap.parse_args()
+
+    rows = history(args.years)
+    reference = naive(rows)
+
+    def cold():
+        h = LabHistory()
+        h.add_rows(rows)
+        h.analyze()
+        return h
+
+    h = cold()
+    report = {a["analyte"]: a for a in h.report()["analytes"]}
+    mismatched = [
+        name for name, ref in reference.items()
+        if {k: report[name][k] for k in ref} != ref
+    ]
+    print(f"{args.years} years: {len(rows)} reports, {h.report()['observations']} observations, "
+          f"{len(report)} analytes, {len(h.report()['alerts'])} alerts; "
+          f"reports {'match' if not mismatched else 'DIFFER: ' + ', '.join(mismatched)}")
+
+    last = rows[-1]
+    new = dict(last, id=uuid.uuid4(), test_date=last["test_date"] + timedelta(days=30))
+    new["updated_at"] = new["test_date"]
+
+    def incremental():
+        warm = LabHistory()
+        warm.add_rows(rows)
+        warm.analyze()
+        t0 = time.perf_counter()
+        warm.analyze(warm.add_rows([new]))
+        return (time.perf_counter() - t0) * 1000
+
+    every = list(range(len(h.names)))
+    print(f"{'':>14} {'ms':>8}")
+    for label, ms in (
+        ("naive", best_ms(lambda: naive(rows), args.iterations)),
+        ("load+analyze", best_ms(cold, args.iterations)),
+        ("analyze", best_ms(lambda: h.analyze(set(every)), args.iterations)),
+        ("incremental", median(incremental() for _ in range(args.iterations))),
+    ):
+        print(f"{label:>14} {ms:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
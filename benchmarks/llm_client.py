@@ -0,0 +1,135 @@
+# benchmarks/llm_client.py
+"""
+ai.llm_client.LLMClient against a local OpenAI-compatible stand-in served by uvicorn
+in its own thread (log-normal latency, a share of 503s):
+
+    python -m app.benchmarks.llm_client --requests 1000 --prompts 150 --concurrency 64
+
+Prompts are drawn Zipf-style (a few transcripts re-drafted often, a long tail once).
+"naive" opens a client per call with no cache, coalescing or retry; "pooled" reuses one
+client but is otherwise the same; "llm_client" adds the exact cache, coalescing and
+jittered retries. Reports upstream calls made, failed requests and client-side latency.
+"""
+import argparse, asyncio, json, random, socket, threading, time
+from statistics import quantiles
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.ai.llm_client import LLMClient, LLMError, OpenAIProvider
+
+
+def standin(latency_ms: float, error_rate: float, seed: int = 1) -> FastAPI:
+    app = FastAPI()
+    app.state.calls = 0
+    rnd = random.Random(seed)
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        await asyncio.sleep(latency_ms / 1000 * rnd.lognormvariate(0, 0.6))
+        if rnd.random() < error_rate:
+            return JSONResponse({"error": {"message": "overloaded"}}, status_code=503)
+        text = "Draft for: " + body["messages"][-1]["content"][:60]
+        if body.get("stream"):
+            async def sse():
+                for word in text.split(" "):
+                    yield "data: " + json.dumps({"choices": [{"delta": {"content": word + " "}}]}) + "\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(sse(), media_type="text/event-stream")
+        return {"choices": [{"message": {"role": "assistant", "content": text}}]}
+
+    return app
+
+
+async def serve(app: FastAPI) -> tuple[uvicorn.Server, str]:
+    # Separate thread + loop so the stand-in does not share CPU time with the client under test
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False, backlog=4096))
+    threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True).start()
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, f"http://127.0.0.1:{sock.getsockname()[1]}/v1"
+
+
+def workload(requests: int, prompts: int, seed: int = 3) -> list[str]:
+    rnd = random.Random(seed)
+    weights = [1 / (i + 1) for i in range(prompts)]
+    return [f"Transcript {i}: patient reports chest pain, BP 135/85" for i in rnd.choices(range(prompts), weights, k=requests)]
+
+
+async def post(client: httpx.AsyncClient, base_url: str, prompt: str) -> str:
+    resp = await client.post(base_url + "/chat/completions", json={
+        "model": "standin", "messages": [{"role": "user", "content": prompt}], "max_tokens": 256,
+    })
+    if resp.status_code >= 400:
+        raise LLMError("standin", f"HTTP {resp.status_code}", resp.status_code)
+    return resp.json()["choices"][0]["message"]["content"]
+
+
+async def naive(base_url: str, prompt: str) -> str:
+    async with httpx.AsyncClient(timeout=30) as client:
+        return await post(client, base_url, prompt)
+
+
+async def run(call, prompts: list[str], concurrency: int) -> dict:
+    lat, failed = [], 0
+    queue = list(reversed(prompts))
+
+    async def worker():
+        nonlocal failed
+        while queue:
+            prompt = queue.pop()
+            t0 = time.perf_counter()
+            try:
+                await call(prompt)
+            except LLMError:
+                failed += 1
+            lat.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    q = quantiles(lat, n=1000)
+    return {"wall": time.perf_counter() - t0, "p50": q[499], "p99": q[989], "p999": q[998], "failed": failed}
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=1000)
+    ap.add_argument("--prompts", type=int, default=150, help="distinct prompts")
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--latency-ms", type=float, default=150)
+    ap.add_argument("--error-rate", type=float, default=0.05)
+    args = ap.parse_args()
+
+    app = standin(args.latency_ms, args.error_rate)
+    server, base_url = await serve(app)
+    prompts = workload(args.requests, args.prompts)
+
+    shared = httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=32))
+    client = LLMClient(OpenAIProvider(base_url, "test", "standin", http=shared), max_concurrency=32,
+                       max_retries=3, cache_size=1024, backoff_base_s=0.05)
+    modes = (
+        ("naive", lambda p: naive(base_url, p)),
+        ("pooled", lambda p: post(shared, base_url, p)),
+        ("llm_client", lambda p: client.complete(p, max_tokens=256)),
+    )
+    print(f"{args.requests} requests, {args.prompts} distinct prompts, {args.error_rate:.0%} upstream 503s")
+    print(f"{'mode':>11} {'upstream':>9} {'failed':>7} {'p50 ms':>8} {'p99 ms':>8} {'p99.9 ms':>9} {'wall s':>7}")
+    for name, call in modes:
+        before = app.state.calls
+        r = await run(call, prompts, args.concurrency)
+        print(f"{name:>11} {app.state.calls - before:>9} {r['failed']:>7} {r['p50']:>8.1f} {r['p99']:>8.1f} "
+              f"{r['p999']:>9.1f} {r['wall']:>7.2f}")
+    print(client.stats())
+
+    await shared.aclose()
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+# benchmarks/middleware_health.py
+"""
+/health throughput through the middleware stack, in-process (httpx ASGITransport).
+
+    python -m app.benchmarks.middleware_health --requests 5000
+
+Compares a bare app, the previous BaseHTTPMiddleware implementations and the pure
+ASGI ones in core.middleware. Rate limiting needs Redis, so it is off by default
+(--rate-limit uses REDIS_URL).
+"""
+import argparse, asyncio, time, uuid
+
+import httpx
+from fastapi import FastAPI
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.core import middleware as asgi_mw
+
+
+class LegacySecurityHeadersMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        resp = await call_next(request)
+        resp.headers.update(asgi_mw._SECURITY_HEADERS)
+        return resp
+
+
+class LegacyLoggingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        rid = str(uuid.uuid4())
+        request.state.request_id = rid
+        start = time.perf_counter()
+        resp = await call_next(request)
+        dur_ms = (time.perf_counter() - start) * 1000
+        resp.headers["X-Request-ID"] = rid
+        resp.headers["Server-Timing"] = f"total;dur={dur_ms:.1f}"
+        return resp
+
+
+def build(middlewares: list) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy", "timestamp": time.time()}
+
+    for mw in middlewares:
+        app.add_middleware(mw)
+    return app
+
+
+async def bench(app: FastAPI, requests: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(100):
+            await client.get("/health")
+        remaining = requests
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                r = await client.get("/health")
+                assert r.status_code == 200
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - t0
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=5000)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--rate-limit", action="store_true")
+    args = ap.parse_args()
+
+    legacy = [LegacyLoggingMiddleware, LegacySecurityHeadersMiddleware]
+    native = [asgi_mw.LoggingMiddleware, asgi_mw.SecurityHeadersMiddleware]
+    if args.rate_limit:
+        native.append(asgi_mw.RateLimitMiddleware)
+        asgi_mw.settings.RATE_LIMIT_REQUESTS_PER_MINUTE = 10 ** 9
+
+    results = {}
+    for name, stack in (("bare", []), ("basehttp", legacy), ("asgi", native)):
+        wall = await bench(build(stack), args.requests, args.concurrency)
+        results[name] = wall
+        print(f"{name:>9}: {args.requests / wall:>8.0f} req/s  {wall / args.requests * 1e6:>7.1f} us/req")
+    for name in ("basehttp", "asgi"):
+        overhead = (results[name] - results["bare"]) / args.requests * 1e6
+        print(f"{name:>9} middleware overhead: {overhead:.1f} us/req")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+# benchmarks/note_stream.py
+"""
+Time-to-first-section for streamed SOAP drafting vs waiting for the whole completion,
+against the fake LLM backend (model-like pacing, no network):
+
+    python -m app.benchmarks.note_stream --notes 20 --first-token-ms 300 --token-ms 25
+
+"blocking" is what /note-from-transcript would do with an LLM behind it: read the full
+completion, then parse. "streaming" is services.note_stream.stream_note. Also checks
+that abandoning a stream stops token generation.
+"""
+import argparse, asyncio, time
+from statistics import quantiles
+
+from app.ai.llm_client import FakeLLMBackend
+from app.benchmarks.soap_extract import transcript
+from app.services.note_stream import SoapStreamParser, build_prompt, stream_note
+
+
+async def blocking(backend, text: str) -> tuple[float, float]:
+    t0 = time.perf_counter()
+    completion = "".join([tok async for tok in backend.stream(build_prompt(text))])
+    parser = SoapStreamParser()
+    parser.feed(completion)
+    parser.close()
+    done = time.perf_counter() - t0
+    return done, done
+
+
+async def streaming(backend, text: str) -> tuple[float, float]:
+    t0 = time.perf_counter()
+    first = None
+    async for ev in stream_note(text, backend=backend):
+        if first is None and ev["type"] == "section_done":
+            first = time.perf_counter() - t0
+    return first, time.perf_counter() - t0
+
+
+async def run(mode, backend, text: str, notes: int) -> dict:
+    res = await asyncio.gather(*(mode(backend, text) for _ in range(notes)))
+    first = sorted(r[0] * 1000 for r in res)
+    total = sorted(r[1] * 1000 for r in res)
+    q = quantiles(first, n=100) if len(first) > 1 else first * 99
+    return {"first_p50": q[49], "first_p95": q[94], "done_p50": total[len(total) // 2]}
+
+
+class CountingBackend(FakeLLMBackend):
+    tokens = 0
+
+    async def stream(self, prompt, **kw):
+        async for tok in super().stream(prompt, **kw):
+            self.tokens += 1
+            yield tok
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--notes", type=int, default=20, help="concurrent drafts")
+    ap.add_argument("--minutes", type=int, default=3, help="transcript length")
+    ap.add_argument("--first-token-ms", type=float, default=300)
+    ap.add_argument("--token-ms", type=float, default=25)
+    args = ap.parse_args()
+
+    text = transcript(args.minutes)
+    backend = FakeLLMBackend(args.first_token_ms / 1000, args.token_ms / 1000)
+    print(f"{'mode':>10} {'1st sec p50':>12} {'1st sec p95':>12} {'done p50':>10}  (ms)")
+    for name, mode in (("blocking", blocking), ("streaming", streaming)):
+        r = await run(mode, backend, text, args.notes)
+        print(f"{name:>10} {r['first_p50']:>12.0f} {r['first_p95']:>12.0f} {r['done_p50']:>10.0f}")
+
+    counting = CountingBackend(args.first_token_ms / 1000, args.token_ms / 1000)
+    events = stream_note(text, backend=counting)
+    async for ev in events:
+        if ev["type"] == "section_done":
+            break
+    await events.aclose()
+    at_close = counting.tokens
+    await asyncio.sleep(args.token_ms / 1000 * 20)
+    print(f"cancel after first section: {at_close} tokens read, {counting.tokens - at_close} more after close")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+# benchmarks/rate_limit.py
+"""
+Per-request limiter latency: old INCR+EXPIRE fixed window vs GCRA script vs GCRA + local lease.
+
+    python -m app.benchmarks.rate_limit --requests 20000 [--fake]
+
+Uses REDIS_URL unless --fake (fakeredis + lupa, in-process; only relative numbers mean anything).
+"""
+import argparse, asyncio, random, time
+from statistics import quantiles
+
+from redis.asyncio import from_url as redis_from_url
+
+from app.config import settings
+from app.core.rate_limit import RateLimiter
+
+
+async def fixed_window(redis, key: str, limit: int) -> bool:
+    cur = await redis.incr(key)
+    if cur == 1:
+        await redis.expire(key, 60)
+    return cur <= limit
+
+
+async def run(name: str, check, requests: int, clients: int):
+    lat = []
+    for _ in range(requests):
+        key = f"bench:{name}:{random.randrange(clients)}"
+        t0 = time.perf_counter()
+        await check(key)
+        lat.append((time.perf_counter() - t0) * 1e6)
+    q = quantiles(lat, n=100)
+    print(f"{name:>14}: p50 {q[49]:>7.1f} us  p99 {q[98]:>7.1f} us  total {sum(lat) / 1e6:.2f} s")
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=20000)
+    ap.add_argument("--clients", type=int, default=50, help="distinct IPs/users")
+    ap.add_argument("--limit", type=int, default=1000, help="per-minute limit (kept above the offered load)")
+    ap.add_argument("--fake", action="store_true")
+    args = ap.parse_args()
+
+    if args.fake:
+        import fakeredis.aioredis
+        redis = fakeredis.aioredis.FakeRedis()
+    else:
+        redis = redis_from_url(settings.REDIS_URL)
+
+    script_only = RateLimiter(redis, lease_divisor=args.limit)  # lease of 1 token = a script call per request
+    leased = RateLimiter(redis, settings.RATE_LIMIT_LEASE_DIVISOR, settings.RATE_LIMIT_LEASE_TTL_S)
+
+    await run("incr+expire", lambda k: fixed_window(redis, k, args.limit), args.requests, args.clients)
+    await run("gcra", lambda k: script_only.acquire(k, args.limit), args.requests, args.clients)
+    await run("gcra+lease", lambda k: leased.acquire(k, args.limit), args.requests, args.clients)
+    print(f"gcra+lease: {leased.redis_calls} Redis calls, {leased.local_hits} served locally")
+    await redis.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+# benchmarks/stt_batching.py
+"""
+Throughput / latency of the micro-batching ASR scheduler.
+
+    python -m app.benchmarks.stt_batching --requests 64 --batch-sizes 1,4,8
+
+Batch size 1 is the old one-call-per-request behaviour. Reports req/s, p50 and p95
+at several concurrency levels on a synthetic 3s utterance.
+"""
+import argparse, asyncio, io, math, os, struct, tempfile, time, wave
+from statistics import quantiles
+
+from app.services import stt_service
+from app.services.stt_service import ASRBatcher
+
+
+def synth_wav(seconds: float = 3.0, sr: int = 16000) -> bytes:
+    n = int(seconds * sr)
+    frames = b"".join(struct.pack("<h", int(8000 * math.sin(2 * math.pi * 220 * i / sr))) for i in range(n))
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(frames)
+    return buf.getvalue()
+
+
+async def run(batcher: ASRBatcher, path: str, concurrency: int, total: int) -> dict:
+    latencies: list[float] = []
+    remaining = total
+
+    async def client():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            t0 = time.perf_counter()
+            await batcher.submit(path)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    wall = time.perf_counter() - t0
+    q = quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {"rps": len(latencies) / wall, "p50": q[49], "p95": q[94]}
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=64)
+    ap.add_argument("--concurrency", default="1,4,8,16")
+    ap.add_argument("--batch-sizes", default="1,4,8")
+    ap.add_argument("--wait-ms", type=int, default=25)
+    args = ap.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
+        f.write(synth_wav())
+        path = f.name
+    try:
+        stt_service._get_asr()  # load outside the timed region
+        print(f"{'batch':>5} {'conc':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9}")
+        for bs in map(int, args.batch_sizes.split(",")):
+            for c in map(int, args.concurrency.split(",")):
+                batcher = ASRBatcher(bs, args.wait_ms)
+                r = await run(batcher, path, c, args.requests)
+                await batcher.aclose()
+                print(f"{bs:>5} {c:>5} {r['rps']:>8.2f} {r['p50']:>9.1f} {r['p95']:>9.1f}")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
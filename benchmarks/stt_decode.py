@@ -0,0 +1,70 @@
+# benchmarks/stt_decode.py
+"""
+Per-request input preparation: temp-file route vs in-memory decode.
+
+    python -m app.benchmarks.stt_decode --seconds 30 --iterations 50 [--file sample.webm]
+
+The temp-file route reproduces what the pipeline does with a path (write, read back,
+ffmpeg decode, unlink). Reports mean/p95 latency and peak Python allocations (tracemalloc).
+"""
+import argparse, os, tempfile, time, tracemalloc
+from statistics import mean, quantiles
+
+from transformers.pipelines.audio_utils import ffmpeg_read
+
+from app.benchmarks.stt_batching import synth_wav
+from app.services.audio_decode import decode_audio, sniff_suffix
+
+RATE = 16000
+
+
+def via_tempfile(data: bytes):
+    with tempfile.NamedTemporaryFile(suffix=sniff_suffix(data) or ".webm", delete=False) as f:
+        f.write(data)
+        path = f.name
+    try:
+        with open(path, "rb") as f:
+            return ffmpeg_read(f.read(), RATE)
+    finally:
+        os.remove(path)
+
+
+def in_memory(data: bytes):
+    return decode_audio(data, RATE)
+
+
+def measure(fn, data: bytes, iterations: int) -> dict:
+    fn(data)  # warm-up
+    times, peaks = [], []
+    for _ in range(iterations):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        fn(data)
+        times.append((time.perf_counter() - t0) * 1000)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {"mean": mean(times), "p95": quantiles(times, n=20)[18], "peak_kib": max(peaks) / 1024}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=30.0)
+    ap.add_argument("--iterations", type=int, default=50)
+    ap.add_argument("--file", help="real recording (webm/m4a/wav) instead of a synthetic WAV")
+    args = ap.parse_args()
+
+    if args.file:
+        with open(args.file, "rb") as f:
+            data = f.read()
+    else:
+        data = synth_wav(args.seconds, RATE)
+
+    print(f"input: {len(data) / 1024:.0f} KiB ({sniff_suffix(data) or 'unknown'})")
+    print(f"{'path':>10} {'mean ms':>9} {'p95 ms':>9} {'peak KiB':>10}")
+    for name, fn in (("tempfile", via_tempfile), ("in-memory", in_memory)):
+        r = measure(fn, data, args.iterations)
+        print(f"{name:>10} {r['mean']:>9.2f} {r['p95']:>9.2f} {r['peak_kib']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# benchmarks/upload_memory.py
+"""
+Peak memory of N concurrent /stt-sized uploads, UploadFile vs core.uploads:
+
+    python -m app.benchmarks.upload_memory --size-mb 50 --concurrency 1 10 50
+
+  uploadfile   what stt_endpoint did: Starlette parses the form into an UploadFile
+               (spooled to disk past 1 MB), then `await audio.read()` + sha-256
+  streamed     core.uploads.read_upload: hashed while parsed, spooled past
+               UPLOAD_SPOOL_MB, consumer gets upload.view()
+
+Each request's consumer reads the whole file once (as decode_audio would) and keeps
+it for --hold-s, so the uploads overlap. Bodies arrive in 64 KB receive() chunks,
+interleaved across requests. Each run is a fresh interpreter; "anon" is the peak of
+RssAnon (heap: what an OOM kill counts) and "rss" of VmRSS, which also includes the
+page-cache pages of mapped temp files, sampled every 5 ms, minus the RSS after
+imports. Per request = peak / concurrency.
+"""
+import argparse, asyncio, hashlib, json, os, subprocess, sys, zlib
+
+BOUNDARY = b"bench-boundary"
+CHUNK = 64 * 1024
+
+
+def status_mb() -> dict:
+    out = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon"):
+                out[key] = int(value.split()[0]) / 1024
+    return out
+
+
+def payload(size_mb: int) -> bytes:
+    # a WAV header on noise: sniffs as audio/wav, does not compress
+    data = os.urandom(size_mb << 20)
+    return b"RIFF\xff\xff\xff\xffWAVEfmt " + data[16:]
+
+
+def make_request(file_bytes: bytes):
+    from starlette.requests import Request
+
+    head = (
+        b"--" + BOUNDARY + b"\r\nContent-Disposition: form-data; name=\"language\"\r\n\r\nen\r\n"
+        b"--" + BOUNDARY + b"\r\nContent-Disposition: form-data; name=\"audio\"; filename=\"visit.wav\"\r\n"
+        b"Content-Type: audio/wav\r\n\r\n"
+    )
+    tail = b"\r\n--" + BOUNDARY + b"--\r\n"
+    view = memoryview(file_bytes)
+    pieces = [head] + [view[i:i + CHUNK] for i in range(0, len(view), CHUNK)] + [tail]
+    it = iter(range(len(pieces)))
+
+    async def receive():
+        i = next(it)
+        await asyncio.sleep(0)  # other uploads get the loop between chunks, as on a real socket
+        return {"type": "http.request", "body": bytes(pieces[i]), "more_body": i < len(pieces) - 1}
+
+    length = len(head) + len(file_bytes) + len(tail)
+    headers = [
+        (b"content-type", b"multipart/form-data; boundary=" + BOUNDARY),
+        (b"content-length", str(length).encode()),
+    ]
+    return Request({"type": "http", "method": "POST", "headers": headers}, receive)
+
+
+async def uploadfile(request, hold_s: float):
+    form = await request.form()
+    data = await form["audio"].read()
+    digest = hashlib.sha256(data).hexdigest()
+    zlib.crc32(data)
+    await asyncio.sleep(hold_s)
+    await form.close()
+    return digest
+
+
+async def streamed(request, hold_s: float):
+    from app.core.uploads import AUDIO_TYPES, read_upload
+
+    upload, _ = await read_upload(request, "audio", 1 << 30, AUDIO_TYPES)
+    with upload:
+        view = upload.view()
+        zlib.crc32(view)
+        await asyncio.sleep(hold_s)
+        view.release()
+        return upload.digest
+
+
+async def run(args) -> dict:
+    import app.core.uploads  # noqa: F401  (imports are not part of the measurement)
+    import starlette.formparsers  # noqa: F401
+
+    data = payload(args.size_mb)
+    base = status_mb()
+    peak = dict(base)
+    done = False
+
+    async def sample():
+        while not done:
+            for k, v in status_mb().items():
+                peak[k] = max(peak[k], v)
+            await asyncio.sleep(0.005)
+
+    handler = uploadfile if args.run == "uploadfile" else streamed
+    sampler = asyncio.create_task(sample())
+    digests = await asyncio.gather(*(handler(make_request(data), args.hold_s) for _ in range(args.concurrency[0])))
+    done = True
+    await sampler
+    assert set(digests) == {hashlib.sha256(data).hexdigest()}
+    return {k: peak[k] - base[k] for k in base}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size-mb", type=int, default=50)
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    ap.add_argument("--hold-s", type=float, default=0.5)
+    ap.add_argument("--run", choices=("uploadfile", "streamed"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.run:
+        print(json.dumps(asyncio.run(run(args))))
+        return
+
+    print(f"{args.size_mb} MB uploads, hold {args.hold_s} s")
+    print(f"{'mode':>11} {'concurrent':>10} {'anon MB':>9} {'rss MB':>8} {'anon MB/req':>12}")
+    for n in args.concurrency:
+        for mode in ("uploadfile", "streamed"):
+            cmd = [sys.executable, "-m", "app.benchmarks.upload_memory", "--run", mode,
+                   "--size-mb", str(args.size_mb), "--concurrency", str(n), "--hold-s", str(args.hold_s)]
+            r = json.loads(subprocess.run(cmd, check=True, capture_output=True, text=True).stdout.strip().splitlines()[-1])
+            print(f"{mode:>11} {n:>10} {r['RssAnon']:>9.0f} {r['VmRSS']:>8.0f} {r['RssAnon'] / n:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# benchmarks/vector_search.py
+"""
+ai.vector_store recall/latency at 10k, 100k and 1M vectors (clustered synthetic embeddings):
+
+    python -m app.benchmarks.vector_search --sizes 10000 100000 1000000 --dim 128 --doctors 1 100
+
+With --doctors 1 every row belongs to one doctor (the worst case for exact search).
+With more, rows are dealt round-robin and queries are scoped to one doctor, whose rows
+are a small share of the global ANN index: the case where an index that filters
+after picking candidates loses recall. Exact = matrix product + argpartition; IVF/HNSW
+recall@k is measured against it. "open" is VectorStore.open() on the saved store (memmap).
+Use --dim 384 for MiniLM-sized vectors if the machine has the memory (1M x 384 = 1.5 GB).
+"""
+import argparse, shutil, tempfile, time
+from statistics import quantiles
+
+import numpy as np
+
+from app.ai import vector_store
+from app.ai.vector_store import VectorStore
+
+
+def dataset(n: int, dim: int, clusters: int = 1000, seed: int = 0) -> np.ndarray:
+    rnd = np.random.default_rng(seed)
+    centers = rnd.normal(size=(clusters, dim)).astype(np.float32)
+    out = np.empty((n, dim), dtype=np.float32)
+    for s in range(0, n, 100_000):
+        m = min(100_000, n - s)
+        out[s:s + m] = centers[rnd.integers(clusters, size=m)] + 0.6 * rnd.normal(size=(m, dim)).astype(np.float32)
+    return out
+
+
+def timed(fn, queries) -> tuple[list, dict]:
+    lat, results = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        results.append(fn(q))
+        lat.append((time.perf_counter() - t0) * 1000)
+    q = quantiles(lat, n=100)
+    return results, {"p50": q[49], "p99": q[98]}
+
+
+def recall(approx: list, exact: list) -> float:
+    return float(np.mean([len({h[0] for h in a} & {h[0] for h in e}) / max(1, len(e)) for a, e in zip(approx, exact)]))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--dim", type=int, default=128)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32])
+    ap.add_argument("--doctors", type=int, nargs="+", default=[1, 100])
+    args = ap.parse_args()
+
+    indexes = ["ivf"] + (["hnsw"] if vector_store.hnswlib is not None else [])
+    print(f"dim={args.dim} k={args.k} (hnswlib {'found' if 'hnsw' in indexes else 'not installed: skipped'})")
+    print(f"{'rows':>9} {'doctors':>7} {'search':>14} {'build s':>8} {'p50 ms':>8} {'p99 ms':>8} {'recall':>7}")
+    for n, doctors in ((n, d) for n in args.sizes for d in args.doctors):
+        data = dataset(n, args.dim)
+        rnd = np.random.default_rng(1)
+        own = np.arange(0, n, doctors)  # "doc0"'s rows, the queried doctor
+        queries = data[rnd.choice(own, size=args.queries)] + 0.3 * rnd.normal(size=(args.queries, args.dim)).astype(np.float32)
+        ids = np.array([str(i) for i in range(n)])
+
+        store = VectorStore(args.dim, capacity=n, ann_min_rows=0)
+        for d in range(doctors):
+            store.add(ids[d::doctors].tolist(), data[d::doctors], doctor_id=f"doc{d}")
+        row = f"{n:>9} {doctors:>7}"
+        exact, r = timed(lambda q: store.search(q, "doc0", args.k, exact=True), queries)
+        print(f"{row} {'exact':>14} {'':>8} {r['p50']:>8.2f} {r['p99']:>8.2f} {1.0:>7.3f}")
+
+        t0 = time.perf_counter()
+        batch = store.search(queries, "doc0", args.k, exact=True)
+        per_q = (time.perf_counter() - t0) * 1000 / len(queries)
+        print(f"{row} {'exact, batched':>14} {'':>8} {per_q:>8.2f} {'':>8} {recall(batch, exact):>7.3f}  (per query)")
+
+        for kind in indexes:
+            store.index_kind = kind
+            t0 = time.perf_counter()
+            store.build_index()
+            build = time.perf_counter() - t0
+            for nprobe in (args.nprobe if kind == "ivf" else [None]):
+                if nprobe is not None:
+                    store._ann.nprobe = nprobe
+                approx, r = timed(lambda q: store.search(q, "doc0", args.k), queries)
+                label = f"ivf/{nprobe}" if nprobe else kind
+                print(f"{row} {label:>14} {build:>8.2f} {r['p50']:>8.2f} {r['p99']:>8.2f} {recall(approx, exact):>7.3f}")
+
+        path = tempfile.mkdtemp()
+        try:
+            t0 = time.perf_counter()
+            store.save(path)
+            save = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            VectorStore.open(path)
+            print(f"{row} {'save / open':>14} {save:>8.2f} {(time.perf_counter() - t0) * 1000:>8.1f}  (open ms, memmap)")
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    main()
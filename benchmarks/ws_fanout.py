@@ -0,0 +1,154 @@
+# benchmarks/ws_fanout.py
+"""
+services.ws_hub at 10k simulated websockets spread over several workers:
+
+    python -m app.benchmarks.ws_fanout --connections 10000 --workers 4
+    python -m app.benchmarks.ws_fanout --redis-url redis://localhost:6379/15
+
+Each "worker" is a FanoutHub with its own Redis client (fakeredis by default, all on
+one FakeServer, so the pub/sub path is real but the network is not). Every doctor
+has --tabs sockets placed on different workers. Per round, each doctor gets one
+lab-result event and --progress note-progress events that share a coalescing key.
+A --slow fraction of sockets take --slow-ms per frame, and --stuck sockets never
+finish a send (they must be closed, not buffered forever).
+
+Reported per flush setting: Redis subscriptions (one per worker and topic, not per
+socket), frames and events written to sockets, coalesced/dropped events, laggards
+closed, and publish-to-socket latency for the healthy sockets. Every healthy tab
+must receive every lab result.
+"""
+import argparse, asyncio, json, logging, random, time
+from statistics import quantiles
+
+from app.services.ws_hub import FanoutHub
+
+
+class FakeSocket:
+    def __init__(self, delay_s: float = 0.0, stuck: bool = False):
+        self.delay_s, self.stuck = delay_s, stuck
+        self.frames = self.labs = 0
+        self.latencies: list = []
+        self.closed_with = None
+
+    async def send(self, frame: str):
+        if self.stuck:
+            await asyncio.Event().wait()
+        if self.delay_s:
+            await asyncio.sleep(self.delay_s)
+        now = time.perf_counter()
+        msg = json.loads(frame)
+        for ev in msg["events"] if msg.get("type") == "batch" else [msg]:
+            if "t" in ev:
+                self.latencies.append(now - ev["t"])
+                self.labs += ev["type"] == "lab_result"
+        self.frames += 1
+
+    async def close(self, code: int):
+        self.closed_with = code
+
+
+def redis_client(args, server):
+    if args.redis_url:
+        from redis.asyncio import Redis
+        return Redis.from_url(args.redis_url)
+    import fakeredis
+    return fakeredis.aioredis.FakeRedis(server=server)
+
+
+async def run(args, flush_ms: float) -> dict:
+    server = None
+    if not args.redis_url:
+        import fakeredis
+        server = fakeredis.FakeServer()
+    hubs = [
+        FanoutHub(args.queue, args.batch_max, flush_ms, args.send_timeout_s, redis=redis_client(args, server))
+        for _ in range(args.workers)
+    ]
+    for hub in hubs:
+        hub.start()
+    await asyncio.sleep(0.2)  # pub/sub connections up
+
+    rnd = random.Random(0)
+    users = [f"doctor-{i}" for i in range(args.connections // args.tabs)]
+    sockets, subs = [], []
+    for i, uid in enumerate(users):
+        for t in range(args.tabs):
+            r = rnd.random()
+            sock = FakeSocket(
+                delay_s=args.slow_ms / 1000 if r < args.slow else 0.0,
+                stuck=args.slow <= r < args.slow + args.stuck,
+            )
+            hub = hubs[(i + t) % len(hubs)]
+            subs.append((hub, await hub.connect(uid, sock.send, sock.close)))
+            sockets.append(sock)
+    subscriptions = sum(len(hub._topics) for hub in hubs)
+
+    t0 = time.perf_counter()
+    for rnd_no in range(args.rounds):
+        for i, uid in enumerate(users):
+            pub = hubs[i % len(hubs)]  # the worker that handled the request publishes
+            await pub.publish(f"user:{uid}", {"type": "lab_result", "round": rnd_no, "t": time.perf_counter()})
+            for p in range(args.progress):
+                await pub.publish(
+                    f"user:{uid}", {"type": "note_progress", "pct": p, "t": time.perf_counter()}, key=f"note:{uid}"
+                )
+        await asyncio.sleep(args.round_gap_ms / 1000)
+    # let healthy sockets drain; stuck ones are closed after send_timeout_s
+    await asyncio.sleep(max(args.send_timeout_s, flush_ms / 1000) + 0.5)
+    wall = time.perf_counter() - t0
+
+    healthy = [s for s in sockets if not s.stuck and not s.delay_s]
+    lat = sorted(x for s in healthy for x in s.latencies)
+    q = quantiles(lat, n=100) if len(lat) > 1 else [0] * 99
+    res = {
+        "subscriptions": subscriptions,
+        "published": sum(h.published for h in hubs),
+        "frames": sum(s.frames for s in sockets),
+        "events": sum(sub.sent for _, sub in subs),
+        "coalesced": sum(sub.coalesced for _, sub in subs),
+        "dropped": sum(sub.dropped for _, sub in subs),
+        "closed": sum(s.closed_with is not None for s in sockets),
+        "stuck": sum(s.stuck for s in sockets),
+        "lost_labs": sum(args.rounds - s.labs for s in healthy),
+        "p50_ms": q[49] * 1000, "p99_ms": q[98] * 1000, "wall_s": wall,
+    }
+    for hub, sub in subs:
+        await hub.disconnect(sub)
+    for hub in hubs:
+        await hub.close()
+    return res
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--connections", type=int, default=10_000)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--tabs", type=int, default=3)
+    ap.add_argument("--rounds", type=int, default=5)
+    ap.add_argument("--progress", type=int, default=5, help="coalescible events per doctor per round")
+    ap.add_argument("--round-gap-ms", type=float, default=100)
+    ap.add_argument("--slow", type=float, default=0.01, help="fraction of sockets that are slow")
+    ap.add_argument("--slow-ms", type=float, default=200)
+    ap.add_argument("--stuck", type=float, default=0.002, help="fraction that never finish a send")
+    ap.add_argument("--queue", type=int, default=256)
+    ap.add_argument("--batch-max", type=int, default=64)
+    ap.add_argument("--send-timeout-s", type=float, default=2.0)
+    ap.add_argument("--flush-ms", type=float, nargs="+", default=[0, 20])
+    ap.add_argument("--redis-url", help="real Redis instead of fakeredis")
+    args = ap.parse_args()
+    logging.getLogger("app.services.ws_hub").setLevel(logging.ERROR)
+
+    print(f"{args.connections} sockets ({args.tabs} tabs per doctor) on {args.workers} workers, "
+          f"{args.rounds} rounds of 1 + {args.progress} coalescible events per doctor, "
+          f"{args.slow:.1%} slow, {args.stuck:.1%} stuck, {'Redis' if args.redis_url else 'fakeredis'}")
+    print(f"{'flush ms':>8} {'subs':>6} {'published':>10} {'frames':>8} {'events':>8} {'coalesced':>10} "
+          f"{'dropped':>8} {'closed/stuck':>13} {'lost':>5} {'p50 ms':>7} {'p99 ms':>7} {'wall s':>7}")
+    for flush_ms in args.flush_ms:
+        r = await run(args, flush_ms)
+        print(f"{flush_ms:>8g} {r['subscriptions']:>6} {r['published']:>10} {r['frames']:>8} {r['events']:>8} "
+              f"{r['coalesced']:>10} {r['dropped']:>8} {str(r['closed']) + '/' + str(r['stuck']):>13} "
+              f"{r['lost_labs']:>5} {r['p50_ms']:>7.1f} {r['p99_ms']:>7.1f} {r['wall_s']:>7.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
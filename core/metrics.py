@@ -0,0 +1,117 @@
+# app/core/metrics.py
+"""
+Prometheus metrics. Set PROMETHEUS_MULTIPROC_DIR (an empty dir, wiped on deploy) when
+running several uvicorn workers: each process then writes its own mmap file and
+/metrics aggregates them, so recording never crosses a process boundary.
+
+Record through `child(metric, *labels)`, not `metric.labels(...)`: `.labels()` takes the
+metric's lock on every call, `child` is a plain dict lookup after the first. Children
+with a fixed label set are bound at import (so they also export as 0 before their first
+event). What remains on the hot path is the one uncontended lock prometheus_client holds
+around each value update, in-process or mmap; replacing it would mean our own collector
+plus a cross-worker flush, since the worker answering a scrape cannot read another
+worker's in-memory counts. That lock is kept on purpose.
+"""
+import os, time
+from contextlib import contextmanager
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+_MULTIPROC = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time to response start, by route template",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being served", multiprocess_mode="livesum")
+RATE_LIMIT_REJECTIONS = Counter("rate_limit_rejections_total", "Requests rejected with 429", ["rule"])
+
+ASR_QUEUE_DEPTH = Gauge("asr_queue_depth", "Transcriptions waiting for a batch", multiprocess_mode="livesum")
+ASR_INFERENCE = Histogram(
+    "asr_inference_seconds", "Wall time of one batched ASR call",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64),
+)
+ASR_BATCH_SIZE = Histogram("asr_batch_size", "Requests per ASR call", buckets=(1, 2, 4, 8, 16, 32))
+
+DB_POOL_CHECKOUTS = Counter("db_pool_checkouts_total", "Connections checked out of the SQLAlchemy pool")
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections currently checked out", multiprocess_mode="livesum")
+
+LLM_NOTE_FIRST_SECTION = Histogram(
+    "llm_note_first_section_seconds", "Streaming SOAP note: request to first completed section",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32),
+)
+LLM_NOTE_STREAMS = Gauge("llm_note_streams", "Streaming SOAP notes in progress", multiprocess_mode="livesum")
+LLM_NOTE_CANCELLED = Counter("llm_note_cancelled_total", "Streaming SOAP notes abandoned before completion")
+
+AUDIT_QUEUE_DEPTH = Gauge("audit_queue_depth", "Audit events waiting to be written", multiprocess_mode="livesum")
+AUDIT_EVENTS = Counter("audit_events_total", "Audit events by outcome", ["outcome"])  # written, spilled, replayed, rejected
+AUDIT_FLUSH = Histogram(
+    "audit_flush_seconds", "One batched audit_log write",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+
+UPLOADS_REJECTED = Counter("uploads_rejected_total", "Uploads refused while streaming", ["reason"])  # too_large, unsupported_type
+
+DICOM_SLICES = Counter("dicom_slices_total", "Uploaded DICOM slices by outcome", ["outcome"])  # stored, rejected
+
+WS_CONNECTIONS = Gauge("ws_hub_connections", "Websockets registered with the fan-out hub", multiprocess_mode="livesum")
+WS_EVENTS = Counter("ws_hub_events_total", "Events offered to sockets by outcome", ["outcome"])  # queued, coalesced, dropped
+WS_SLOW_CLOSED = Counter("ws_hub_slow_closed_total", "Sockets closed for not keeping up")
+
+REDIS_LATENCY = Histogram(
+    "redis_command_seconds", "Redis round trip by call site", ["op"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5),
+)
+
+_CHILDREN: dict = {}
+
+def child(metric, *labels):
+    """metric.labels(*labels), memoized."""
+    c = _CHILDREN.get((metric, labels))
+    if c is None:
+        c = _CHILDREN[(metric, labels)] = metric.labels(*labels)
+    return c
+
+for _metric, _values in (
+    (AUDIT_EVENTS, ("written", "spilled", "replayed", "rejected")),
+    (UPLOADS_REJECTED, ("too_large", "unsupported_type")),
+    (DICOM_SLICES, ("stored", "rejected")),
+    (WS_EVENTS, ("queued", "coalesced", "dropped")),
+):
+    for _value in _values:
+        child(_metric, _value)
+
+@contextmanager
+def redis_timer(op: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        child(REDIS_LATENCY, op).observe(time.perf_counter() - start)
+
+def instrument_engine(engine):
+    from sqlalchemy import event
+    pool = engine.sync_engine.pool
+
+    @event.listens_for(pool, "checkout")
+    def _checkout(*_):
+        DB_POOL_CHECKOUTS.inc()
+        DB_POOL_CHECKED_OUT.inc()
+
+    @event.listens_for(pool, "checkin")
+    def _checkin(*_):
+        DB_POOL_CHECKED_OUT.dec()
+
+def render_latest() -> tuple[bytes, str]:
+    if _MULTIPROC:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def mark_process_dead():
+    if _MULTIPROC:
+        multiprocess.mark_process_dead(os.getpid())
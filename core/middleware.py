@@ -1,55 +1,148 @@
-import time, uuid, ipaddress, asyncio
-from typing import Callable
-from starlette.types import ASGIApp, Receive, Scope, Send
-from starlette.middleware.base import BaseHTTPMiddleware
+import time, uuid, ipaddress, math
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from starlette.responses import JSONResponse
-from redis.asyncio import from_url as redis_from_url
 from app.config import settings
+from app.core.metrics import HTTP_IN_FLIGHT, HTTP_LATENCY, RATE_LIMIT_REJECTIONS, child
+from app.core.rate_limit import RateLimiter
+from app.core.redis_pool import get_redis
+from app.core.security import token_cache
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        resp = await call_next(request)
-        resp.headers.update({
-            "X-Content-Type-Options": "nosniff",
-            "X-Frame-Options": "DENY",
-            "Referrer-Policy": "no-referrer",
-            "Permissions-Policy": "camera=(), microphone=(), geolocation=()",
-            "Content-Security-Policy": "default-src 'self' 'unsafe-inline' data: blob:"
-        })
-        return resp
-
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
+# Pure ASGI middlewares: headers are patched on `http.response.start`, bodies are never
+# buffered or re-wrapped, and non-HTTP scopes (websocket, lifespan) pass straight through.
+
+_SECURITY_HEADERS = {
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "DENY",
+    "Referrer-Policy": "no-referrer",
+    "Permissions-Policy": "camera=(), microphone=(), geolocation=()",
+    "Content-Security-Policy": "default-src 'self' 'unsafe-inline' data: blob:"
+}
+
+class SecurityHeadersMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).update(_SECURITY_HEADERS)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+class LoggingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
         rid = str(uuid.uuid4())
-        request.state.request_id = rid
+        # request.state is backed by scope["state"]
+        scope.setdefault("state", {})["request_id"] = rid
         start = time.perf_counter()
-        resp = await call_next(request)
-        dur_ms = (time.perf_counter() - start) * 1000
-        resp.headers["X-Request-ID"] = rid
-        resp.headers["Server-Timing"] = f"total;dur={dur_ms:.1f}"
-        return resp
+        status, dur = 500, None
+
+        async def send_wrapper(message: Message):
+            nonlocal status, dur
+            if message["type"] == "http.response.start":
+                status, dur = message["status"], time.perf_counter() - start
+                headers = MutableHeaders(scope=message)
+                headers["X-Request-ID"] = rid
+                headers["Server-Timing"] = f"total;dur={dur * 1000:.1f}"
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # Route template (set on the scope by the router) keeps label cardinality bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            child(HTTP_LATENCY, scope["method"], route, str(status)).observe(
+                dur if dur is not None else time.perf_counter() - start
+            )
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
+def _bearer_subject(scope: Scope) -> str | None:
+    # Signature-verified through the shared token cache (get_current_user hits the same
+    # entry), so a forged token cannot pick someone else's bucket or a fresh one per request.
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            try:
+                claims = token_cache.decode(token).claims
+            except Exception:
+                return None
+            sub = claims.get("sub") or claims.get("user_id")
+            return str(sub) if sub else None
+    return None
+
+class RateLimitMiddleware:
     """
-    Simple fixed-window per-IP rate limit using Redis (1-minute window).
+    GCRA limits per IP, per user and per route (see core.rate_limit), one Redis script
+    call per lease refill. Fails open on Redis errors.
     """
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
-        self.redis = redis_from_url(settings.REDIS_URL)
+        self.app = app
+        self.limiter = RateLimiter(
+            get_redis(),
+            settings.RATE_LIMIT_LEASE_DIVISOR,
+            settings.RATE_LIMIT_LEASE_TTL_S,
+        )
         self.limit = settings.RATE_LIMIT_REQUESTS_PER_MINUTE
+        self.user_limit = settings.RATE_LIMIT_USER_REQUESTS_PER_MINUTE
+        # longest prefix first so /api/v1/medical/stt wins over /api/v1/medical
+        self.routes = sorted(settings.RATE_LIMIT_ROUTES.items(), key=lambda kv: -len(kv[0]))
+        self.anonymous = tuple(settings.RATE_LIMIT_ANONYMOUS_ROUTES)
+
+    def _rules(self, scope: Scope, ip: str) -> list[tuple[str, int]]:
+        rules = [(f"rl:ip:{ip}", self.limit)]
+        user = _bearer_subject(scope)
+        if user and self.user_limit:
+            rules.append((f"rl:user:{user}", self.user_limit))
+        path = scope.get("path", "")
+        for prefix, limit in self.routes:
+            if path.startswith(prefix):
+                # sign-in routes are per IP whatever token comes along
+                who = ip if path.startswith(self.anonymous) or not user else user
+                rules.append((f"rl:route:{prefix}:{who}", limit))
+                break
+        return rules
 
-    async def dispatch(self, request, call_next: Callable):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        remaining = None
         try:
-            ip = request.client.host or "0.0.0.0"
+            ip = (scope.get("client") or ("0.0.0.0", 0))[0] or "0.0.0.0"
             # normalize IP
-            ipaddress.ip_address(ip)
-            key = f"rl:{ip}"
-            cur = await self.redis.incr(key)
-            if cur == 1:
-                await self.redis.expire(key, 60)
-            if cur > self.limit:
-                return JSONResponse({"detail": "Rate limit exceeded"}, status_code=429)
+            ip = str(ipaddress.ip_address(ip))
+            for key, limit in self._rules(scope, ip):
+                decision = await self.limiter.acquire(key, limit)
+                if not decision.allowed:
+                    child(RATE_LIMIT_REJECTIONS, key.split(":", 2)[1]).inc()
+                    resp = JSONResponse(
+                        {"detail": "Rate limit exceeded"},
+                        status_code=429,
+                        headers={"Retry-After": str(max(1, math.ceil(decision.retry_after))), "X-RateLimit-Remaining": "0"},
+                    )
+                    return await resp(scope, receive, send)
+                remaining = decision.remaining if remaining is None else min(remaining, decision.remaining)
         except Exception:
             # fail-open on Redis errors
             pass
-        return await call_next(request)
+        if remaining is None:
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-RateLimit-Remaining"] = str(remaining)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,45 @@
+# app/core/redis_pool.py
+"""
+One Redis connection pool per process, shared by the rate limiter, caches and health
+checks. Created lazily (middleware is built before lifespan runs), warmed in lifespan
+startup and closed on shutdown.
+"""
+from typing import Optional
+from redis.asyncio import ConnectionPool, Redis
+from app.config import settings
+
+_pool: Optional[ConnectionPool] = None
+_client: Optional[Redis] = None
+
+def get_redis() -> Redis:
+    """Shared client; also usable as a FastAPI dependency."""
+    global _pool, _client
+    if _client is None:
+        _pool = ConnectionPool.from_url(
+            settings.REDIS_URL,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT_S,
+            socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT_S,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL_S,
+        )
+        _client = Redis(connection_pool=_pool)
+    return _client
+
+async def init_redis():
+    try:
+        await get_redis().ping()
+    except Exception:
+        pass  # Redis-backed features fail open; health checks will report it
+
+async def close_redis():
+    global _pool, _client
+    if _client is not None:
+        await _client.close()
+        await _pool.disconnect()
+        _pool = _client = None
+
+def redis_pool_stats() -> dict:
+    if _pool is None:
+        return {"max_connections": settings.REDIS_MAX_CONNECTIONS, "created": 0, "in_use": 0, "idle": 0}
+    in_use, idle = len(_pool._in_use_connections), len(_pool._available_connections)
+    return {"max_connections": _pool.max_connections, "created": in_use + idle, "in_use": in_use, "idle": idle}
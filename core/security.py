@@ -1,15 +1,27 @@
 # app/core/security.py
 from datetime import datetime, timedelta, timezone
 from typing import Any, Optional
+from collections import OrderedDict
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-import os
+from concurrent.futures import ThreadPoolExecutor
+from app.core.exceptions import APIException
+import asyncio, hashlib, logging, os, time
+
+logger = logging.getLogger(__name__)
 
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "dev_jwt_secret_change_me")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_EXPIRES_MIN = int(os.getenv("JWT_EXPIRES_DELTA", "1440"))  # minutes
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+JWT_REVOCATION_RECHECK_S = float(os.getenv("JWT_REVOCATION_RECHECK_S", "5"))  # max delay before a logout is seen by other workers
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "32"))  # waiting logins beyond this get a 503
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes with fewer rounds than BCRYPT_ROUNDS count as outdated -> rehashed on next successful login
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 def verify_password(plain: str, hashed: str) -> bool:
     return pwd_context.verify(plain, hashed)
@@ -17,6 +29,31 @@ def verify_password(plain: str, hashed: str) -> bool:
 def hash_password(plain: str) -> str:
     return pwd_context.hash(plain)
 
+class PasswordHashBusy(APIException):
+    def __init__(self):
+        super().__init__("Too many concurrent sign-ins, retry shortly", status_code=503)
+
+# bcrypt releases the GIL, so a small dedicated thread pool keeps it off the event loop
+# without competing with the default executor used by everything else.
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE)
+
+async def _run_hash(fn, *args):
+    if _hash_slots.locked():
+        raise PasswordHashBusy()
+    async with _hash_slots:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+
+async def hash_password_async(plain: str) -> str:
+    return await _run_hash(pwd_context.hash, plain)
+
+async def verify_password_async(plain: str, hashed: str) -> tuple[bool, Optional[str]]:
+    """
+    Returns (valid, new_hash). new_hash is set when the stored hash uses outdated
+    parameters (e.g. BCRYPT_ROUNDS was raised); persist it in place of the old one.
+    """
+    return await _run_hash(pwd_context.verify_and_update, plain, hashed)
+
 def create_access_token(subject: dict[str, Any], expires_minutes: Optional[int] = None) -> str:
     expire = datetime.now(tz=timezone.utc) + timedelta(minutes=expires_minutes or JWT_EXPIRES_MIN)
     to_encode = {**subject, "exp": expire}
@@ -27,3 +64,81 @@ def decode_token(token: str) -> dict[str, Any]:
         return jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
     except JWTError as e:
         raise ValueError(str(e))
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class CachedToken:
+    __slots__ = ("digest", "exp", "claims", "checked_at", "user")
+
+    def __init__(self, digest: str, exp: float, claims: dict[str, Any]):
+        self.digest = digest
+        self.exp = exp
+        self.claims = claims
+        self.checked_at = 0.0  # last revocation check (monotonic)
+        self.user = None       # per-token object built by the caller (e.g. CurrentUser), reused on hits
+
+    @property
+    def needs_revocation_check(self) -> bool:
+        return time.monotonic() - self.checked_at > JWT_REVOCATION_RECHECK_S
+
+class VerifiedTokenCache:
+    """
+    LRU of signature-verified claims keyed by token digest. Entries die at the token's
+    own `exp`, so a cached token never outlives what jwt.decode would accept.
+    """
+    def __init__(self, max_entries: int = JWT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lru: OrderedDict[str, CachedToken] = OrderedDict()
+        self.hits = self.misses = 0
+
+    def decode(self, token: str) -> CachedToken:
+        digest = token_digest(token)
+        entry = self._lru.get(digest)
+        if entry is not None:
+            if entry.exp > time.time():
+                self._lru.move_to_end(digest)
+                self.hits += 1
+                return entry
+            del self._lru[digest]
+        self.misses += 1
+        claims = decode_token(token)
+        entry = CachedToken(digest, float(claims.get("exp") or 0), claims)
+        if entry.exp:
+            self._lru[digest] = entry
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+        return entry
+
+    def discard(self, digest: str):
+        self._lru.pop(digest, None)
+
+token_cache = VerifiedTokenCache()
+
+def _revoked_key(digest: str) -> str:
+    return f"jwt:revoked:{digest}"
+
+async def revoke_token(token: str):
+    """
+    Denylist a token until it expires (shared via Redis) and drop it from this worker's
+    cache. Raises ValueError for a token that does not verify: only our own signed
+    `exp` may set how long a denylist key lives.
+    """
+    from app.core.redis_pool import get_redis
+    entry = token_cache.decode(token)
+    digest = entry.digest
+    exp = int(entry.exp or time.time() + JWT_EXPIRES_MIN * 60)
+    token_cache.discard(digest)
+    if exp > time.time():
+        try:
+            await get_redis().set(_revoked_key(digest), 1, exat=exp)
+        except Exception as e:
+            # logout still succeeds; other workers keep accepting the token until it expires
+            logger.warning("could not denylist token in Redis: %s", e)
+
+async def is_token_revoked(digest: str) -> bool:
+    from app.core.redis_pool import get_redis
+    try:
+        return bool(await get_redis().exists(_revoked_key(digest)))
+    except Exception:
+        return False  # fail-open on Redis errors, like the rate limiter
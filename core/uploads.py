@@ -0,0 +1,249 @@
+# app/core/uploads.py
+"""
+Bounded-memory file uploads for the medical routers.
+
+`UploadFile` + `await f.read()` parses the whole body before the route runs and then
+materialises the file as one bytes object. `read_upload` parses the multipart body
+as it arrives instead and, for the one file part it expects:
+
+  - rejects early: a Content-Length over the limit before reading anything, a part
+    that grows past the limit as soon as it does (413), and a part whose first bytes
+    are not an accepted type (415)
+  - hashes every chunk as it passes (sha-256, the transcript cache key)
+  - keeps the bytes in a SpooledUpload: in memory up to UPLOAD_SPOOL_MB, then in an
+    unlinked temp file. Consumers get `view()`, a memoryview of the buffer or of an
+    mmap of the file, never a copy
+
+Peak memory per request is then about UPLOAD_SPOOL_MB whatever the file size.
+"""
+from typing import Optional
+import asyncio, hashlib, mmap, tempfile
+
+from fastapi import Request
+from multipart.multipart import MultipartParser, parse_options_header
+
+from app.config import settings
+from app.core.exceptions import APIException
+from app.core.metrics import UPLOADS_REJECTED, child
+
+SNIFF_BYTES = 132               # enough for the DICOM preamble + "DICM"
+_FLUSH_BYTES = 1 << 20          # once spooled to disk, write in 1 MB runs
+_ENVELOPE_BYTES = 64 * 1024     # boundaries, part headers and form fields on top of the file
+_MAX_FIELD_BYTES = 64 * 1024
+_MAX_FIELDS = 32
+
+AUDIO_TYPES = frozenset({"audio/wav", "audio/webm", "audio/ogg", "audio/mp4", "audio/flac", "audio/mpeg"})
+
+def sniff_content_type(head: bytes) -> Optional[str]:
+    """Media type from magic bytes; clients' declared types are not trusted."""
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "audio/wav"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return "audio/webm"  # EBML: webm/matroska
+    if head[:4] == b"OggS":
+        return "audio/ogg"
+    if head[4:8] == b"ftyp":
+        return "audio/mp4"  # m4a/mp4 (browser MediaRecorder on Safari)
+    if head[:4] == b"fLaC":
+        return "audio/flac"
+    if head[128:132] == b"DICM":
+        return "application/dicom"
+    if head[:5] == b"%PDF-":
+        return "application/pdf"
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if head[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if head[:3] == b"ID3" or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return "audio/mpeg"
+    return None
+
+def _reject(reason: str, detail: str, status_code: int) -> APIException:
+    child(UPLOADS_REJECTED, reason).inc()
+    return APIException(detail, status_code=status_code)
+
+class SpooledUpload:
+    """
+    One uploaded file: in memory up to `spool_bytes`, then an unlinked temp file.
+    Use as a context manager (or call close()) once the consumers are done.
+    """
+    def __init__(self, filename: str, declared_type: str, spool_bytes: int, spool_dir: Optional[str] = None):
+        self.filename = filename
+        self.declared_type = declared_type
+        self.content_type: Optional[str] = None  # sniffed from `head`
+        self.head = b""
+        self.size = 0
+        self.spool_bytes = spool_bytes
+        self.spool_dir = spool_dir or None
+        self._hash = hashlib.sha256()
+        self._buf = bytearray()
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+
+    @property
+    def digest(self) -> str:
+        return self._hash.hexdigest()
+
+    @property
+    def rolled(self) -> bool:
+        return self._file is not None
+
+    def write(self, data: bytes | memoryview):
+        if len(self.head) < SNIFF_BYTES:
+            self.head += bytes(data[:SNIFF_BYTES - len(self.head)])
+        self.size += len(data)
+        self._hash.update(data)
+        self._buf += data
+
+    def needs_flush(self) -> bool:
+        return len(self._buf) >= (_FLUSH_BYTES if self._file is not None else self.spool_bytes + 1)
+
+    def flush(self):
+        """Move buffered bytes to the temp file (blocking: run off the loop)."""
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(dir=self.spool_dir)
+        self._file.write(self._buf)
+        self._buf = bytearray()
+
+    def view(self) -> memoryview:
+        """The whole file without copying; valid until close()."""
+        if self._file is None:
+            return memoryview(self._buf)
+        if self._mmap is None:
+            self._file.flush()
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self._mmap)
+
+    def close(self):
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # a consumer still holds a view (e.g. a shielded transcription); unmapped with it
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._buf = bytearray()
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class _Form:
+    """python-multipart callbacks: the `field` file part goes to a SpooledUpload, text fields to a dict."""
+    def __init__(self, field: str, max_bytes: int, accept: frozenset[str], spool_bytes: int, spool_dir: str):
+        self.field = field
+        self.max_bytes = max_bytes
+        self.accept = accept
+        self.spool_bytes = spool_bytes
+        self.spool_dir = spool_dir
+        self.upload: Optional[SpooledUpload] = None
+        self.fields: dict[str, str] = {}
+        self._headers: dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._target = None  # SpooledUpload, or [name, bytearray] for a text field
+        self.sniffed = False
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._part_begin,
+            "on_header_field": lambda d, s, e: setattr(self, "_header_field", self._header_field + d[s:e]),
+            "on_header_value": lambda d, s, e: setattr(self, "_header_value", self._header_value + d[s:e]),
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        }
+
+    def _part_begin(self):
+        self._headers, self._target = {}, None
+
+    def _header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field, self._header_value = b"", b""
+
+    def _headers_finished(self):
+        _, opts = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = opts.get(b"name", b"").decode("utf-8", "replace")
+        if b"filename" not in opts:
+            if len(self.fields) >= _MAX_FIELDS:
+                raise _reject("too_large", "Too many form fields", 413)
+            self._target = [name, bytearray()]
+            return
+        if name != self.field or self.upload is not None:
+            raise APIException(f"Expected a single file in field '{self.field}'", status_code=400)
+        declared = self._headers.get(b"content-type", b"").decode("latin-1")
+        self.upload = SpooledUpload(
+            opts[b"filename"].decode("utf-8", "replace"), declared, self.spool_bytes, self.spool_dir
+        )
+        self._target = self.upload
+
+    def _part_data(self, data: bytes, start: int, end: int):
+        target = self._target
+        if target is None:
+            return
+        if isinstance(target, list):
+            if len(target[1]) + end - start > _MAX_FIELD_BYTES:
+                raise _reject("too_large", f"Form field '{target[0]}' is too large", 413)
+            target[1] += data[start:end]
+            return
+        if target.size + end - start > self.max_bytes:
+            raise _reject("too_large", f"File larger than {self.max_bytes >> 20} MB", 413)
+        target.write(memoryview(data)[start:end])
+        if not self.sniffed and target.size >= SNIFF_BYTES:
+            self.check_type()
+
+    def _part_end(self):
+        if isinstance(self._target, list):
+            self.fields[self._target[0]] = self._target[1].decode("utf-8", "replace")
+        self._target = None
+
+    def check_type(self):
+        """415 unless the first bytes are an accepted type; the part may still be arriving."""
+        self.sniffed = True
+        upload = self.upload
+        if upload is None or upload.size == 0:
+            return
+        upload.content_type = sniff_content_type(upload.head)
+        if upload.content_type not in self.accept:
+            raise _reject("unsupported_type", "Unsupported file type", 415)
+
+async def read_upload(
+    request: Request,
+    field: str,
+    max_bytes: int,
+    accept: frozenset[str],
+) -> tuple[SpooledUpload, dict[str, str]]:
+    """
+    Read a multipart/form-data body with one file part named `field` and any small
+    text fields. Returns (upload, fields); the caller owns and closes the upload.
+    """
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > max_bytes + _ENVELOPE_BYTES:
+        raise _reject("too_large", f"File larger than {max_bytes >> 20} MB", 413)
+    ctype, opts = parse_options_header(request.headers.get("content-type", ""))
+    if ctype != b"multipart/form-data" or b"boundary" not in opts:
+        raise APIException("Expected multipart/form-data", status_code=415)
+    form = _Form(field, max_bytes, accept, settings.UPLOAD_SPOOL_MB << 20, settings.UPLOAD_SPOOL_DIR)
+    parser = MultipartParser(opts[b"boundary"], form.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if form.upload is not None and form.upload.needs_flush():
+                await asyncio.to_thread(form.upload.flush)
+        parser.finalize()
+        if form.upload is None:
+            raise APIException(f"Missing file field '{field}'", status_code=422)
+        if not form.sniffed:
+            form.check_type()  # shorter than SNIFF_BYTES
+        if form.upload.rolled:
+            await asyncio.to_thread(form.upload.flush)
+    except BaseException:
+        if form.upload is not None:
+            form.upload.close()
+        raise
+    return form.upload, form.fields
@@ -2,10 +2,35 @@ from typing import AsyncGenerator, Optional
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
 from sqlalchemy import text
 from app.config import settings
+from app.core.metrics import instrument_engine
 
-engine: AsyncEngine = create_async_engine(settings.DATABASE_URL, pool_pre_ping=True)
+def _connect_args() -> dict:
+    if not settings.DATABASE_URL.startswith("postgresql+asyncpg"):
+        return {}
+    return {
+        # asyncpg server-side statement cache; set both to 0 behind pgbouncer in transaction mode
+        "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+    }
+
+engine: AsyncEngine = create_async_engine(
+    settings.DATABASE_URL,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_recycle=settings.DB_POOL_RECYCLE_S,
+    pool_timeout=settings.DB_POOL_TIMEOUT_S,
+    connect_args=_connect_args(),
+)
+instrument_engine(engine)
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+# Both settings are transaction-local (is_local=true == SET LOCAL); `role` is a GUC, so
+# set_config('role', ...) is equivalent to SET LOCAL ROLE and lets us do it in one round trip.
+RLS_CONTEXT_SQL = text(
+    "SELECT set_config('app.current_user_id', :uid, true), set_config('role', 'authenticated_users', true)"
+)
+
 async def get_db(user_id: Optional[str] = None) -> AsyncGenerator[AsyncSession, None]:
     """
     Yields an AsyncSession and sets per-transaction GUC + ROLE for RLS.
@@ -16,9 +41,7 @@ async def get_db(user_id: Optional[str] = None) -> AsyncGenerator[AsyncSession,
         # Bind session to current user for RLS policies:
         #   USING (doctor_id = current_setting('app.current_user_id')::uuid)
         if user_id:
-            await session.execute(text("SET LOCAL app.current_user_id = :uid"), {"uid": user_id})
-            # Adopt role required by your RLS policies
-            await session.execute(text("SET LOCAL ROLE authenticated_users"))
+            await session.execute(RLS_CONTEXT_SQL, {"uid": user_id})
         yield session
 
 async def create_tables():
@@ -1,10 +1,12 @@
 # app/deps/auth.py
-from fastapi import Depends, HTTPException, status
+import time
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
 from typing import Optional
-from app.core.security import decode_token
+from app.core.security import is_token_revoked, token_cache
 from app.database import get_db
+from app.services.audit_service import audit_writer
 from sqlalchemy.ext.asyncio import AsyncSession
 
 # Matches your router prefix: /api/v1/auth/token
@@ -16,12 +18,22 @@ class CurrentUser(BaseModel):
     role: Optional[str] = "doctor"
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> CurrentUser:
+    # Verified claims (and the CurrentUser built from them) are cached per token until exp;
+    # revocation is re-checked at most every JWT_REVOCATION_RECHECK_S.
     try:
-        payload = decode_token(token)
-        uid = str(payload.get("sub") or payload.get("user_id"))
-        if not uid:
-            raise ValueError("Missing sub")
-        return CurrentUser(id=uid, email=payload.get("email"), role=payload.get("role", "doctor"))
+        entry = token_cache.decode(token)
+        if entry.needs_revocation_check:
+            if await is_token_revoked(entry.digest):
+                token_cache.discard(entry.digest)
+                raise ValueError("Revoked")
+            entry.checked_at = time.monotonic()
+        if entry.user is None:
+            payload = entry.claims
+            uid = str(payload.get("sub") or payload.get("user_id") or "")
+            if not uid:
+                raise ValueError("Missing sub")
+            entry.user = CurrentUser(id=uid, email=payload.get("email"), role=payload.get("role", "doctor"))
+        return entry.user
     except Exception:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
@@ -29,3 +41,18 @@ async def get_db_session(user: CurrentUser = Depends(get_current_user)) -> Async
     # Injects user.id into Postgres session for RLS: SET LOCAL app.current_user_id + ROLE
     async for sess in get_db(user_id=user.id):
         yield sess
+
+def audited(action: str, resource_type: Optional[str] = None, resource_param: Optional[str] = None):
+    """Route dependency: queue one audit_log row per call (see services.audit_service; never waits on the DB)."""
+    async def record(request: Request, user: CurrentUser = Depends(get_current_user)):
+        audit_writer.record(
+            action,
+            user_id=user.id,
+            user_email=user.email,
+            ip_address=request.client.host if request.client else None,
+            user_agent=request.headers.get("user-agent"),
+            resource_type=resource_type,
+            resource_id=request.path_params.get(resource_param) if resource_param else None,
+            details={"path": request.url.path, "request_id": getattr(request.state, "request_id", None)},
+        )
+    return record
@@ -74,7 +74,7 @@ CREATE TABLE patients (
     data_retention_until TIMESTAMP DEFAULT (NOW() + INTERVAL '7 years'),
     
     -- Audit fields
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, -- keyset pagination key
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     
@@ -119,7 +119,7 @@ CREATE TABLE medical_sessions (
     data_retention_until TIMESTAMP DEFAULT (NOW() + INTERVAL '7 years'),
     
     -- Audit fields
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, -- keyset pagination key
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     completed_at TIMESTAMP,
     
@@ -155,7 +155,7 @@ CREATE TABLE chat_messages (
     anonymized BOOLEAN DEFAULT false,
     
     -- Audit fields
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, -- keyset pagination key
     
     -- Indexes
     INDEX idx_messages_session_id (session_id),
@@ -245,6 +245,28 @@ CREATE TABLE medical_images (
     INDEX idx_medical_images_image_type (image_type)
 );
 
+-- Recurring appointments: one row per series, occurrences are computed
+-- (services/calendar_index.py); a moved occurrence is a skip date plus its own appointment
+CREATE TABLE appointment_series (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    doctor_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    patient_id UUID REFERENCES patients(id) ON DELETE SET NULL,
+    
+    title VARCHAR(255) NOT NULL,
+    appointment_type VARCHAR(50),
+    first_datetime TIMESTAMP NOT NULL,
+    duration_minutes INTEGER DEFAULT 30,
+    every_days INTEGER NOT NULL CHECK (every_days > 0),
+    occurrences INTEGER, -- NULL and no until_date: open-ended
+    until_date DATE,
+    skip_dates DATE[] DEFAULT '{}',
+    status VARCHAR(20) DEFAULT 'active', -- active, cancelled
+    
+    -- Audit fields
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Calendar appointments
 CREATE TABLE appointments (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -257,6 +279,7 @@ CREATE TABLE appointments (
     appointment_datetime TIMESTAMP NOT NULL,
     duration_minutes INTEGER DEFAULT 30,
     appointment_type VARCHAR(50), -- 'consultation', 'follow_up', 'procedure'
+    series_id UUID REFERENCES appointment_series(id) ON DELETE SET NULL, -- a moved occurrence
     
     -- Status and logistics
     status VARCHAR(20) DEFAULT 'scheduled', -- scheduled, completed, cancelled, no_show
@@ -454,8 +477,24 @@ CREATE TRIGGER update_patients_updated_at BEFORE UPDATE ON patients
 CREATE TRIGGER update_medical_sessions_updated_at BEFORE UPDATE ON medical_sessions
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
-CREATE TRIGGER update_lab_results_updated_at BEFORE UPDATE ON lab_results
-    FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+-- Calendar and lab rows are read incrementally by updated_at (services/calendar_index.py,
+-- services/lab_trends.py): stamp them when written, not when the transaction began
+CREATE OR REPLACE FUNCTION update_updated_at_clock()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = clock_timestamp();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER update_appointments_updated_at BEFORE INSERT OR UPDATE ON appointments
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_clock();
+
+CREATE TRIGGER update_appointment_series_updated_at BEFORE INSERT OR UPDATE ON appointment_series
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_clock();
+
+CREATE TRIGGER update_lab_results_updated_at BEFORE INSERT OR UPDATE ON lab_results
+    FOR EACH ROW EXECUTE FUNCTION update_updated_at_clock();
 
 -- Row Level Security (RLS) for data isolation
 ALTER TABLE patients ENABLE ROW LEVEL SECURITY;
@@ -463,6 +502,8 @@ ALTER TABLE medical_sessions ENABLE ROW LEVEL SECURITY;
 ALTER TABLE chat_messages ENABLE ROW LEVEL SECURITY;
 ALTER TABLE lab_results ENABLE ROW LEVEL SECURITY;
 ALTER TABLE medical_images ENABLE ROW LEVEL SECURITY;
+ALTER TABLE appointments ENABLE ROW LEVEL SECURITY;
+ALTER TABLE appointment_series ENABLE ROW LEVEL SECURITY;
 
 -- RLS Policies - doctors can only see their own patients
 CREATE POLICY doctor_patient_isolation ON patients
@@ -471,4 +512,46 @@ CREATE POLICY doctor_patient_isolation ON patients
 
 CREATE POLICY doctor_session_isolation ON medical_sessions
     FOR ALL TO authenticated_users
-    USING (doctor_id = current_setting('app.current_user_id')::UUID);
\ No newline at end of file
+    USING (doctor_id = current_setting('app.current_user_id')::UUID);
+
+-- chat_messages has RLS enabled; visible through the doctor's own sessions
+CREATE POLICY doctor_message_isolation ON chat_messages
+    FOR ALL TO authenticated_users
+    USING (EXISTS (SELECT 1 FROM medical_sessions s WHERE s.id = chat_messages.session_id));
+
+-- medical_images has RLS enabled; rows belong to the uploading doctor
+CREATE POLICY doctor_image_isolation ON medical_images
+    FOR ALL TO authenticated_users
+    USING (doctor_id = current_setting('app.current_user_id')::UUID);
+
+-- lab_results has RLS enabled; rows belong to the ordering doctor
+CREATE POLICY doctor_lab_isolation ON lab_results
+    FOR ALL TO authenticated_users
+    USING (doctor_id = current_setting('app.current_user_id')::UUID);
+
+CREATE POLICY doctor_appointment_isolation ON appointments
+    FOR ALL TO authenticated_users
+    USING (doctor_id = current_setting('app.current_user_id')::UUID);
+
+CREATE POLICY doctor_series_isolation ON appointment_series
+    FOR ALL TO authenticated_users
+    USING (doctor_id = current_setting('app.current_user_id')::UUID);
+
+-- Keyset pagination (core/pagination.py): (owner, created_at DESC, id DESC) so every
+-- page, however deep, is one index range scan. created_at is NOT NULL on these tables:
+-- a NULL row can neither be encoded as a cursor nor match (created_at, id) < cursor.
+-- Existing databases: backfill, then tighten.
+--   UPDATE chat_messages SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+--   ALTER TABLE chat_messages ALTER COLUMN created_at SET NOT NULL;
+--   (likewise patients and medical_sessions)
+CREATE INDEX idx_patients_doctor_keyset ON patients (doctor_id, created_at DESC, id DESC);
+CREATE INDEX idx_sessions_doctor_keyset ON medical_sessions (doctor_id, created_at DESC, id DESC);
+CREATE INDEX idx_sessions_patient_keyset ON medical_sessions (patient_id, created_at DESC, id DESC);
+CREATE INDEX idx_messages_session_keyset ON chat_messages (session_id, created_at DESC, id DESC);
+
+-- Lab trends (services/lab_trends.py) fetch a patient's rows updated since the last read
+CREATE INDEX idx_lab_results_patient_updated ON lab_results (patient_id, updated_at);
+
+-- Calendar index (services/calendar_index.py) folds in a doctor's rows updated since the last read
+CREATE INDEX idx_appointments_doctor_updated ON appointments (doctor_id, updated_at);
+CREATE INDEX idx_appointment_series_doctor_updated ON appointment_series (doctor_id, updated_at);
@@ -0,0 +1,105 @@
+# app/services/asr_workers.py
+"""
+Process pool for ASR inference. Each worker pins its torch thread count, loads the
+pipeline once in the initializer and runs a warm-up pass before taking requests.
+Kept free of heavy imports at module level: spawned children import this first.
+"""
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio, multiprocessing, os, queue
+
+_PIPE = None
+
+def run_pipeline(asr, inputs: list, language: Optional[str]) -> list[str]:
+    # One pipeline call for the whole batch; HF pads and runs a single forward per chunk of batch_size.
+    # Whisper supports language hints; many HF pipelines ignore it but safe to pass
+    results = asr(inputs, batch_size=len(inputs), generate_kwargs={"language": language} if language else None)
+    return [(r["text"] if isinstance(r, dict) else str(r)).strip() for r in results]
+
+def pipeline_rate(asr) -> int:
+    fe = getattr(asr, "feature_extractor", None)
+    return getattr(fe, "sampling_rate", 16000)
+
+def warm_up(asr):
+    import numpy as np
+    rate = pipeline_rate(asr)
+    asr({"raw": np.zeros(rate, dtype=np.float32), "sampling_rate": rate})
+
+def _init_worker(model_id: str, threads: int, ready):
+    # Must happen before torch spins up its pools, otherwise each worker grabs every core
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    from transformers import pipeline
+    global _PIPE
+    _PIPE = pipeline("automatic-speech-recognition", model=model_id)
+    warm_up(_PIPE)
+    ready.put({"pid": os.getpid(), "sampling_rate": pipeline_rate(_PIPE)})
+
+def _worker_infer(inputs: list, language: Optional[str]) -> list[str]:
+    return run_pipeline(_PIPE, inputs, language)
+
+class ASRWorkerPool:
+    def __init__(self, model_id: str, workers: int, threads: int = 0):
+        self.model_id = model_id
+        self.size = max(1, workers)
+        self.threads = threads or max(1, (os.cpu_count() or 1) // self.size)
+        self.sampling_rate = 16000
+        self.ready_pids: set[int] = set()
+        self.in_flight = 0
+        self.broken = False
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    async def start(self):
+        """Spawn workers and wait until every one has loaded and warmed up the model."""
+        ctx = multiprocessing.get_context("spawn")
+        ready = ctx.Queue()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.size,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(self.model_id, self.threads, ready),
+        )
+        loop = asyncio.get_running_loop()
+        # Each call submitted to a fresh pool starts another worker (up to `size`), but
+        # which workers end up running them is the pool's choice: readiness comes from
+        # the initializers, and these calls only surface a worker that failed to start.
+        spawned = asyncio.gather(*(loop.run_in_executor(self._executor, os.getpid) for _ in range(self.size)))
+        infos = []
+        while len(infos) < self.size:
+            try:
+                infos.append(await asyncio.to_thread(ready.get, True, 0.5))
+            except queue.Empty:
+                if spawned.done():
+                    spawned.result()  # BrokenProcessPool if an initializer raised
+        await spawned
+        ready.close()
+        self.ready_pids = {i["pid"] for i in infos}
+        self.sampling_rate = infos[0]["sampling_rate"]
+
+    async def infer(self, inputs: list, language: Optional[str]) -> list[str]:
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, _worker_infer, inputs, language)
+        except BrokenProcessPool:
+            self.broken = True
+            raise
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.size,
+            "ready_workers": 0 if self.broken else len(self.ready_pids),
+            "torch_threads": self.threads,
+            "in_flight": self.in_flight,
+        }
+
+    async def aclose(self):
+        if self._executor is not None:
+            await asyncio.to_thread(self._executor.shutdown, True, cancel_futures=True)
+            self._executor = None
+            self.ready_pids.clear()
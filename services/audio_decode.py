@@ -0,0 +1,111 @@
+# app/services/audio_decode.py
+"""
+In-memory audio decoding for the STT path: bytes -> mono float32 at the model's rate.
+WAV is parsed straight off a memoryview; other containers (webm/ogg/m4a) are piped
+through ffmpeg stdin/stdout so nothing touches disk.
+"""
+from typing import Optional
+import struct
+import numpy as np
+
+class AudioDecodeError(ValueError):
+    pass
+
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_IEEE_FLOAT = 0x0003
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+def _iter_chunks(buf: memoryview):
+    off = 12
+    while off + 8 <= len(buf):
+        cid = bytes(buf[off:off + 4])
+        size = struct.unpack_from("<I", buf, off + 4)[0]
+        start = off + 8
+        end = min(start + size, len(buf))  # streaming writers leave size = 0xFFFFFFFF
+        yield cid, buf[start:end]
+        off = start + size + (size & 1)
+
+def _pcm_to_float32(raw: memoryview, fmt: int, bits: int) -> np.ndarray:
+    if fmt == _WAVE_FORMAT_IEEE_FLOAT:
+        dtype = {32: "<f4", 64: "<f8"}.get(bits)
+        if dtype is None:
+            raise AudioDecodeError(f"Unsupported float width: {bits}")
+        return np.frombuffer(raw, dtype=dtype).astype(np.float32, copy=False)
+    if bits == 8:
+        return (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    if bits == 16:
+        return np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    if bits == 24:
+        b = np.frombuffer(raw[: len(raw) - len(raw) % 3], dtype=np.uint8).reshape(-1, 3)
+        i = (b[:, 0].astype(np.int32) | (b[:, 1].astype(np.int32) << 8) | (b[:, 2].astype(np.int32) << 16))
+        i = np.where(i & 0x800000, i - 0x1000000, i)
+        return i.astype(np.float32) / 8388608.0
+    if bits == 32:
+        return np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648.0
+    raise AudioDecodeError(f"Unsupported PCM width: {bits}")
+
+def read_wav(data: bytes | memoryview) -> tuple[np.ndarray, int]:
+    """Parse a RIFF/WAVE buffer without copying the sample data. Returns (mono float32, sample_rate)."""
+    buf = memoryview(data)
+    if len(buf) < 12 or bytes(buf[:4]) != b"RIFF" or bytes(buf[8:12]) != b"WAVE":
+        raise AudioDecodeError("Not a RIFF/WAVE buffer")
+    fmt = channels = rate = bits = None
+    for cid, chunk in _iter_chunks(buf):
+        if cid == b"fmt ":
+            fmt, channels, rate, _, block_align, bits = struct.unpack_from("<HHIIHH", chunk)
+            if fmt == _WAVE_FORMAT_EXTENSIBLE and len(chunk) >= 26:
+                fmt = struct.unpack_from("<H", chunk, 24)[0]
+        elif cid == b"data":
+            if fmt is None:
+                raise AudioDecodeError("data chunk before fmt chunk")
+            if fmt not in (_WAVE_FORMAT_PCM, _WAVE_FORMAT_IEEE_FLOAT):
+                raise AudioDecodeError(f"Unsupported WAV format tag: {fmt:#x}")
+            width = bits // 8 * channels
+            samples = _pcm_to_float32(chunk[: len(chunk) - len(chunk) % width], fmt, bits)
+            if channels > 1:
+                samples = samples.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+            return samples, rate
+    raise AudioDecodeError("No data chunk")
+
+def resample(audio: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    if src_rate == dst_rate or audio.size == 0:
+        return audio
+    try:
+        import torch, torchaudio
+        return torchaudio.functional.resample(torch.from_numpy(audio), src_rate, dst_rate).numpy()
+    except ImportError:
+        n = int(round(audio.size * dst_rate / src_rate))
+        x = np.linspace(0, audio.size - 1, n, dtype=np.float64)
+        return np.interp(x, np.arange(audio.size), audio).astype(np.float32)
+
+def _ffmpeg_decode(data: bytes | memoryview, rate: int) -> np.ndarray:
+    # transformers ships an ffmpeg stdin->stdout reader; it raises ValueError if ffmpeg is missing or fails
+    from transformers.pipelines.audio_utils import ffmpeg_read
+    try:
+        audio = ffmpeg_read(data, rate)
+    except ValueError as e:
+        raise AudioDecodeError(str(e))
+    if audio.size == 0:
+        raise AudioDecodeError("ffmpeg produced no samples")
+    return audio
+
+def decode_audio(data: bytes | memoryview, rate: int) -> np.ndarray:
+    """Decode webm/ogg/m4a/wav bytes to mono float32 at `rate`. Raises AudioDecodeError if not decodable in memory."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        try:
+            audio, src = read_wav(data)
+            return resample(audio, src, rate)
+        except AudioDecodeError:
+            pass  # odd WAV variants (ADPCM, µ-law) -> let ffmpeg try
+    return _ffmpeg_decode(data, rate)
+
+def sniff_suffix(data: bytes | memoryview) -> Optional[str]:
+    if data[:4] == b"RIFF":
+        return ".wav"
+    if data[:4] == b"\x1a\x45\xdf\xa3":
+        return ".webm"
+    if data[4:8] == b"ftyp":
+        return ".m4a"
+    if data[:4] == b"OggS":
+        return ".ogg"
+    return None
@@ -0,0 +1,375 @@
+# app/services/audit_service.py
+"""
+Application-side audit_log writer. `record()` only appends to an in-memory queue, so a
+request never waits on the DB; a background task writes the queue in batches (COPY or
+one INSERT ... unnest per batch) when AUDIT_BATCH_SIZE events are waiting or every
+AUDIT_FLUSH_INTERVAL_S, whichever comes first. One batch costs one round trip and one
+WAL flush instead of one each per event, and the four audit_log indexes are updated
+in a single pass.
+
+If the DB is unreachable (or the queue is full) events are written to
+AUDIT_SPILL_DIR as JSON lines and replayed, oldest first, after the next successful
+write. Several worker processes can share the directory: files are claimed by rename.
+A batch the DB rejects for its contents (a constraint, a bad value) is retried row by
+row instead; rows that still fail go to AUDIT_SPILL_DIR/rejected with their error, so
+one bad event never holds back the rest.
+"""
+from typing import Awaitable, Callable, Optional
+from collections import deque
+from datetime import datetime, timezone
+from uuid import UUID
+import asyncio, glob, ipaddress, json, logging, os, re, time
+
+from sqlalchemy import exc as sa_exc, text
+
+from app.config import settings
+from app.core.metrics import AUDIT_EVENTS, AUDIT_FLUSH, AUDIT_QUEUE_DEPTH, child
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = (
+    "user_id", "user_email", "ip_address", "user_agent", "action", "resource_type",
+    "resource_id", "details", "success", "error_message", "created_at",
+)
+
+# An event is a tuple in COLUMNS order holding JSON-safe values (strings, bool, dict),
+# so the same tuple can be queued, spilled and replayed.
+Event = tuple
+Writer = Callable[[list], Awaitable[None]]
+
+def _uuid(value) -> Optional[str]:
+    try:
+        return str(UUID(str(value))) if value else None
+    except ValueError:
+        return None
+
+def _ip(value) -> Optional[str]:
+    try:
+        return str(ipaddress.ip_address(value)) if value else None
+    except ValueError:
+        return None
+
+def _db_record(event: Event) -> tuple:
+    """asyncpg-native values for COPY / unnest."""
+    user_id, email, ip, agent, action, rtype, rid, details, success, error, created_at = event
+    return (
+        UUID(user_id) if user_id else None, email, ipaddress.ip_address(ip) if ip else None, agent,
+        action, rtype, UUID(rid) if rid else None, json.dumps(details or {}), success, error,
+        datetime.fromisoformat(created_at),
+    )
+
+def copy_writer(db, table: str = "audit_log") -> Writer:
+    async def write(events: list):
+        async with db.connect() as conn:
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.copy_records_to_table(
+                table, records=[_db_record(e) for e in events], columns=COLUMNS
+            )
+    return write
+
+def insert_writer(db, table: str = "audit_log") -> Writer:
+    # unnest keeps the statement text fixed whatever the batch size (one prepared statement)
+    sql = text(
+        f"INSERT INTO {table} ({', '.join(COLUMNS)}) SELECT * FROM unnest("
+        "CAST(:user_id AS uuid[]), CAST(:user_email AS varchar[]), CAST(:ip_address AS inet[]), "
+        "CAST(:user_agent AS text[]), CAST(:action AS varchar[]), CAST(:resource_type AS varchar[]), "
+        "CAST(:resource_id AS uuid[]), CAST(:details AS jsonb[]), CAST(:success AS boolean[]), "
+        "CAST(:error_message AS text[]), CAST(:created_at AS timestamp[]))"
+    )
+
+    async def write(events: list):
+        columns = zip(*(_db_record(e) for e in events))
+        async with db.begin() as conn:
+            await conn.execute(sql, {name: list(col) for name, col in zip(COLUMNS, columns)})
+    return write
+
+WRITERS: dict[str, Callable[..., Writer]] = {"copy": copy_writer, "insert": insert_writer}
+
+# SQLSTATE classes worth retrying: connection exception, transaction rollback,
+# insufficient resources, operator intervention (shutdown, cannot connect now)
+_RETRY_SQLSTATE = ("08", "40", "53", "57")
+_RETRY_ERRORS = (
+    asyncio.TimeoutError, OSError, sa_exc.TimeoutError, sa_exc.DisconnectionError,
+    sa_exc.OperationalError, sa_exc.InterfaceError,
+)
+
+def _retryable(error: BaseException) -> bool:
+    """DB unreachable or slow, as opposed to the DB rejecting the rows themselves."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, _RETRY_ERRORS):
+            return True
+        if isinstance(error, sa_exc.DBAPIError) and error.connection_invalidated:
+            return True
+        sqlstate = getattr(error, "sqlstate", None)
+        if sqlstate:
+            return str(sqlstate)[:2] in _RETRY_SQLSTATE
+        if type(error).__module__.startswith("asyncpg") and "InterfaceError" in type(error).__name__:
+            return True  # client side: connection closed or in a bad state
+        error = getattr(error, "orig", None) or error.__cause__
+    return False
+
+# audit-<pid>-<ns>.jsonl: a spilled batch, ready to replay.
+# audit-<pid>.overflow: events that arrived while the queue was full; renamed to a
+# batch file by its owner once the queue has room, or adopted after the owner died.
+_BATCH_RE = re.compile(r"audit-(\d+)-\d+\.jsonl(?:\.replaying)?$")
+_OVERFLOW_RE = re.compile(r"audit-(\d+)\.overflow$")
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class AuditWriter:
+    def __init__(
+        self,
+        max_queue: int = 10_000,
+        batch_size: int = 500,
+        flush_interval_s: float = 1.0,
+        write_timeout_s: float = 5.0,
+        spill_dir: str = "data/audit-spill",
+        write: Optional[Writer] = None,
+    ):
+        self.max_queue = max(1, max_queue)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval_s = flush_interval_s
+        self.write_timeout_s = write_timeout_s
+        self.spill_dir = spill_dir
+        self._write = write or copy_writer(engine)
+        self._queue: deque = deque()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._overflow = None  # open file while the queue is full
+        self._spilled = True   # check the directory on the first successful write
+        self.recorded = self.written = self.spilled = self.replayed = self.rejected = self.flushes = 0
+
+    def record(
+        self,
+        action: str,
+        *,
+        user_id=None,
+        user_email: Optional[str] = None,
+        ip_address: Optional[str] = None,
+        user_agent: Optional[str] = None,
+        resource_type: Optional[str] = None,
+        resource_id=None,
+        details: Optional[dict] = None,
+        success: bool = True,
+        error_message: Optional[str] = None,
+    ):
+        """Queue one audit_log row. Never blocks on the DB; safe to call from any coroutine."""
+        event = (
+            _uuid(user_id), user_email, _ip(ip_address), (user_agent or "")[:512] or None, action,
+            resource_type, _uuid(resource_id), details or {}, success, error_message,
+            datetime.now(timezone.utc).replace(tzinfo=None).isoformat(),  # audit_log.created_at is UTC, no tz
+        )
+        self.recorded += 1
+        if len(self._queue) >= self.max_queue:
+            self._overflow_write(event)
+            return
+        self._queue.append(event)
+        AUDIT_QUEUE_DEPTH.inc()
+        if len(self._queue) >= self.batch_size and self._wake is not None:
+            self._wake.set()
+
+    # -- background flushing --
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._closing = False
+            self._adopt_orphans()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("audit flush failed")
+
+    async def flush(self):
+        """Write everything queued now; batches the DB refuses are spilled to disk."""
+        db_ok = True
+        while self._queue:
+            n = min(len(self._queue), self.batch_size)
+            batch = [self._queue.popleft() for _ in range(n)]
+            AUDIT_QUEUE_DEPTH.dec(n)
+            # after one failure, spill the rest of this pass instead of waiting out a timeout per batch
+            written, left = await self._try_write(batch) if db_ok else (0, batch)
+            self.written += written
+            child(AUDIT_EVENTS, "written").inc(written)
+            if left:
+                db_ok = False
+                await asyncio.to_thread(self._spill, left)
+        if self._overflow is not None:
+            self._rotate_overflow()
+        if db_ok and self._spilled:
+            await self._replay()
+
+    async def _try_write(self, batch: list) -> tuple[int, list]:
+        """
+        (events written, events to keep for later). Only an unreachable or slow DB leaves
+        events to keep; a batch it rejects goes row by row and refused rows are set aside.
+        """
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._write(batch), self.write_timeout_s)
+        except Exception as e:
+            if _retryable(e):
+                logger.warning("audit_log write of %d events failed, spilling: %s", len(batch), e)
+                return 0, batch
+            logger.warning("audit_log rejected a batch of %d events, writing them one by one: %s", len(batch), e)
+            return await self._write_rows(batch)
+        AUDIT_FLUSH.observe(time.perf_counter() - start)
+        self.flushes += 1
+        return len(batch), []
+
+    async def _write_rows(self, batch: list) -> tuple[int, list]:
+        written, refused, left = 0, [], []
+        for i, event in enumerate(batch):
+            try:
+                await asyncio.wait_for(self._write([event]), self.write_timeout_s)
+            except Exception as e:
+                if _retryable(e):
+                    left = batch[i:]  # the DB went away part way through
+                    break
+                logger.error("audit_log rejected event %s, quarantined: %s", event[4], e)
+                refused.append((event, f"{type(e).__name__}: {e}"))
+            else:
+                written += 1
+        if refused:
+            await asyncio.to_thread(self._reject, refused)
+        return written, left
+
+    async def close(self):
+        """Stop the background task and write (or spill) whatever is still queued."""
+        if self._task is not None:
+            # not cancel(): a batch being written must finish (or spill), not vanish
+            self._closing = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    # -- spill to disk --
+
+    def _path(self, name: str) -> str:
+        os.makedirs(self.spill_dir, exist_ok=True)
+        return os.path.join(self.spill_dir, name)
+
+    def _spill(self, batch: list):
+        path = self._path(f"audit-{os.getpid()}-{time.time_ns()}.jsonl")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(e, separators=(",", ":")) + "\n" for e in batch)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        self._spilled = True
+        self.spilled += len(batch)
+        child(AUDIT_EVENTS, "spilled").inc(len(batch))
+
+    def _reject(self, refused: list):
+        # Kept for a person to look at, never replayed; default=str: the event may be why it failed
+        directory = os.path.join(self.spill_dir, "rejected")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"audit-{os.getpid()}.jsonl"), "a", encoding="utf-8") as f:
+            f.writelines(
+                json.dumps({"event": e, "error": error}, separators=(",", ":"), default=str) + "\n"
+                for e, error in refused
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        self.rejected += len(refused)
+        child(AUDIT_EVENTS, "rejected").inc(len(refused))
+
+    def _overflow_write(self, event: Event):
+        # Rare path (queue full): one small buffered append on the event loop beats dropping the event
+        if self._overflow is None:
+            self._overflow = open(self._path(f"audit-{os.getpid()}.overflow"), "a", encoding="utf-8")
+        self._overflow.write(json.dumps(event, separators=(",", ":")) + "\n")
+        self.spilled += 1
+        child(AUDIT_EVENTS, "spilled").inc()
+
+    def _rotate_overflow(self):
+        # On the loop thread, so no record() can append between close and rename
+        f, self._overflow = self._overflow, None
+        f.close()
+        os.replace(f.name, self._path(f"audit-{os.getpid()}-{time.time_ns()}.jsonl"))
+        self._spilled = True
+
+    def _adopt_orphans(self):
+        """Make files left by dead processes (overflow, half-replayed batches) replayable."""
+        for path in glob.glob(os.path.join(self.spill_dir, "audit-*")):
+            name = os.path.basename(path)
+            m = _OVERFLOW_RE.match(name) or _BATCH_RE.match(name)
+            if not m or not name.endswith((".overflow", ".replaying")):
+                continue
+            pid = int(m.group(1))
+            # at start-up our own pid has no files yet: a match is a previous container's pid 1
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            try:
+                os.replace(path, self._path(f"audit-{m.group(1)}-{time.time_ns()}.jsonl"))
+            except FileNotFoundError:
+                pass  # another process adopted it first
+
+    async def _replay(self):
+        self._spilled = False
+        for path in sorted(glob.glob(os.path.join(self.spill_dir, "audit-*.jsonl")), key=_spill_order):
+            claimed = f"{path}.replaying"
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue  # claimed by another worker
+            events = await asyncio.to_thread(_read_spill, claimed)
+            for s in range(0, len(events), self.batch_size):
+                chunk = events[s:s + self.batch_size]
+                written, left = await self._try_write(chunk)
+                self.replayed += written
+                child(AUDIT_EVENTS, "replayed").inc(written)
+                if left:
+                    # keep what was not written; retried after the next good write
+                    if s == 0 and len(left) == len(chunk):
+                        os.rename(claimed, path)
+                    else:
+                        await asyncio.to_thread(self._spill, left + events[s + len(chunk):])
+                        os.remove(claimed)
+                    self._spilled = True
+                    return
+            os.remove(claimed)
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue), "recorded": self.recorded, "written": self.written,
+            "flushes": self.flushes, "spilled": self.spilled, "replayed": self.replayed,
+            "rejected": self.rejected,
+        }
+
+def _spill_order(path: str) -> int:
+    return int(os.path.basename(path).rsplit("-", 1)[1].split(".")[0])  # time_ns of the spill
+
+def _read_spill(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [tuple(json.loads(line)) for line in f if line.strip()]
+
+audit_writer = AuditWriter(
+    settings.AUDIT_QUEUE_SIZE,
+    settings.AUDIT_BATCH_SIZE,
+    settings.AUDIT_FLUSH_INTERVAL_S,
+    settings.AUDIT_WRITE_TIMEOUT_S,
+    settings.AUDIT_SPILL_DIR,
+    write=WRITERS[settings.AUDIT_WRITE_MODE](engine),
+)
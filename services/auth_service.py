@@ -1,10 +1,10 @@
-from redis.asyncio import from_url as redis_from_url
-from app.config import settings
+from app.core.metrics import redis_timer
+from app.core.redis_pool import get_redis, redis_pool_stats
 
 async def check_redis_connection() -> bool:
     try:
-        r = redis_from_url(settings.REDIS_URL)
-        pong = await r.ping()
+        with redis_timer("ping"):
+            pong = await get_redis().ping()
         return bool(pong)
     except Exception:
         return False
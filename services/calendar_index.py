@@ -0,0 +1,541 @@
+# app/services/calendar_index.py
+"""
+Availability and conflict checks over appointments, from a per-doctor index instead
+of a query per check. Times are wall-clock minutes since 1970-01-01 (the columns are
+TIMESTAMP without time zone).
+
+Per doctor:
+  - one-off appointments: per day, a list of (start, end, id) sorted by start. A
+    conflict check bisects the day and walks back at most the longest booking
+  - recurring series (appointment_series): one object each, never a row per
+    occurrence. They are bucketed by (every_days, first day mod every_days), so the
+    occurrences on a given day are found by arithmetic, for any date, without
+    expanding anything up front
+  - a max-tree over days (from today, CALENDAR_SEARCH_DAYS ahead and grown on
+    demand) holding each day's longest bookable gap inside CALENDAR_DAY_START..END
+    on the CALENDAR_SLOT_MINUTES grid. "Next free slot of 45 minutes" descends to
+    the first day with a gap >= 45 in O(log days), then scans that one day
+
+Writes update only the days they touch (and their tree path). Each worker keeps its
+own LRU of calendars; a read first folds in rows updated since the last one (both
+tables), so bookings made on another worker show up on the next check. Bookings for
+one doctor are serialized across workers with a transaction-scoped advisory lock, and
+the conflict check runs on the locked transaction's own connection.
+"""
+from typing import Iterable, Iterator, Optional
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+import asyncio, time
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.core.exceptions import APIException
+from app.database import RLS_CONTEXT_SQL, SessionLocal
+
+DAY = 1440
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_DATE = date(1970, 1, 1)
+# Both tables stamp updated_at with clock_timestamp() when the row is written (schema
+# triggers), and bookings write just before committing under the advisory lock. So a
+# row can only commit with a stamp older than the watermark by the time its commit
+# takes; the re-read overlap covers that (applying a row twice is harmless)
+_OVERLAP = timedelta(seconds=30)
+
+def to_minute(dt: datetime) -> int:
+    return int((dt.replace(tzinfo=None) - _EPOCH).total_seconds() // 60)
+
+def from_minute(minute: int) -> datetime:
+    return _EPOCH + timedelta(minutes=minute)
+
+def to_day(d: date) -> int:
+    return (d - _EPOCH_DATE).days
+
+def _hhmm(value: str) -> int:
+    hours, _, minutes = value.partition(":")
+    return int(hours) * 60 + int(minutes or 0)
+
+class WorkHours:
+    """The bookable window of each weekday and the grid offered start times sit on."""
+
+    def __init__(self, start: str, end: str, weekdays: Iterable[int], slot_minutes: int):
+        self.start, self.end = _hhmm(start), _hhmm(end)
+        self.weekdays = frozenset(weekdays)
+        self.slot = max(1, slot_minutes)
+
+    def window(self, day: int) -> tuple[int, int]:
+        if (day + 3) % 7 not in self.weekdays:  # 1970-01-01 was a Thursday
+            return 0, 0
+        return day * DAY + self.start, day * DAY + self.end
+
+    def align(self, minute: int) -> int:
+        return -(-minute // self.slot) * self.slot
+
+class Series:
+    """A recurring appointment: every `every` days from `first_day`, minus skipped dates."""
+    __slots__ = ("key", "first_day", "offset", "duration", "every", "last_day", "skip")
+
+    def __init__(
+        self,
+        key: str,
+        first: int,
+        duration: int,
+        every: int,
+        occurrences: Optional[int] = None,
+        until_day: Optional[int] = None,
+        skip: Iterable[int] = (),
+    ):
+        self.key = key
+        self.first_day, self.offset = divmod(first, DAY)
+        self.duration = min(duration, DAY - self.offset)  # occurrences end by midnight
+        self.every = max(1, every)
+        last = self.first_day + (occurrences - 1) * self.every if occurrences else None
+        if until_day is not None:
+            last = until_day if last is None else min(last, until_day)
+        self.last_day = last
+        self.skip = frozenset(skip)
+
+    def on(self, day: int) -> bool:
+        return (
+            self.first_day <= day and (self.last_day is None or day <= self.last_day)
+            and (day - self.first_day) % self.every == 0 and day not in self.skip
+        )
+
+    def days(self, start_day: int, end_day: int) -> range:
+        """Candidate days in [start_day, end_day] (skipped dates still included)."""
+        if self.last_day is not None:
+            end_day = min(end_day, self.last_day)
+        lo = max(start_day, self.first_day)
+        lo += -(lo - self.first_day) % self.every
+        return range(lo, end_day + 1, self.every)
+
+class DoctorCalendar:
+    """One doctor's bookings and series, with the gap tree over the days ahead."""
+
+    def __init__(self, hours: WorkHours, origin_day: int):
+        self.hours = hours
+        self.origin = origin_day  # first day of the gap tree: no slots are offered before it
+        self.days: dict[int, list[tuple[int, int, str]]] = {}
+        self.spans: dict[str, tuple[int, int]] = {}  # appointment id -> (start, end)
+        self.series: dict[str, Series] = {}
+        self._phases: dict[int, dict[int, list[Series]]] = {}  # every -> first_day % every -> series
+        self.longest = 0
+        self.watermark: Optional[datetime] = None
+        self.loaded_at = time.monotonic()
+        self._cap = 0
+        self._tree: list[int] = []  # 1-based max-tree; leaves at [_cap, 2 * _cap)
+
+    # -- writes --
+
+    def add(self, key: str, start: int, end: int):
+        self.remove(key)
+        if end <= start:
+            return
+        self.spans[key] = (start, end)
+        for day in range(start // DAY, (end - 1) // DAY + 1):
+            lo, hi = max(start, day * DAY), min(end, (day + 1) * DAY)
+            insort(self.days.setdefault(day, []), (lo, hi, key))
+            self.longest = max(self.longest, hi - lo)
+            self._touch(day)
+
+    def remove(self, key: str):
+        span = self.spans.pop(key, None)
+        if span is None:
+            return
+        start, end = span
+        for day in range(start // DAY, (end - 1) // DAY + 1):
+            items = self.days.get(day, [])
+            items[:] = [item for item in items if item[2] != key]
+            if not items:
+                self.days.pop(day, None)
+            self._touch(day)
+
+    def add_series(self, series: Series):
+        self.remove_series(series.key)
+        self.series[series.key] = series
+        self._phases.setdefault(series.every, {}).setdefault(series.first_day % series.every, []).append(series)
+        self._touch_series(series)
+
+    def remove_series(self, key: str):
+        series = self.series.pop(key, None)
+        if series is None:
+            return
+        phases = self._phases[series.every]
+        phases[series.first_day % series.every].remove(series)
+        if not phases[series.first_day % series.every]:
+            del phases[series.first_day % series.every]
+            if not phases:
+                del self._phases[series.every]
+        self._touch_series(series)
+
+    def _touch_series(self, series: Series):
+        if self._cap:
+            for day in series.days(self.origin, self.origin + self._cap - 1):
+                self._touch(day)
+
+    # -- reads --
+
+    def occurrences(self, day: int) -> Iterator[tuple[int, int, Series]]:
+        for every, phases in self._phases.items():
+            for series in phases.get(day % every, ()):
+                if series.on(day):
+                    start = day * DAY + series.offset
+                    yield start, start + series.duration, series
+
+    def conflicts(self, start: int, end: int, ignore: Optional[str] = None) -> list[str]:
+        """Ids of the bookings overlapping [start, end); a series occurrence is `<series id>:<date>`."""
+        found: list[str] = []
+        for day in range(start // DAY, (end - 1) // DAY + 1):
+            items = self.days.get(day, ())
+            j = bisect_left(items, (end,)) - 1  # items[:j + 1] start before `end`
+            while j >= 0 and items[j][0] + self.longest > start:
+                if items[j][1] > start and items[j][2] != ignore and items[j][2] not in found:
+                    found.append(items[j][2])
+                j -= 1
+            for lo, hi, series in self.occurrences(day):
+                if lo < end and hi > start:
+                    found.append(f"{series.key}:{from_minute(lo).date().isoformat()}")
+        return found
+
+    def free(self, day: int, after: int = 0) -> Iterator[tuple[int, int]]:
+        """Bookable (start, end) gaps of one day, starts on the slot grid, from `after` on."""
+        lo, hi = self.hours.window(day)
+        t = self.hours.align(max(lo, after))
+        if t >= hi:
+            return
+        busy = [(s, e) for s, e, _ in self.days.get(day, ())]
+        if self._phases:
+            busy.extend((s, e) for s, e, _ in self.occurrences(day))
+            busy.sort()
+        for s, e in busy:
+            if s > t:
+                yield t, min(s, hi)
+            t = max(t, self.hours.align(e))
+            if t >= hi:
+                return
+        yield t, hi
+
+    def _best(self, day: int) -> int:
+        return max((e - s for s, e in self.free(day)), default=0)
+
+    def next_free(self, after: int, duration: int, horizon_days: int) -> Optional[int]:
+        """Earliest slot start >= `after` with `duration` free minutes, or None within the horizon."""
+        after = max(after, self.origin * DAY)
+        return self._next_free(after, duration, self._last(after, horizon_days))
+
+    def slots(self, after: int, duration: int, count: int, horizon_days: int) -> list[int]:
+        """Up to `count` non-overlapping slot starts, earliest first."""
+        after = max(after, self.origin * DAY)
+        last = self._last(after, horizon_days)
+        out: list[int] = []
+        while len(out) < count:
+            start = self._next_free(after, duration, last)
+            if start is None:
+                break
+            out.append(start)
+            after = start + duration
+        return out
+
+    def _last(self, after: int, horizon_days: int) -> int:
+        # The gap tree is built out to the last day searched and kept: however far off
+        # `after` is, it never grows past two horizons from the origin.
+        return min(after // DAY, self.origin + horizon_days) + horizon_days
+
+    def _next_free(self, after: int, duration: int, last: int) -> Optional[int]:
+        first = after // DAY
+        if first > last:
+            return None
+        for s, e in self.free(first, after):
+            if e - s >= duration:
+                return s
+        self._ensure(last)
+        i = self._first_fit(first + 1 - self.origin, duration)
+        if i < 0 or self.origin + i > last:
+            return None
+        return next(s for s, e in self.free(self.origin + i) if e - s >= duration)
+
+    # -- gap tree --
+
+    def _ensure(self, day: int):
+        need = day - self.origin + 1
+        if need <= self._cap:
+            return
+        cap = max(64, self._cap)
+        while cap < need:
+            cap *= 2
+        leaves = self._tree[self._cap:] + [self._best(self.origin + i) for i in range(self._cap, cap)]
+        tree = [0] * cap + leaves
+        for i in range(cap - 1, 0, -1):
+            tree[i] = max(tree[2 * i], tree[2 * i + 1])
+        self._tree, self._cap = tree, cap
+
+    def _touch(self, day: int):
+        i = day - self.origin
+        if not 0 <= i < self._cap:
+            return
+        i += self._cap
+        tree = self._tree
+        tree[i] = self._best(day)
+        i //= 2
+        while i:
+            tree[i] = max(tree[2 * i], tree[2 * i + 1])
+            i //= 2
+
+    def _first_fit(self, lo: int, need: int) -> int:
+        """Smallest leaf index >= lo whose gap is >= need, or -1."""
+        if lo >= self._cap:
+            return -1
+        tree, i = self._tree, max(lo, 0) + self._cap
+        while True:
+            if tree[i] >= need:
+                while i < self._cap:
+                    i = 2 * i if tree[2 * i] >= need else 2 * i + 1
+                return i - self._cap
+            while i & 1:  # a right child: climb until there is a right sibling
+                i //= 2
+            if i == 0:
+                return -1
+            i += 1
+
+def _series(row: dict) -> Series:
+    return Series(
+        str(row["id"]), to_minute(row["first_datetime"]), row["duration_minutes"] or 30, row["every_days"],
+        row.get("occurrences"), to_day(row["until_date"]) if row.get("until_date") else None,
+        [to_day(d) for d in row.get("skip_dates") or ()],
+    )
+
+def apply_rows(cal: DoctorCalendar, appointments: Iterable[dict] = (), series: Iterable[dict] = ()):
+    """Upsert appointments / appointment_series rows; cancelled ones leave the index."""
+    for row in appointments:
+        key = str(row["id"])
+        if row.get("status") == "cancelled":
+            cal.remove(key)
+        else:
+            start = to_minute(row["appointment_datetime"])
+            cal.add(key, start, start + (row["duration_minutes"] or 30))
+    for row in series:
+        if row.get("status") == "cancelled":
+            cal.remove_series(str(row["id"]))
+        else:
+            cal.add_series(_series(row))
+
+_APPT_SQL = (
+    "SELECT id, appointment_datetime, duration_minutes, status, updated_at FROM appointments "
+    "WHERE doctor_id = CAST(:uid AS uuid)"
+)
+_SERIES_SQL = (
+    "SELECT id, first_datetime, duration_minutes, every_days, occurrences, until_date, skip_dates, status, "
+    "updated_at FROM appointment_series WHERE doctor_id = CAST(:uid AS uuid)"
+)
+
+class CalendarCache:
+    """doctor -> DoctorCalendar, LRU; concurrent reads of one doctor share a load."""
+
+    def __init__(self, max_doctors: int, ttl_s: float):
+        self.max_doctors = max_doctors
+        self.ttl_s = ttl_s
+        self._lru: OrderedDict[str, DoctorCalendar] = OrderedDict()
+        self._locks: dict[str, asyncio.Lock] = {}
+        self.hits = self.incremental = self.full_loads = 0
+
+    @staticmethod
+    def hours() -> WorkHours:
+        return WorkHours(
+            settings.CALENDAR_DAY_START, settings.CALENDAR_DAY_END,
+            settings.CALENDAR_WORKDAYS, settings.CALENDAR_SLOT_MINUTES,
+        )
+
+    @staticmethod
+    async def _fetch(session, user_id: str, since: Optional[datetime], today: date) -> tuple[list, list]:
+        if since is None:
+            # past appointments cannot conflict with a new booking; one day back covers overnight ones
+            appts = await session.execute(
+                text(_APPT_SQL + " AND status <> 'cancelled' AND appointment_datetime >= :from"),
+                {"uid": user_id, "from": datetime.combine(today - timedelta(days=1), datetime.min.time())},
+            )
+            series = await session.execute(
+                text(_SERIES_SQL + " AND status <> 'cancelled' AND (until_date IS NULL OR until_date >= :today)"),
+                {"uid": user_id, "today": today},
+            )
+        else:
+            params = {"uid": user_id, "since": since - _OVERLAP}
+            appts = await session.execute(text(_APPT_SQL + " AND updated_at > :since"), params)
+            series = await session.execute(text(_SERIES_SQL + " AND updated_at > :since"), params)
+        return [dict(r._mapping) for r in appts], [dict(r._mapping) for r in series]
+
+    async def _read(self, session, user_id: str, since: Optional[datetime], today: date) -> tuple[list, list]:
+        if session is not None:
+            return await self._fetch(session, user_id, since, today)
+        async with SessionLocal() as session:
+            await session.execute(RLS_CONTEXT_SQL, {"uid": user_id})
+            return await self._fetch(session, user_id, since, today)
+
+    async def get(self, user_id: str, session=None) -> DoctorCalendar:
+        """
+        The doctor's calendar, current as of now. A caller inside a transaction (holding the
+        booking lock) passes its session, so the read neither takes a second pooled
+        connection nor misses what committed before the lock was granted.
+        """
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            today = datetime.now().date()
+            cal = self._lru.get(user_id)
+            if cal is not None and (time.monotonic() - cal.loaded_at > self.ttl_s or cal.origin != to_day(today)):
+                cal = None
+            if cal is not None:
+                appts, series = await self._read(session, user_id, cal.watermark, today)
+                if appts or series:
+                    self.incremental += 1
+                else:
+                    self.hits += 1
+            else:
+                appts, series = await self._read(session, user_id, None, today)
+                cal = DoctorCalendar(self.hours(), to_day(today))
+                self.full_loads += 1
+            apply_rows(cal, appts, series)
+            stamps = [r["updated_at"] for r in (*appts, *series) if r.get("updated_at")]
+            if stamps and (cal.watermark is None or max(stamps) > cal.watermark):
+                cal.watermark = max(stamps)
+            self._lru[user_id] = cal
+            self._lru.move_to_end(user_id)
+            while len(self._lru) > self.max_doctors:
+                old, _ = self._lru.popitem(last=False)
+                self._locks.pop(old, None)
+        return cal
+
+    def apply(self, user_id: str, appointments: Iterable[dict] = (), series: Iterable[dict] = ()):
+        """Write-through after a commit on this worker (other workers pick the row up on their next read)."""
+        cal = self._lru.get(user_id)
+        if cal is not None:
+            apply_rows(cal, appointments, series)
+
+    def invalidate(self, user_id: str):
+        self._lru.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "doctors": len(self._lru), "hits": self.hits,
+            "incremental": self.incremental, "full_loads": self.full_loads,
+        }
+
+calendar_index = CalendarCache(settings.CALENDAR_CACHE_SIZE, settings.CALENDAR_CACHE_TTL_S)
+
+# -- writes --
+
+_RETURNING_APPT = " RETURNING id, appointment_datetime, duration_minutes, status, updated_at"
+_RETURNING_SERIES = (
+    " RETURNING id, first_datetime, duration_minutes, every_days, occurrences, until_date, skip_dates, "
+    "status, updated_at"
+)
+_LOCK_SQL = text("SELECT pg_advisory_xact_lock(hashtext('appointments:' || :uid))")
+_INSERT_APPT_SQL = text(
+    "INSERT INTO appointments (doctor_id, patient_id, title, description, appointment_datetime, "
+    "duration_minutes, appointment_type, location, is_virtual) "
+    "VALUES (CAST(:uid AS uuid), CAST(:patient_id AS uuid), :title, :description, :start, :duration, "
+    ":appointment_type, :location, :is_virtual)" + _RETURNING_APPT
+)
+_INSERT_SERIES_SQL = text(
+    "INSERT INTO appointment_series (doctor_id, patient_id, title, appointment_type, first_datetime, "
+    "duration_minutes, every_days, occurrences, until_date) "
+    "VALUES (CAST(:uid AS uuid), CAST(:patient_id AS uuid), :title, :appointment_type, :start, :duration, "
+    ":every_days, :occurrences, :until)" + _RETURNING_SERIES
+)
+_CANCEL_APPT_SQL = text(
+    "UPDATE appointments SET status = 'cancelled' "
+    "WHERE id = CAST(:id AS uuid) AND doctor_id = CAST(:uid AS uuid) AND status <> 'cancelled'" + _RETURNING_APPT
+)
+_CANCEL_SERIES_SQL = text(
+    "UPDATE appointment_series SET status = 'cancelled' "
+    "WHERE id = CAST(:id AS uuid) AND doctor_id = CAST(:uid AS uuid) AND status <> 'cancelled'" + _RETURNING_SERIES
+)
+_SKIP_SQL = text(
+    "UPDATE appointment_series SET skip_dates = array_append(skip_dates, CAST(:day AS date)) "
+    "WHERE id = CAST(:id AS uuid) AND doctor_id = CAST(:uid AS uuid) AND status <> 'cancelled'" + _RETURNING_SERIES
+)
+
+def _public(row: dict, start_col: str) -> dict:
+    out = {k: v for k, v in row.items() if k != "updated_at"}
+    out["id"] = str(row["id"])
+    out["end"] = row[start_col] + timedelta(minutes=row["duration_minutes"] or 30)
+    return out
+
+async def _check_patient(session, patient_id: Optional[str]):
+    if patient_id is None:
+        return
+    row = await session.execute(text("SELECT 1 FROM patients WHERE id = CAST(:pid AS uuid)"), {"pid": patient_id})
+    if row.first() is None:
+        raise APIException("Patient not found", status_code=404)
+
+def _not_past(start: int):
+    # the index only holds appointments from yesterday on, so it cannot vouch for older slots
+    if start < to_minute(datetime.now()):
+        raise APIException("Appointments cannot start in the past", status_code=422)
+
+async def book(user_id: str, fields: dict) -> dict:
+    """Insert one appointment unless it overlaps another (409)."""
+    start = to_minute(fields["start"])
+    _not_past(start)
+    async with SessionLocal() as session:
+        await session.execute(RLS_CONTEXT_SQL, {"uid": user_id})
+        await _check_patient(session, fields.get("patient_id"))
+        await session.execute(_LOCK_SQL, {"uid": user_id})  # until commit: no other booking for this doctor
+        cal = await calendar_index.get(user_id, session)
+        clash = cal.conflicts(start, start + fields["duration"])
+        if clash:
+            raise APIException(f"Overlaps {len(clash)} appointment(s): {', '.join(clash[:5])}", status_code=409)
+        row = dict((await session.execute(_INSERT_APPT_SQL, {"uid": user_id, **fields})).mappings().one())
+        await session.commit()
+    calendar_index.apply(user_id, appointments=[row])
+    return _public(row, "appointment_datetime")
+
+async def create_series(user_id: str, fields: dict) -> dict:
+    """Insert a recurring series unless an occurrence within CALENDAR_SEARCH_DAYS overlaps something (409)."""
+    start = to_minute(fields["start"])
+    if start % DAY + fields["duration"] > DAY:
+        raise APIException("A recurring appointment must end on the day it starts", status_code=422)
+    _not_past(start)
+    probe = Series(
+        "", start, fields["duration"], fields["every_days"], fields.get("occurrences"),
+        to_day(fields["until"]) if fields.get("until") else None,
+    )
+    async with SessionLocal() as session:
+        await session.execute(RLS_CONTEXT_SQL, {"uid": user_id})
+        await _check_patient(session, fields.get("patient_id"))
+        await session.execute(_LOCK_SQL, {"uid": user_id})
+        cal = await calendar_index.get(user_id, session)
+        clash: list[str] = []
+        for day in probe.days(probe.first_day, cal.origin + settings.CALENDAR_SEARCH_DAYS):
+            lo = day * DAY + probe.offset
+            clash += cal.conflicts(lo, lo + probe.duration)
+        if clash:
+            raise APIException(f"Overlaps {len(clash)} appointment(s): {', '.join(clash[:5])}", status_code=409)
+        row = dict((await session.execute(_INSERT_SERIES_SQL, {"uid": user_id, **fields})).mappings().one())
+        await session.commit()
+    calendar_index.apply(user_id, series=[row])
+    return _public(row, "first_datetime")
+
+async def _update(user_id: str, sql, params: dict, what: str) -> dict:
+    async with SessionLocal() as session:
+        await session.execute(RLS_CONTEXT_SQL, {"uid": user_id})
+        row = (await session.execute(sql, {"uid": user_id, **params})).mappings().first()
+        if row is None:
+            raise APIException(f"{what} not found", status_code=404)
+        await session.commit()
+    return dict(row)
+
+async def cancel(user_id: str, appointment_id: str) -> dict:
+    row = await _update(user_id, _CANCEL_APPT_SQL, {"id": appointment_id}, "Appointment")
+    calendar_index.apply(user_id, appointments=[row])
+    return _public(row, "appointment_datetime")
+
+async def cancel_series(user_id: str, series_id: str) -> dict:
+    row = await _update(user_id, _CANCEL_SERIES_SQL, {"id": series_id}, "Series")
+    calendar_index.apply(user_id, series=[row])
+    return _public(row, "first_datetime")
+
+async def skip_occurrence(user_id: str, series_id: str, day: date) -> dict:
+    """Drop one date from a series (to cancel it, or before booking the moved visit on its own)."""
+    row = await _update(user_id, _SKIP_SQL, {"id": series_id, "day": day}, "Series")
+    calendar_index.apply(user_id, series=[row])
+    return _public(row, "first_datetime")
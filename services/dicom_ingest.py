@@ -0,0 +1,314 @@
+# app/services/dicom_ingest.py
+"""
+Imaging ingest: a multipart upload of one study (hundreds of slices) is parsed as it
+arrives, each part written to a staging file in chunks (never held in memory in
+full, unlike UploadFile), and handed to the DICOM process pool as soon as it is
+complete, so de-identification overlaps the rest of the upload. The resulting
+medical_images rows go in with one INSERT ... unnest.
+
+Only the PHI-stripped copy is kept; staged originals are deleted by the worker. An
+upload that is aborted or cannot be recorded leaves nothing behind: queued slices are
+cancelled, running ones awaited, and their outputs and any staged files removed.
+"""
+from typing import AsyncIterator, Optional
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+import asyncio, hashlib, json, multiprocessing, os, uuid
+
+from multipart.multipart import MultipartParser, parse_options_header
+from sqlalchemy import text
+
+from app.config import settings
+from app.core.exceptions import APIException
+from app.core.metrics import DICOM_SLICES, child
+from app.core.security import JWT_SECRET_KEY
+from app.database import RLS_CONTEXT_SQL, SessionLocal
+from app.services.dicom_workers import process_slice, warm_up
+
+_DICM_AT = 128  # "DICM" magic after the preamble (PS3.10 7.1)
+
+class _PartWriter:
+    """
+    python-multipart callbacks: file parts are buffered per request chunk, and `drain()`
+    (run off the loop) appends them to staging files and reports finished parts.
+    """
+    def __init__(self, staging_dir: str, max_part_bytes: int, max_parts: int):
+        self.staging_dir = staging_dir
+        self.max_part_bytes = max_part_bytes
+        self.max_parts = max_parts
+        self.parts = 0
+        self._headers: dict[bytes, bytes] = {}
+        self._field = b""
+        self._value = b""
+        self._current: Optional[dict] = None  # {"name", "path", "buf", "size", "file"}
+        self._done: list[dict] = []
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._part_begin,
+            "on_header_field": lambda d, s, e: setattr(self, "_field", self._field + d[s:e]),
+            "on_header_value": lambda d, s, e: setattr(self, "_value", self._value + d[s:e]),
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        }
+
+    def _part_begin(self):
+        self._headers, self._current = {}, None
+
+    def _header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field, self._value = b"", b""
+
+    def _headers_finished(self):
+        _, opts = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if b"filename" not in opts:
+            return  # plain form fields are ignored; parameters travel in the query string
+        self.parts += 1
+        if self.parts > self.max_parts:
+            raise APIException(f"At most {self.max_parts} files per study", status_code=413)
+        name = opts[b"filename"].decode("utf-8", "replace")
+        path = os.path.join(self.staging_dir, f"{uuid.uuid4().hex}.dcm")
+        self._current = {"name": name, "path": path, "buf": bytearray(), "size": 0, "file": None}
+
+    def _part_data(self, data: bytes, start: int, end: int):
+        part = self._current
+        if part is None:
+            return
+        part["size"] += end - start
+        if part["size"] > self.max_part_bytes:
+            raise APIException(f"{part['name']}: larger than {self.max_part_bytes >> 20} MB", status_code=413)
+        part["buf"] += data[start:end]
+
+    def _part_end(self):
+        if self._current is not None:
+            self._done.append(self._current)
+            self._current = None
+
+    def drain(self) -> list[dict]:
+        """Flush buffered bytes to disk; return parts that are now complete."""
+        for part in self._done + ([self._current] if self._current else []):
+            if part["buf"]:
+                if part["file"] is None:
+                    part["file"] = open(part["path"], "wb")
+                part["file"].write(part["buf"])
+                part["buf"] = bytearray()
+        finished, self._done = self._done, []
+        for part in finished:
+            if part["file"] is not None:
+                part["file"].close()
+        return finished
+
+    def discard(self):
+        for part in self._done + ([self._current] if self._current else []):
+            if part["file"] is not None:
+                part["file"].close()
+                _remove(part["path"])
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _is_dicom(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            f.seek(_DICM_AT)
+            return f.read(4) == b"DICM"
+    except FileNotFoundError:
+        return False  # empty part: nothing was written
+
+async def stream_parts(
+    body: AsyncIterator[bytes], content_type: str, staging_dir: str, max_part_bytes: int, max_parts: int
+) -> AsyncIterator[tuple[str, str]]:
+    """Yield (client filename, staged path) per file part as soon as the part is complete."""
+    ctype, opts = parse_options_header(content_type)
+    if ctype != b"multipart/form-data" or b"boundary" not in opts:
+        raise APIException("Expected multipart/form-data", status_code=415)
+    os.makedirs(staging_dir, exist_ok=True)
+    writer = _PartWriter(staging_dir, max_part_bytes, max_parts)
+    parser = MultipartParser(opts[b"boundary"], writer.callbacks())
+    try:
+        async for chunk in body:
+            parser.write(chunk)
+            for part in await asyncio.to_thread(writer.drain):
+                yield part["name"], part["path"]
+        parser.finalize()
+        for part in await asyncio.to_thread(writer.drain):
+            yield part["name"], part["path"]
+    except BaseException:
+        writer.discard()
+        raise
+
+class DicomWorkerPool:
+    """Process pool for process_slice; 0 workers runs slices on a thread instead."""
+
+    def __init__(self, workers: int):
+        self.size = workers
+        self._executor: Optional[Executor] = None
+        self._futures: set[Future] = set()
+
+    @property
+    def in_flight(self) -> int:
+        return sum(not f.done() for f in self._futures)
+
+    async def start(self):
+        """Spawn the workers and wait until each has imported pydicom/numpy/Pillow."""
+        if self.size <= 0 or self._executor is not None:
+            return
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.size, mp_context=multiprocessing.get_context("spawn"), initializer=warm_up
+        )
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, warm_up) for _ in range(self.size)))
+
+    async def submit(self, *args) -> Future:
+        """Queue one slice; cancelling the returned future only stops it if it has not started."""
+        if self.size <= 0:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dicom")
+        else:
+            await self.start()
+        self._futures = {f for f in self._futures if not f.done()}
+        future = self._executor.submit(process_slice, *args)
+        self._futures.add(future)
+        return future
+
+    async def process(self, *args) -> dict:
+        return await asyncio.wrap_future(await self.submit(*args))
+
+    async def aclose(self):
+        if self._executor is not None:
+            await asyncio.to_thread(self._executor.shutdown, True, cancel_futures=True)
+            self._executor = None
+
+_POOL: Optional[DicomWorkerPool] = None
+
+def get_dicom_pool() -> DicomWorkerPool:
+    global _POOL
+    if _POOL is None:
+        _POOL = DicomWorkerPool(settings.DICOM_WORKERS)
+    return _POOL
+
+async def shutdown_dicom():
+    global _POOL
+    if _POOL is not None:
+        await _POOL.aclose()
+        _POOL = None
+
+def uid_salt() -> str:
+    # Same key for every worker and restart, or re-uploads of a study would not group
+    secret = settings.DICOM_UID_SALT or JWT_SECRET_KEY
+    return hashlib.sha256(b"dicom-uid:" + secret.encode()).hexdigest()
+
+_INSERT_SQL = text(
+    "INSERT INTO medical_images (session_id, patient_id, doctor_id, image_type, body_part, study_date, "
+    "modality, file_path, file_size, file_format, dicom_metadata, phi_removed) "
+    "SELECT CAST(:session_id AS uuid), CAST(:patient_id AS uuid), CAST(:doctor_id AS uuid), "
+    "u.image_type, u.body_part, u.study_date, u.modality, u.file_path, u.file_size, 'DICOM', u.dicom_metadata, true "
+    "FROM unnest(CAST(:image_type AS varchar[]), CAST(:body_part AS varchar[]), CAST(:study_date AS timestamp[]), "
+    "CAST(:modality AS varchar[]), CAST(:file_path AS varchar[]), CAST(:file_size AS bigint[]), "
+    "CAST(:dicom_metadata AS jsonb[])) "
+    "AS u(image_type, body_part, study_date, modality, file_path, file_size, dicom_metadata) "
+    "RETURNING id"
+)
+
+def _study_date(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.strptime(value, "%Y%m%d") if value else None
+    except ValueError:
+        return None
+
+async def _owns_patient(user_id: str, patient_id: str) -> bool:
+    async with SessionLocal() as session:
+        await session.execute(RLS_CONTEXT_SQL, {"uid": user_id})
+        row = await session.execute(text("SELECT 1 FROM patients WHERE id = CAST(:pid AS uuid)"), {"pid": patient_id})
+        return row.first() is not None
+
+async def _insert_rows(user_id: str, patient_id: str, session_id: Optional[str], rows: list[dict]) -> list[str]:
+    meta = []
+    for r in rows:
+        meta.append(json.dumps({**r["dicom_metadata"], "preview_path": r["thumbnail_path"]}))
+    params = {
+        "session_id": session_id, "patient_id": patient_id, "doctor_id": user_id,
+        "image_type": [r["image_type"] for r in rows], "body_part": [r["body_part"] for r in rows],
+        "study_date": [_study_date(r["study_date"]) for r in rows], "modality": [r["modality"] for r in rows],
+        "file_path": [r["file_path"] for r in rows], "file_size": [r["file_size"] for r in rows],
+        "dicom_metadata": meta,
+    }
+    # Own short transaction: no pooled connection is held while the upload streams in
+    async with SessionLocal() as session:
+        await session.execute(RLS_CONTEXT_SQL, {"uid": user_id})
+        ids = [str(i) for i in (await session.execute(_INSERT_SQL, params)).scalars()]
+        await session.commit()
+    return ids
+
+def _discard_upload(root: str, staged: list[str], jobs: list[tuple[str, Future]]):
+    """Undo an upload that was not recorded: no slice of it may stay on disk."""
+    for _, future in jobs:
+        future.cancel()  # still queued: never starts
+    for _, future in jobs:
+        try:
+            row = future.result()  # already running: wait, then remove what it wrote
+        except BaseException:
+            continue
+        if row["replaced"]:
+            continue  # the same instance from an earlier, recorded upload
+        for rel in (row["file_path"], row["thumbnail_path"]):
+            if rel:
+                _remove(os.path.join(root, rel))
+    for path in staged:
+        _remove(path)
+
+async def ingest_study(
+    body: AsyncIterator[bytes], content_type: str, user_id: str, patient_id: str, session_id: Optional[str]
+) -> dict:
+    if not await _owns_patient(user_id, patient_id):
+        raise APIException("Patient not found", status_code=404)
+    root = settings.DICOM_STORAGE_DIR
+    pool, salt = get_dicom_pool(), uid_salt()
+    staged: list[str] = []
+    jobs: list[tuple[str, Future]] = []
+    rejected: list[dict] = []
+    recorded = False
+    try:
+        async for name, path in stream_parts(
+            body, content_type, os.path.join(root, ".incoming"),
+            settings.DICOM_MAX_SLICE_MB << 20, settings.DICOM_MAX_SLICES,
+        ):
+            staged.append(path)
+            if not await asyncio.to_thread(_is_dicom, path):
+                _remove(path)
+                rejected.append({"filename": name, "error": "not a DICOM Part 10 file"})
+                continue
+            jobs.append((name, await pool.submit(path, root, patient_id, salt, settings.DICOM_THUMBNAIL_PX)))
+        results = await asyncio.gather(*(asyncio.wrap_future(f) for _, f in jobs), return_exceptions=True)
+        rows = []
+        for (name, _), result in zip(jobs, results):
+            if isinstance(result, Exception):
+                rejected.append({"filename": name, "error": str(result) or type(result).__name__})
+            else:
+                rows.append(result)
+        child(DICOM_SLICES, "stored").inc(len(rows))
+        child(DICOM_SLICES, "rejected").inc(len(rejected))
+        if not rows:
+            raise APIException("No DICOM slices could be ingested", status_code=422)
+        ids = await _insert_rows(user_id, patient_id, session_id, rows)
+        recorded = True
+    finally:
+        if not recorded:
+            # Shielded: a cancelled request still waits for its running workers before cleaning up
+            await asyncio.shield(asyncio.to_thread(_discard_upload, root, staged, jobs))
+    return {
+        "studies": sorted({r["study_uid"] for r in rows}),
+        "series": len({r["series_uid"] for r in rows}),
+        "ingested": len(rows),
+        "rejected": rejected,
+        "images": [
+            {"id": i, "file_path": r["file_path"], "preview_path": r["thumbnail_path"],
+             "modality": r["modality"], "instance_number": r["dicom_metadata"].get("InstanceNumber")}
+            for i, r in zip(ids, rows)
+        ],
+    }
@@ -0,0 +1,235 @@
+# app/services/dicom_workers.py
+"""
+Per-slice DICOM work, run in a process pool by services.dicom_ingest. Kept free of
+app imports and heavy module-level imports: spawned children import this first.
+
+A slice is memory-mapped and its header parsed with `stop_before_pixels`, which
+leaves the file position on the PixelData element. The de-identified copy is the
+re-encoded header, the pixel data element copied straight from the mapping, then any
+elements that followed it (private groups, padding), re-encoded after the same
+stripping. The preview samples every n-th pixel of a zero-copy view, so a slice is
+never decoded or held in memory in full.
+"""
+from typing import Optional
+import hashlib, mmap, os, struct
+
+# Identifying attributes this app could receive from modalities and PACS exports, taken
+# from the PS3.15 Basic Profile table; removed at any depth, private tags too. A subset
+# of that profile (no date shifting, free-text cleaning or burned-in text checks).
+PHI_KEYWORDS = (
+    "PatientName", "PatientID", "IssuerOfPatientID", "OtherPatientIDs", "OtherPatientIDsSequence",
+    "OtherPatientNames", "PatientBirthName", "PatientMotherBirthName", "PatientBirthDate",
+    "PatientBirthTime", "PatientAddress", "PatientTelephoneNumbers", "PatientInsurancePlanCodeSequence",
+    "MilitaryRank", "BranchOfService", "MedicalRecordLocator", "PatientComments", "EthnicGroup",
+    "Occupation", "AdditionalPatientHistory", "ResponsiblePerson", "ResponsibleOrganization",
+    "ReferringPhysicianName", "ReferringPhysicianAddress", "ReferringPhysicianTelephoneNumbers",
+    "PerformingPhysicianName", "NameOfPhysiciansReadingStudy", "PhysiciansOfRecord",
+    "RequestingPhysician", "OperatorsName", "InstitutionName", "InstitutionAddress",
+    "InstitutionalDepartmentName", "StationName", "DeviceSerialNumber", "AccessionNumber",
+    "StudyID", "RequestAttributesSequence", "ReferencedPatientSequence", "ReferencedStudySequence",
+    "PerformedProcedureStepID", "ScheduledProcedureStepID", "RequestedProcedureID",
+    "ContentCreatorName", "FillerOrderNumberImagingServiceRequest", "PlacerOrderNumberImagingServiceRequest",
+)
+# Replaced by a keyed hash: stable within a deployment, so slices still group into series/studies
+UID_KEYWORDS = (
+    "StudyInstanceUID", "SeriesInstanceUID", "SOPInstanceUID", "FrameOfReferenceUID", "ReferencedSOPInstanceUID",
+)
+
+# Kept in medical_images.dicom_metadata (after stripping, so no PHI by construction)
+METADATA_KEYWORDS = (
+    "Modality", "BodyPartExamined", "StudyDescription", "SeriesDescription", "StudyDate", "StudyTime",
+    "SeriesNumber", "InstanceNumber", "SliceThickness", "SliceLocation", "ImagePositionPatient",
+    "ImageOrientationPatient", "PixelSpacing", "Rows", "Columns", "NumberOfFrames", "BitsAllocated",
+    "PhotometricInterpretation", "RescaleSlope", "RescaleIntercept", "WindowCenter", "WindowWidth",
+    "Manufacturer", "ManufacturerModelName", "KVP", "PatientSex", "StudyInstanceUID",
+    "SeriesInstanceUID", "SOPInstanceUID", "SOPClassUID",
+)
+IMAGE_TYPES = {"CT": "ct", "MR": "mri", "CR": "xray", "DX": "xray", "MG": "xray", "US": "ultrasound"}
+
+def warm_up() -> int:
+    # Pool initializer: pay the imports before the first slice, not during it
+    import numpy, pydicom, PIL.Image  # noqa: F401
+    return os.getpid()
+
+def _uid(salt: str, uid: str) -> str:
+    from pydicom.uid import generate_uid
+    return generate_uid(entropy_srcs=[salt, str(uid)])
+
+def _strip(ds, salt: str):
+    for kw in PHI_KEYWORDS:
+        if kw in ds:
+            delattr(ds, kw)
+    ds.remove_private_tags()
+    for kw in UID_KEYWORDS:
+        if kw in ds:
+            setattr(ds, kw, _uid(salt, getattr(ds, kw)))
+    for elem in ds:
+        if elem.VR == "SQ":
+            for item in elem.value:
+                _strip(item, salt)
+
+def strip_phi(ds, salt: str):
+    """De-identify `ds` in place (header only), sequence items included."""
+    _strip(ds, salt)
+    if "SOPInstanceUID" in ds:
+        ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+    ds.PatientIdentityRemoved = "YES"
+    ds.DeidentificationMethod = "ai-medkit: PHI attributes, private tags, UIDs"
+
+def _json_value(value):
+    from pydicom.multival import MultiValue
+    from pydicom.valuerep import IS, DSdecimal, DSfloat
+    if isinstance(value, MultiValue):
+        return [_json_value(v) for v in value]
+    if isinstance(value, IS):
+        return int(value)
+    if isinstance(value, (DSfloat, DSdecimal)):
+        return float(value)
+    if isinstance(value, (int, float, str)) or value is None:
+        return value
+    return str(value)
+
+def _first(value) -> float:
+    from pydicom.multival import MultiValue
+    return float(value[0] if isinstance(value, MultiValue) else value)
+
+_PIXEL_ELEMENTS = (0x0008, 0x0009, 0x0010)  # (7FE0,xxxx): float, double float, PixelData
+
+def _pixel_element(mm, pos: int, little: bool, implicit: bool) -> Optional[tuple[int, int, int, int]]:
+    """
+    (element, value offset, value length, end) of the pixel data element at `pos`;
+    length is -1 for encapsulated (compressed) frames. None if there is none.
+    """
+    if pos + (8 if implicit else 12) > len(mm):
+        return None
+    end = "<" if little else ">"
+    group, element = struct.unpack_from(end + "HH", mm, pos)
+    if group != 0x7FE0 or element not in _PIXEL_ELEMENTS:
+        return None
+    if implicit:
+        length, start = struct.unpack_from(end + "I", mm, pos + 4)[0], pos + 8
+    else:
+        length, start = struct.unpack_from(end + "I", mm, pos + 8)[0], pos + 12
+    if length != 0xFFFFFFFF:
+        return element, start, length, start + length
+    p = start  # items up to the sequence delimiter; encapsulated data is always little endian
+    while p + 8 <= len(mm):
+        group, item, size = struct.unpack_from("<HHI", mm, p)
+        p += 8
+        if (group, item) == (0xFFFE, 0xE0DD):
+            return element, start, -1, p
+        p += size
+    raise ValueError("unterminated encapsulated pixel data")
+
+def _write_trailing(mm, pos: int, ds, salt: str, out):
+    """Elements after the pixel data go through the same stripping, never copied as-is."""
+    from io import BytesIO
+    from pydicom.filebase import DicomFileLike
+    from pydicom.filereader import read_dataset
+    from pydicom.filewriter import write_dataset
+
+    tail = read_dataset(BytesIO(mm[pos:]), ds.is_implicit_VR, ds.is_little_endian)
+    _strip(tail, salt)
+    if "DataSetTrailingPadding" in tail:
+        del tail.DataSetTrailingPadding
+    if len(tail):
+        fp = DicomFileLike(out)
+        fp.is_little_endian, fp.is_implicit_VR = ds.is_little_endian, ds.is_implicit_VR
+        write_dataset(fp, tail)
+
+def _thumbnail(ds, mm, offset: int, size: int, dst: str) -> bool:
+    import numpy as np
+    from PIL import Image
+    rows, cols = int(ds.Rows), int(ds.Columns)
+    spp, bits = int(ds.get("SamplesPerPixel", 1)), int(ds.BitsAllocated)
+    if bits not in (8, 16) or spp not in (1, 3):
+        return False
+    dtype = np.dtype(f"{'i' if ds.get('PixelRepresentation', 0) else 'u'}{bits // 8}")
+    dtype = dtype.newbyteorder("<" if ds.is_little_endian else ">")
+    step = max(1, -(-max(rows, cols) // size))
+    # a view of the mapping: only the sampled pixels are ever read (the caller closes
+    # the mapping after this returns, once the view is gone)
+    frame = np.frombuffer(mm, dtype=dtype, count=rows * cols * spp, offset=offset)
+    if spp == 3:
+        planar = ds.get("PlanarConfiguration", 0) == 1
+        img = frame.reshape(3, rows, cols).transpose(1, 2, 0) if planar else frame.reshape(rows, cols, 3)
+        Image.fromarray(img[::step, ::step].astype(np.uint8), "RGB").save(dst, "PNG")
+        return True
+    small = frame.reshape(rows, cols)[::step, ::step].astype(np.float32)
+    small = small * float(ds.get("RescaleSlope", 1) or 1) + float(ds.get("RescaleIntercept", 0) or 0)
+    center, width = ds.get("WindowCenter"), ds.get("WindowWidth")
+    if center is not None and width is not None:
+        center, width = _first(center), _first(width)
+        lo, hi = center - width / 2, center + width / 2
+    else:
+        lo, hi = np.percentile(small, (1, 99))
+    out = np.clip((small - lo) / max(hi - lo, 1e-6) * 255, 0, 255).astype(np.uint8)
+    if ds.get("PhotometricInterpretation") == "MONOCHROME1":
+        out = 255 - out
+    Image.fromarray(out, "L").save(dst, "PNG")
+    return True
+
+def process_slice(src: str, dst_root: str, rel_dir: str, salt: str, thumb_px: int) -> dict:
+    """
+    De-identify one staged slice into `dst_root/rel_dir/<study>/<sop>.dcm` (+ `.png`
+    preview) and delete the staged original. Returns the medical_images row fields,
+    plus `replaced` when an earlier upload had already stored the same instance.
+    """
+    import pydicom
+    from pydicom.uid import DeflatedExplicitVRLittleEndian
+
+    try:
+        with open(src, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            ds = pydicom.dcmread(mm, stop_before_pixels=True)
+            pixels_at = mm.tell()
+            if ds.file_meta.get("TransferSyntaxUID") == DeflatedExplicitVRLittleEndian:
+                raise ValueError("deflated transfer syntax is not supported")
+            strip_phi(ds, salt)
+
+            study = ds.get("StudyInstanceUID") or hashlib.sha256(src.encode()).hexdigest()[:32]
+            sop = ds.get("SOPInstanceUID") or _uid(salt, os.path.basename(src))
+            rel = os.path.join(rel_dir, str(study), f"{sop}.dcm")
+            dst = os.path.join(dst_root, rel)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            pixels = _pixel_element(mm, pixels_at, ds.is_little_endian, ds.is_implicit_VR)
+            try:
+                with open(dst + ".tmp", "wb") as out:
+                    ds.save_as(out, write_like_original=False)
+                    trailing_at = pixels_at
+                    if pixels is not None:
+                        trailing_at = pixels[3]
+                        out.write(memoryview(mm)[pixels_at:trailing_at])  # the pixel element, verbatim
+                    if trailing_at < len(mm):
+                        _write_trailing(mm, trailing_at, ds, salt, out)
+            except BaseException:
+                if os.path.exists(dst + ".tmp"):
+                    os.remove(dst + ".tmp")
+                raise
+            replaced = os.path.exists(dst)
+            os.replace(dst + ".tmp", dst)
+
+            thumb_rel = None
+            native = pixels is not None and pixels[0] == 0x0010 and pixels[2] >= 0
+            if thumb_px and native and "Rows" in ds and "Columns" in ds:
+                try:
+                    if _thumbnail(ds, mm, pixels[1], thumb_px, dst[:-4] + ".png"):
+                        thumb_rel = rel[:-4] + ".png"
+                except Exception:
+                    pass  # a preview is best effort; the slice itself is stored
+    finally:
+        os.remove(src)  # the only copy with PHI, stored or not
+    modality = str(ds.get("Modality", "")) or None
+    study_date = str(ds.get("StudyDate", "")) or None
+    return {
+        "file_path": rel,
+        "thumbnail_path": thumb_rel,
+        "replaced": replaced,
+        "file_size": os.path.getsize(dst),
+        "modality": modality,
+        "image_type": IMAGE_TYPES.get(modality or "", (modality or "").lower() or None),
+        "body_part": str(ds.get("BodyPartExamined", "")) or None,
+        "study_date": study_date,
+        "study_uid": str(study),
+        "series_uid": str(ds.get("SeriesInstanceUID", "")) or None,
+        "dicom_metadata": {kw: _json_value(ds.get(kw)) for kw in METADATA_KEYWORDS if kw in ds},
+    }
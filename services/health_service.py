@@ -0,0 +1,92 @@
+# app/services/health_service.py
+"""
+Dependency probes for /health/detailed. Probes run concurrently, each with its own
+timeout and measured latency. A background task refreshes the snapshot every
+HEALTH_CHECK_INTERVAL_S, so load-balancer hits are answered from memory and never add
+DB/Redis load of their own.
+"""
+from typing import Awaitable, Callable, Optional
+import asyncio, time
+from app.config import settings
+
+async def _db_probe() -> dict:
+    from app.database import check_database_connection
+    return {"healthy": await check_database_connection()}
+
+async def _ai_probe() -> dict:
+    from app.services.medical_ai_service import check_ai_models
+    return await check_ai_models()
+
+async def _redis_probe() -> dict:
+    from app.services.auth_service import check_redis_connection, redis_pool_stats
+    return {"healthy": await check_redis_connection(), "pool": redis_pool_stats()}
+
+PROBES: dict[str, Callable[[], Awaitable[dict]]] = {
+    "database": _db_probe,
+    "ai_models": _ai_probe,
+    "redis": _redis_probe,
+}
+
+async def _timed(probe: Callable[[], Awaitable[dict]], timeout: float) -> dict:
+    start = time.perf_counter()
+    try:
+        result = dict(await asyncio.wait_for(probe(), timeout))
+        healthy = result.pop("healthy")
+        check = {"status": "healthy" if healthy else "unhealthy", **result}
+    except asyncio.TimeoutError:
+        check = {"status": "unhealthy", "error": f"timed out after {timeout:.1f}s"}
+    except Exception as e:
+        check = {"status": "unhealthy", "error": str(e)}
+    check["response_time_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return check
+
+class HealthMonitor:
+    def __init__(self, interval_s: float, timeout_s: float):
+        self.interval_s = interval_s
+        self.timeout_s = timeout_s
+        self._snapshot: Optional[dict] = None
+        self._refreshing: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh(self) -> dict:
+        names = list(PROBES)
+        results = await asyncio.gather(*(_timed(PROBES[n], self.timeout_s) for n in names))
+        checks = dict(zip(names, results))
+        self._snapshot = {
+            "status": "healthy" if all(c["status"] == "healthy" for c in checks.values()) else "degraded",
+            "timestamp": time.time(),
+            "checks": checks,
+        }
+        return self._snapshot
+
+    async def snapshot(self) -> dict:
+        snap = self._snapshot
+        if snap is None or time.time() - snap["timestamp"] > self.interval_s * 2:
+            # No refresher (or it stalled): refresh inline, single-flight across callers
+            if self._refreshing is None or self._refreshing.done():
+                self._refreshing = asyncio.create_task(self.refresh())
+            snap = await asyncio.shield(self._refreshing)
+        return {**snap, "age_ms": round((time.time() - snap["timestamp"]) * 1000, 1)}
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                pass
+            await asyncio.sleep(self.interval_s)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+health_monitor = HealthMonitor(settings.HEALTH_CHECK_INTERVAL_S, settings.HEALTH_PROBE_TIMEOUT_S)
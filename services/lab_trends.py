@@ -0,0 +1,457 @@
+# app/services/lab_trends.py
+"""
+Lab-result trends and critical values over lab_results.
+
+A patient's history is flattened to one observation per analyte per report and held
+as columnar NumPy arrays sorted by (analyte, time): `codes`, `t` (days), `v`, and the
+parsed reference/critical limits. Each analyte's series is a contiguous slice, and
+`trend_pass` computes over all of them in one vectorized pass:
+
+  - out of range against the parsed `reference_range`, and beyond critical limits
+  - delta and rate of change against the analyte's previous result, with
+    analyte-specific delta rules (e.g. creatinine +0.3 mg/dL within 48 h)
+  - least-squares slope over the last LAB_TREND_WINDOW_DAYS, the run of consecutive
+    moves in one direction, and from those the trend alerts: "worsening" (out of
+    range and still moving away) and "approaching_critical" (projected to cross a
+    critical limit within LAB_TREND_HORIZON_DAYS)
+
+Histories are cached per (doctor, patient). A read fetches only rows updated since
+the last one (less a short overlap, for rows that commit late) and re-runs the pass
+for the analytes they touch; rows it has already folded in are skipped, and a row
+whose updated_at moved forces a rebuild. A full reload happens after
+LAB_TREND_CACHE_TTL_S, which is also how deleted rows drop out.
+"""
+from typing import Any, Iterable, Optional
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import lru_cache
+import asyncio, json, math, re, time
+
+import numpy as np
+from sqlalchemy import text
+
+from app.config import settings
+from app.core.exceptions import APIException
+from app.database import RLS_CONTEXT_SQL, SessionLocal
+
+_EPOCH = datetime(1970, 1, 1)
+_NUM = r"[-+]?\d+(?:[.,]\d+)?"
+_RANGE_RE = re.compile(rf"({_NUM})\s*(?:-|–|—|to)\s*({_NUM})", re.I)
+_BOUND_RE = re.compile(rf"(<=?|>=?|≤|≥|up to|less than|greater than|below|above)\s*({_NUM})", re.I)
+_VALUE_RE = re.compile(rf"^\s*(?:<=?|>=?|≤|≥)?\s*({_NUM})")
+
+# lab_results stamps updated_at with clock_timestamp() when the row is written (schema
+# trigger), so a row can only commit with a stamp older than the watermark by the time
+# its commit takes; the re-read overlap covers that, and rows seen before are skipped
+_OVERLAP = timedelta(seconds=30)
+
+# Per-point flag bits
+LOW, HIGH, CRITICAL_LOW, CRITICAL_HIGH, DELTA = 1, 2, 4, 8, 16
+
+# Absolute critical limits (typical laboratory call-back values), applied only when the
+# result's unit is one of those listed: nothing is converted.
+CRITICAL_LIMITS: dict[str, tuple[float, float, tuple[str, ...]]] = {
+    "potassium": (2.5, 6.5, ("mmol/l", "meq/l")),
+    "sodium": (120, 160, ("mmol/l", "meq/l")),
+    "glucose": (40, 450, ("mg/dl",)),
+    "glucose:mmol/l": (2.2, 25.0, ("mmol/l",)),
+    "calcium": (6.0, 13.0, ("mg/dl",)),
+    "magnesium": (1.0, 4.7, ("mg/dl",)),
+    "hemoglobin": (7.0, 20.0, ("g/dl",)),
+    "platelets": (20, 1000, ("10^9/l", "x10^9/l", "10^3/ul", "k/ul")),
+    "wbc": (2.0, 30.0, ("10^9/l", "x10^9/l", "10^3/ul", "k/ul")),
+    "inr": (math.nan, 5.0, ("", "ratio")),
+    "creatinine": (math.nan, 7.4, ("mg/dl",)),
+    "troponin i": (math.nan, 0.04, ("ng/ml",)),
+    "lactate": (math.nan, 4.0, ("mmol/l",)),
+}
+# (max days since the previous result, change that triggers; its sign is the direction)
+DELTA_RULES: dict[str, tuple[float, float]] = {
+    "creatinine": (2.0, 0.3),   # KDIGO acute kidney injury
+    "hemoglobin": (2.0, -2.0),  # acute drop
+    "potassium": (1.0, 1.0),
+    "sodium": (1.0, 8.0),
+    "platelets": (3.0, -50.0),
+}
+ALIASES = {
+    "k": "potassium", "k+": "potassium", "na": "sodium", "na+": "sodium", "glu": "glucose",
+    "blood glucose": "glucose", "fasting glucose": "glucose", "ca": "calcium", "mg": "magnesium",
+    "hb": "hemoglobin", "hgb": "hemoglobin", "haemoglobin": "hemoglobin", "plt": "platelets",
+    "platelet count": "platelets", "white blood cells": "wbc", "leukocytes": "wbc", "creat": "creatinine",
+    "serum creatinine": "creatinine", "troponin": "troponin i", "ctni": "troponin i",
+}
+
+def _num(s: str) -> float:
+    return float(s.replace(",", "."))
+
+@lru_cache(maxsize=4096)  # a lab prints the same few ranges on every report
+def parse_range(value: Any) -> tuple[float, float]:
+    """'3.5-5.1 mmol/L' -> (3.5, 5.1); '<200' -> (nan, 200); unparseable -> (nan, nan)."""
+    if not value:
+        return math.nan, math.nan
+    s = str(value)
+    m = _RANGE_RE.search(s)
+    if m:
+        return _num(m.group(1)), _num(m.group(2))
+    m = _BOUND_RE.search(s)
+    if m:
+        op, bound = m.group(1).lower(), _num(m.group(2))
+        if op[0] in "<≤" or op in ("up to", "less than", "below"):
+            return math.nan, bound
+        return bound, math.nan
+    return math.nan, math.nan
+
+def parse_value(value: Any) -> float:
+    """Numeric result; censored values ('<0.01', '>1000') count as their bound."""
+    if isinstance(value, bool):
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    m = _VALUE_RE.match(str(value)) if value is not None else None
+    return _num(m.group(1)) if m else math.nan
+
+@lru_cache(maxsize=4096)
+def analyte_key(name: str) -> str:
+    key = " ".join(str(name).lower().replace("_", " ").split())
+    return ALIASES.get(key, key)
+
+def iter_analytes(test_name: str, reference_range: Optional[str], results: Any) -> Iterable[tuple]:
+    """
+    (name, value, unit, reference_range) per analyte in one lab_results row. `results`
+    may be {"analytes": [{"name", "value", "unit", "reference_range"}]}, a list of such
+    dicts, {"<name>": {"value", ...}} / {"<name>": value}, or a bare value for a
+    single-analyte test (then `test_name` and the row's `reference_range` apply).
+    """
+    if isinstance(results, str):
+        try:
+            results = json.loads(results)
+        except ValueError:
+            pass
+    if isinstance(results, dict) and isinstance(results.get("analytes"), list):
+        results = results["analytes"]
+    if isinstance(results, list):
+        for item in results:
+            if isinstance(item, dict):
+                name = item.get("name") or item.get("analyte") or item.get("test") or test_name
+                yield name, item.get("value"), item.get("unit") or "", item.get("reference_range") or reference_range
+        return
+    if isinstance(results, dict):
+        if "value" in results:
+            yield test_name, results.get("value"), results.get("unit") or "", results.get("reference_range") or reference_range
+            return
+        single = len(results) == 1
+        for name, item in results.items():
+            if isinstance(item, dict):
+                yield name, item.get("value"), item.get("unit") or "", item.get("reference_range") or (reference_range if single else None)
+            else:
+                yield name, item, "", reference_range if single else None
+        return
+    yield test_name, results, "", reference_range
+
+def _limits(key: str, unit: str) -> tuple[float, float]:
+    unit = unit.lower().replace(" ", "")
+    for k in (f"{key}:{unit}", key):
+        lim = CRITICAL_LIMITS.get(k)
+        if lim is not None and unit in lim[2]:
+            return lim[0], lim[1]
+    return math.nan, math.nan
+
+def trend_pass(
+    codes: np.ndarray, t: np.ndarray, v: np.ndarray, low: np.ndarray, high: np.ndarray,
+    crit_low: np.ndarray, crit_high: np.ndarray, rule_days: np.ndarray, rule_delta: np.ndarray,
+    window_days: float, min_run: int, horizon_days: float, delta_pct: float, delta_days: float,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, dict]:
+    """
+    One pass over observations sorted by (codes, t). `rule_days`/`rule_delta` are per
+    observation (nan: no rule). Returns per-point (flags, delta, rate per day) and a
+    dict of per-series arrays, one entry per distinct code in order.
+    """
+    n = len(v)
+    idx = np.arange(n)
+    first = np.ones(n, dtype=bool)
+    first[1:] = codes[1:] != codes[:-1]
+    starts = np.flatnonzero(first)
+    ends = np.r_[starts[1:], n]
+    last = ends - 1
+    group = np.cumsum(first) - 1
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        flags = (
+            (v < low) * LOW | (v > high) * HIGH | (v < crit_low) * CRITICAL_LOW | (v > crit_high) * CRITICAL_HIGH
+        ).astype(np.int16)
+
+        prev_v = np.r_[np.nan, v[:-1]]
+        dt = np.r_[np.nan, np.diff(t)]
+        dv = np.where(first, np.nan, v - prev_v)
+        dt = np.where(first, np.nan, dt)
+        rate = np.where(dt > 0, dv / dt, np.nan)
+
+        rule_hit = (dt <= rule_days) & (np.sign(rule_delta) * dv >= np.abs(rule_delta))
+        generic = (dt <= delta_days) & (np.abs(dv) >= delta_pct * np.abs(prev_v)) & (prev_v != 0)
+        flags |= (rule_hit | generic) * DELTA
+
+        # least-squares slope over the window that ends at each series' latest result
+        tr = t - t[last][group]  # <= 0
+        w = (tr >= -window_days).astype(np.float64)
+        ok = w * ~np.isnan(v)
+        vz = np.where(ok > 0, v, 0.0)
+        g = len(starts)
+        sw = np.bincount(group, ok, g)
+        st = np.bincount(group, ok * tr, g)
+        sv = np.bincount(group, vz, g)
+        stt = np.bincount(group, ok * tr * tr, g)
+        stv = np.bincount(group, vz * tr, g)
+        den = sw * stt - st * st
+        slope = np.where((sw >= 2) & (den > 0), (sw * stv - st * sv) / den, np.nan)
+        mean = np.where(sw > 0, sv / sw, np.nan)
+
+    # consecutive same-direction moves ending at the latest result
+    step = np.sign(np.nan_to_num(dv)).astype(np.int8)
+    last_step = step[last]
+    breaks = first | (step != last_step[group])
+    run = last - np.maximum.reduceat(np.where(breaks, idx, -1), starts)
+    run = np.where(last_step == 0, 0, run)
+
+    latest, latest_flags = v[last], flags[last]
+    hi_lim, lo_lim = high[last], low[last]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scale = np.where(np.isfinite(hi_lim - lo_lim), hi_lim - lo_lim, np.abs(mean))
+        change = slope * window_days
+        trend = np.where(np.isnan(slope), 0, np.where(change > 0.1 * scale, 1, np.where(change < -0.1 * scale, -1, 0)))
+        away = (((latest_flags & (HIGH | CRITICAL_HIGH)) > 0) & (last_step > 0)) | (
+            ((latest_flags & (LOW | CRITICAL_LOW)) > 0) & (last_step < 0)
+        )
+        worsening = away & (run >= min_run)
+        to_high = (crit_high[last] - latest) / slope
+        to_low = (crit_low[last] - latest) / slope
+        ahead = lambda d: (d > 0) & (d <= horizon_days)
+        approaching = (
+            (run >= min_run) & ((latest_flags & (CRITICAL_LOW | CRITICAL_HIGH)) == 0)
+            & (((slope > 0) & ahead(to_high)) | ((slope < 0) & ahead(to_low)))
+        )
+    series = {
+        "codes": codes[starts], "count": ends - starts, "latest": latest, "latest_t": t[last],
+        "latest_flags": latest_flags, "delta": dv[last], "rate": rate[last], "slope": slope,
+        "run": run, "trend": trend, "worsening": worsening, "approaching_critical": approaching,
+    }
+    return flags, dv, rate, series
+
+_STATUS = ((CRITICAL_HIGH, "critical_high"), (CRITICAL_LOW, "critical_low"), (HIGH, "high"), (LOW, "low"))
+
+def _date(days: float) -> str:
+    return (_EPOCH + timedelta(days=float(days))).date().isoformat()
+
+def _f(x) -> Optional[float]:
+    return None if x is None or not math.isfinite(x) else round(float(x), 6)
+
+def _stamp(row: dict) -> datetime:
+    return row.get("updated_at") or row["test_date"]
+
+class LabHistory:
+    """One patient's observations as columnar arrays sorted by (analyte, time)."""
+
+    def __init__(self):
+        self.names: list[str] = []          # code -> display name
+        self.units: list[str] = []
+        self._code: dict[tuple[str, str], int] = {}
+        self._raw: dict[tuple[str, str], int] = {}  # as spelled in the rows -> code
+        self.row_ids: dict[str, datetime] = {}  # -> updated_at as folded in
+        self.watermark: Optional[datetime] = None
+        self.loaded_at = time.monotonic()
+        self.codes = np.empty(0, np.int32)
+        self.t = np.empty(0, np.float64)
+        self.v = np.empty(0, np.float64)
+        self.low = np.empty(0, np.float64)
+        self.high = np.empty(0, np.float64)
+        self.flags = np.empty(0, np.int16)
+        self.delta = np.empty(0, np.float64)
+        self.rate = np.empty(0, np.float64)
+        self.summary: dict[int, dict] = {}
+
+    def _code_for(self, name: str, unit: str) -> int:
+        key = (analyte_key(name), unit.strip().lower())
+        code = self._code.get(key)
+        if code is None:
+            code = self._code[key] = len(self.names)
+            self.names.append(str(name).strip())
+            self.units.append(unit.strip())
+        self._raw[(name, unit)] = code
+        return code
+
+    def add_rows(self, rows: Iterable[dict]) -> set[int]:
+        """Fold lab_results rows in; returns the analyte codes to re-analyze."""
+        obs = []  # (code, day, value, low, high)
+        raw = self._raw
+        for row in rows:
+            stamp = self.row_ids[str(row["id"])] = _stamp(row)
+            if self.watermark is None or stamp > self.watermark:
+                self.watermark = stamp
+            day = (row["test_date"] - _EPOCH).total_seconds() / 86400
+            for name, value, unit, rng in iter_analytes(row["test_name"], row.get("reference_range"), row["results"]):
+                x = parse_value(value)
+                if x != x:
+                    continue  # qualitative ("positive", "trace"): not trended
+                code = raw.get((name, unit))
+                if code is None:
+                    code = self._code_for(name, unit)
+                obs.append((code, day, x, *parse_range(rng)))
+        if not obs:
+            return set()
+        cols = np.array(obs, dtype=np.float64).T
+        added = len(obs)
+        self.codes = np.concatenate([self.codes, cols[0].astype(np.int32)])
+        self.t = np.concatenate([self.t, cols[1]])
+        self.v = np.concatenate([self.v, cols[2]])
+        self.low = np.concatenate([self.low, cols[3]])
+        self.high = np.concatenate([self.high, cols[4]])
+        # results computed for untouched analytes move with their rows
+        self.flags = np.concatenate([self.flags, np.zeros(added, np.int16)])
+        self.delta = np.concatenate([self.delta, np.full(added, np.nan)])
+        self.rate = np.concatenate([self.rate, np.full(added, np.nan)])
+        order = np.lexsort((self.t, self.codes))
+        for attr in ("codes", "t", "v", "low", "high", "flags", "delta", "rate"):
+            setattr(self, attr, getattr(self, attr)[order])
+        return set(np.unique(cols[0]).astype(int).tolist())
+
+    def analyze(self, only: Optional[set[int]] = None):
+        """Run trend_pass over every series, or only over the codes in `only`."""
+        mask = np.ones(len(self.v), bool) if only is None else np.isin(self.codes, list(only))
+        if not mask.any():
+            return
+        codes = self.codes[mask]
+        keys = [analyte_key(n) for n in self.names]
+        crit = np.array([_limits(keys[c], self.units[c]) for c in range(len(self.names))]).reshape(-1, 2)
+        rules = np.array([DELTA_RULES.get(k, (math.nan, math.nan)) for k in keys]).reshape(-1, 2)
+        flags, delta, rate, series = trend_pass(
+            codes, self.t[mask], self.v[mask], self.low[mask], self.high[mask],
+            crit[codes, 0], crit[codes, 1], rules[codes, 0], rules[codes, 1],
+            settings.LAB_TREND_WINDOW_DAYS, settings.LAB_TREND_MIN_RUN, settings.LAB_TREND_HORIZON_DAYS,
+            settings.LAB_DELTA_PCT, settings.LAB_DELTA_DAYS,
+        )
+        self.flags[mask], self.delta[mask], self.rate[mask] = flags, delta, rate
+        low_last, high_last = self.low[mask], self.high[mask]
+        last = np.r_[np.flatnonzero(codes[1:] != codes[:-1]), len(codes) - 1]
+        for i, code in enumerate(series["codes"].tolist()):
+            lf = int(series["latest_flags"][i])
+            lo, hi = low_last[last[i]], high_last[last[i]]
+            alerts = []
+            if lf & (CRITICAL_HIGH | CRITICAL_LOW):
+                alerts.append("critical")
+            if lf & DELTA:
+                alerts.append("delta")
+            if series["worsening"][i]:
+                alerts.append("worsening")
+            if series["approaching_critical"][i]:
+                alerts.append("approaching_critical")
+            self.summary[code] = {
+                "analyte": self.names[code],
+                "unit": self.units[code] or None,
+                "count": int(series["count"][i]),
+                "latest": _f(series["latest"][i]),
+                "latest_date": _date(series["latest_t"][i]),
+                "reference_low": _f(lo),
+                "reference_high": _f(hi),
+                "status": next(
+                    (s for bit, s in _STATUS if lf & bit), "normal" if math.isfinite(lo) or math.isfinite(hi) else "unknown"
+                ),
+                "delta": _f(series["delta"][i]),
+                "rate_per_day": _f(series["rate"][i]),
+                "slope_per_year": _f(series["slope"][i] * 365.25),
+                "trend": ("falling", "stable", "rising")[int(series["trend"][i]) + 1],
+                "run": int(series["run"][i]),
+                "alerts": alerts,
+            }
+
+    def series(self, code: int) -> dict:
+        sel = self.codes == code
+        return {
+            "dates": [_date(d) for d in self.t[sel]],
+            "values": self.v[sel].tolist(),
+            "flags": self.flags[sel].tolist(),
+        }
+
+    def report(self, with_series: bool = False) -> dict:
+        analytes = []
+        for code, s in sorted(self.summary.items(), key=lambda kv: kv[1]["analyte"].lower()):
+            analytes.append({**s, **({"series": self.series(code)} if with_series else {})})
+        alerts = [
+            {"analyte": a["analyte"], "alert": alert, "latest": a["latest"], "date": a["latest_date"]}
+            for a in analytes for alert in a["alerts"]
+        ]
+        return {"analytes": analytes, "alerts": alerts, "observations": int(len(self.v))}
+
+_ROW_SQL = (
+    "SELECT id, test_name, test_date, reference_range, results, updated_at FROM lab_results "
+    "WHERE patient_id = CAST(:pid AS uuid)"
+)
+
+class LabTrendCache:
+    """(doctor, patient) -> LabHistory, LRU; concurrent reads of one patient share a load."""
+
+    def __init__(self, max_patients: int, ttl_s: float):
+        self.max_patients = max_patients
+        self.ttl_s = ttl_s
+        self._lru: OrderedDict[tuple[str, str], LabHistory] = OrderedDict()
+        self._locks: dict[tuple[str, str], asyncio.Lock] = {}
+        self.hits = self.incremental = self.full_loads = 0
+
+    async def _fetch(self, user_id: str, patient_id: str, since: Optional[datetime]) -> Optional[list[dict]]:
+        async with SessionLocal() as session:
+            await session.execute(RLS_CONTEXT_SQL, {"uid": user_id})
+            if since is None:
+                owned = await session.execute(
+                    text("SELECT 1 FROM patients WHERE id = CAST(:pid AS uuid)"), {"pid": patient_id}
+                )
+                if owned.first() is None:
+                    return None
+                rows = await session.execute(text(_ROW_SQL + " ORDER BY test_date"), {"pid": patient_id})
+            else:
+                rows = await session.execute(
+                    text(_ROW_SQL + " AND updated_at > :since"), {"pid": patient_id, "since": since - _OVERLAP}
+                )
+            return [dict(r._mapping) for r in rows]
+
+    async def get(self, user_id: str, patient_id: str) -> LabHistory:
+        key = (user_id, patient_id)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            history = self._lru.get(key)
+            if history is not None and time.monotonic() - history.loaded_at > self.ttl_s:
+                history = None
+            if history is not None:
+                rows = await self._fetch(user_id, patient_id, history.watermark)
+                rows = [r for r in rows if history.row_ids.get(str(r["id"])) != _stamp(r)]
+                if any(str(r["id"]) in history.row_ids for r in rows):
+                    history = None  # an existing report was edited: rebuild
+                elif rows:
+                    history.analyze(history.add_rows(rows))
+                    self.incremental += 1
+                else:
+                    self.hits += 1
+            if history is None:
+                rows = await self._fetch(user_id, patient_id, None)
+                if rows is None:
+                    self._locks.pop(key, None)
+                    raise APIException("Patient not found", status_code=404)
+                history = LabHistory()
+                history.add_rows(rows)
+                history.analyze()
+                self.full_loads += 1
+            self._lru[key] = history
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_patients:
+                old, _ = self._lru.popitem(last=False)
+                self._locks.pop(old, None)
+        return history
+
+    def invalidate(self, patient_id: str):
+        for key in [k for k in self._lru if k[1] == patient_id]:
+            del self._lru[key]
+
+    def stats(self) -> dict:
+        return {
+            "patients": len(self._lru), "hits": self.hits,
+            "incremental": self.incremental, "full_loads": self.full_loads,
+        }
+
+lab_trends = LabTrendCache(settings.LAB_TREND_CACHE_SIZE, settings.LAB_TREND_CACHE_TTL_S)
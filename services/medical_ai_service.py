@@ -1,3 +1,6 @@
-async def check_ai_models() -> bool:
-    # Stub for health check; extend to validate model servers/loaders.
-    return True
+from app.services.stt_service import asr_status
+
+async def check_ai_models() -> dict:
+    # ASR is healthy once every configured worker has loaded + warmed up its model.
+    asr = asr_status()
+    return {"healthy": asr["ready_workers"] >= max(1, asr["workers"]), "asr": asr}
@@ -0,0 +1,203 @@
+# app/services/note_stream.py
+"""
+Streaming SOAP-note drafting. The LLM is asked for a note with one heading per section;
+SoapStreamParser turns its token stream into events as it goes:
+
+    {"type": "section", "section": s}                  heading seen, section opened
+    {"type": "delta", "section": s, "text": t}         content, as soon as it cannot be a heading
+    {"type": "section_done", "section": s, "lines": []} next heading (or end) closed it
+    {"type": "done", "soap": {...}, "entities": [...]}
+
+Only the start of a line is held back, and only while it could still turn into a
+heading ("## Pl" -> wait, "- Pl" -> emit), so deltas trail the model by at most a
+heading's length.
+"""
+from dataclasses import asdict
+from typing import AsyncIterator, Optional
+import asyncio, re, time
+
+from app.ai.llm_client import TRANSCRIPT_MARKER, LLMBackend, get_llm_backend
+from app.config import settings
+from app.core.exceptions import APIException
+from app.core.metrics import LLM_NOTE_CANCELLED, LLM_NOTE_FIRST_SECTION, LLM_NOTE_STREAMS
+from app.services.soap_extractor import DEFAULT_EXTRACTOR
+
+SECTION_ORDER = ("subjective", "objective", "assessment", "plan")
+
+_HEADING_WORDS = {
+    "subjective": "subjective", "subjectif": "subjective",
+    "objective": "objective", "objectif": "objective",
+    "assessment": "assessment", "évaluation": "assessment", "evaluation": "assessment",
+    "appréciation": "assessment", "appreciation": "assessment",
+    "plan": "plan",
+}
+# Markdown-ish decorations around a heading; list markers ("- ") mean content, not a heading
+_HEADING = re.compile(
+    r"[ \t#*]*(" + "|".join(sorted(_HEADING_WORDS, key=len, reverse=True)) + r")[ \t*]*(:|$)", re.IGNORECASE
+)
+_LEAD = re.compile(r"[ \t#*]*")
+
+SYSTEM_PROMPTS = {
+    "en": "You are a clinical scribe. Write a concise SOAP note with the headings "
+          "## Subjective, ## Objective, ## Assessment, ## Plan, one '- ' bullet per finding.",
+    "fr": "Vous êtes un assistant de rédaction médicale. Rédigez en français une note SOAP concise avec les "
+          "titres ## Subjectif, ## Objectif, ## Évaluation, ## Plan, une puce '- ' par élément.",
+}
+
+def build_prompt(transcript: str) -> str:
+    return "Draft the SOAP note for this consultation.\n\n" + TRANSCRIPT_MARKER + transcript.strip()
+
+def _maybe_heading(partial: str) -> bool:
+    # Could more text turn this unfinished line into a heading?
+    rest = partial[_LEAD.match(partial).end():].lower()
+    return not rest or any(w.startswith(rest) for w in _HEADING_WORDS)
+
+def _lines(text: str) -> list[str]:
+    return [ln.strip("-•* \t").strip() for ln in text.splitlines() if ln.strip("-•* \t")]
+
+class SoapStreamParser:
+    def __init__(self):
+        self._buf = ""
+        self._line_start = True
+        self.section: Optional[str] = None
+        self.text: dict[str, str] = {s: "" for s in SECTION_ORDER}
+
+    def _close(self, events: list[dict]):
+        if self.section is not None:
+            events.append({"type": "section_done", "section": self.section, "lines": _lines(self.text[self.section])})
+
+    def feed(self, chunk: str, final: bool = False) -> list[dict]:
+        self._buf += chunk
+        events: list[dict] = []
+        while self._buf:
+            if self._line_start:
+                nl = self._buf.find("\n")
+                line = self._buf if nl < 0 else self._buf[:nl]
+                m = _HEADING.match(line)
+                complete = nl >= 0 or final
+                if m and (m.group(2) == ":" or complete):
+                    self._close(events)
+                    self.section = _HEADING_WORDS[m.group(1).lower()]
+                    events.append({"type": "section", "section": self.section})
+                    # "Plan: rest of line" -> the rest is content
+                    self._buf = self._buf[m.end():].lstrip(" \t")
+                    if self._buf.startswith("\n"):
+                        self._buf = self._buf[1:]
+                    else:
+                        self._line_start = False
+                    continue
+                if not complete and (m or _maybe_heading(line)):
+                    break  # wait for more tokens
+                self._line_start = False
+            nl = self._buf.find("\n")
+            text, self._buf = (self._buf, "") if nl < 0 else (self._buf[: nl + 1], self._buf[nl + 1:])
+            self._line_start = nl >= 0
+            if self.section is not None:  # preamble before the first heading is dropped
+                self.text[self.section] += text
+                events.append({"type": "delta", "section": self.section, "text": text})
+        return events
+
+    def close(self) -> list[dict]:
+        events = self.feed("", final=True)
+        self._close(events)
+        self.section = None
+        return events
+
+    def sections(self) -> dict[str, list[str]]:
+        return {s: _lines(t) for s, t in self.text.items()}
+
+class NoteStreamBusy(APIException):
+    def __init__(self):
+        super().__init__("Too many note drafts in progress, wait for one to finish", status_code=429)
+
+class _Slot:
+    """One stream's place in the user's quota. Release is idempotent; `with slot:` releases on exit."""
+    __slots__ = ("_slots", "_user", "_held")
+
+    def __init__(self, slots: "StreamSlots", user: str):
+        self._slots, self._user, self._held = slots, user, True
+
+    def release(self):
+        if self._held:
+            self._held = False
+            self._slots._release(self._user)
+
+    def __enter__(self) -> "_Slot":
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class StreamSlots:
+    """Per-process cap on concurrent streams per user. Rejects instead of queueing: a
+    queued draft is one the doctor has already given up on."""
+
+    def __init__(self, per_user: int):
+        self.per_user = per_user
+        self._active: dict[str, int] = {}
+
+    def acquire(self, user_id: str) -> _Slot:
+        n = self._active.get(user_id, 0)
+        if n >= self.per_user:
+            raise NoteStreamBusy()
+        self._active[user_id] = n + 1
+        LLM_NOTE_STREAMS.inc()
+        return _Slot(self, user_id)
+
+    def _release(self, user_id: str):
+        n = self._active.get(user_id, 0) - 1
+        if n > 0:
+            self._active[user_id] = n
+        else:
+            self._active.pop(user_id, None)
+        LLM_NOTE_STREAMS.dec()
+
+    def active(self, user_id: str) -> int:
+        return self._active.get(user_id, 0)
+
+note_slots = StreamSlots(settings.LLM_MAX_STREAMS_PER_USER)
+
+async def stream_note(
+    transcript: str,
+    language: str = "en",
+    backend: Optional[LLMBackend] = None,
+    slot: Optional[_Slot] = None,
+) -> AsyncIterator[dict]:
+    """
+    Yields parser events, then "done". Closing the generator (client disconnect,
+    cancellation) closes the backend stream, which aborts the upstream request.
+    """
+    backend = backend or get_llm_backend()
+    parser = SoapStreamParser()
+    start = time.perf_counter()
+    first_done = False
+    tokens = backend.stream(
+        build_prompt(transcript),
+        system=SYSTEM_PROMPTS.get(language, SYSTEM_PROMPTS["en"]),
+        max_tokens=settings.LLM_NOTE_MAX_TOKENS,
+    )
+
+    def timed(events: list[dict]) -> list[dict]:
+        nonlocal first_done
+        if not first_done and any(ev["type"] == "section_done" for ev in events):
+            first_done = True
+            LLM_NOTE_FIRST_SECTION.observe(time.perf_counter() - start)
+        return events
+
+    try:
+        async for chunk in tokens:
+            for ev in timed(parser.feed(chunk)):
+                yield ev
+        for ev in timed(parser.close()):
+            yield ev
+        entities = [asdict(e) for e in DEFAULT_EXTRACTOR.extract(transcript).entities]
+        yield {"type": "done", "soap": parser.sections(), "entities": entities}
+    except (asyncio.CancelledError, GeneratorExit):
+        LLM_NOTE_CANCELLED.inc()
+        raise
+    finally:
+        aclose = getattr(tokens, "aclose", None)
+        if aclose is not None:
+            await aclose()
+        if slot is not None:
+            slot.release()
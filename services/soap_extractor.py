@@ -0,0 +1,183 @@
+# app/services/soap_extractor.py
+"""
+Rules-based SOAP extraction over a bilingual (EN/FR) clinical lexicon.
+All terms are folded into one trie-shaped regex at import time, so a transcript is
+scanned once regardless of lexicon size, with word-boundary matching
+("mal" no longer hits "normal"). Matches carry spans and categories; lines are
+assigned to SOAP sections by the categories they contain.
+"""
+from typing import Iterable, Optional
+from bisect import bisect_right
+from dataclasses import dataclass, field
+import re
+
+# category -> SOAP section
+SECTIONS = {
+    "symptom": "subjective",
+    "history": "subjective",
+    "vital": "objective",
+    "exam": "objective",
+    "assessment": "assessment",
+    "plan": "plan",
+}
+
+LEXICON: dict[str, list[str]] = {
+    "symptom": [
+        # EN
+        "pain", "ache", "headache", "symptom", "symptoms", "nausea", "vomiting", "dizziness", "dizzy",
+        "tired", "fever", "chills", "cough", "shortness of breath", "dyspnea", "chest pain",
+        "palpitations", "diarrhea", "constipation", "rash", "itching", "swelling", "numbness", "weakness",
+        "insomnia", "anxiety", "sore throat", "runny nose", "burning",
+        # FR (with and without accents: ASR output is inconsistent)
+        "douleur", "douleurs", "mal", "mal de tête", "mal de tete", "céphalée", "cephalee", "symptôme",
+        "symptome", "symptômes", "symptomes", "nausée", "nausee", "nausées", "vomissement", "vomissements",
+        "vertige", "vertiges", "fatigue", "fièvre", "fievre", "frissons", "toux", "essoufflement", "dyspnée",
+        "dyspnee", "palpitations", "diarrhée", "diarrhee", "éruption", "eruption", "démangeaisons",
+        "gonflement", "engourdissement", "faiblesse", "angoisse", "mal de gorge",
+    ],
+    "history": [
+        "history of", "allergic to", "allergy", "allergies", "smoker", "antécédents", "antecedents",
+        "allergique", "allergie", "fumeur",
+    ],
+    "vital": [
+        "bp", "blood pressure", "hr", "heart rate", "pulse", "rr", "respiratory rate", "temp", "temperature",
+        "spo2", "saturation", "o2 sat", "weight", "height", "bmi", "glucose",
+        "tension", "tension artérielle", "tension arterielle", "fc", "fréquence cardiaque",
+        "frequence cardiaque", "pouls", "température", "poids", "taille", "imc", "glycémie",
+        "glycemie",
+    ],
+    "exam": [
+        "exam", "examination", "on exam", "auscultation", "palpation", "tender", "tenderness", "murmur",
+        "clear lungs", "lungs clear", "abdomen soft", "neuro intact", "edema", "examen", "examen clinique",
+        "souffle", "sensible", "œdème", "oedeme", "abdomen souple", "murmure vésiculaire",
+    ],
+    "assessment": [
+        "assessment", "impression", "diagnosis", "differential", "likely", "suspect", "suspected",
+        "rule out", "r/o", "consistent with", "diagnostic", "diagnostic différentiel", "probable",
+        "suspicion", "évoque", "evoque", "compatible avec",
+    ],
+    "plan": [
+        "plan", "prescribe", "prescribed", "rx", "follow-up", "follow up",
+        "refer", "referral", "labs", "x-ray", "ct", "mri", "ecg", "ekg", "return if",
+        "ordonnance", "prescrire", "prescrit", "traitement", "suivi", "revoir", "contrôle", "controle",
+        "bilan", "radio", "irm", "scanner", "adresser", "arrêt de travail",
+    ],
+}
+
+_VALUE = re.compile(r"[ \t]*[:=]?[ \t]*(\d+(?:[.,]\d+)?(?:[ \t]*/[ \t]*\d+)?)[ \t]*(%|°c|°f|bpm|mmhg|kg|cm|mg/dl|mmol/l)?", re.IGNORECASE)
+
+_SPACES = re.compile(r"\s+")
+
+def _norm(term: str) -> str:
+    return _SPACES.sub(" ", term.lower())
+
+def _trie_pattern(terms: Iterable[str]) -> str:
+    # Factor common prefixes so the regex engine never retries shared stems per term.
+    trie: dict = {}
+    for term in terms:
+        node = trie
+        for ch in term.lower():
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node: dict) -> str:
+        end = "" in node
+        alts = [(r"\s+" if ch == " " else re.escape(ch)) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if end:
+            # A shorter complete term is also a match; make the longer continuation optional
+            body = "(?:" + body + ")?"
+        return body
+
+    return emit(trie)
+
+@dataclass
+class Entity:
+    text: str
+    category: str
+    section: str
+    start: int
+    end: int
+    line: int
+    value: Optional[str] = None
+
+@dataclass
+class SoapResult:
+    sections: dict[str, list[str]]
+    entities: list[Entity] = field(default_factory=list)
+
+class SoapExtractor:
+    def __init__(self, lexicon: dict[str, list[str]]):
+        unknown = set(lexicon) - set(SECTIONS)
+        if unknown:
+            raise ValueError(f"No SOAP section for categories: {sorted(unknown)}")
+        # One trie over every term (one alternation tried per position); the category is
+        # looked up from the normalized match afterwards. First category listed wins on duplicates.
+        self._category: dict[str, str] = {}
+        for cat, terms in lexicon.items():
+            for term in terms:
+                self._category.setdefault(_norm(term), cat)
+        # Letters/digits on either side -> not a whole word. Matching runs on the lowercased
+        # transcript (cheaper than IGNORECASE); the case-insensitive variant covers the rare
+        # text whose length changes when lowercased.
+        body = r"(?<!\w)" + _trie_pattern(self._category) + r"(?!\w)"
+        self.pattern = re.compile(body)
+        self._pattern_ci = re.compile(body, re.IGNORECASE)
+        self.lexicon = lexicon
+
+    def extended(self, extra: dict[str, list[str]]) -> "SoapExtractor":
+        merged = {cat: list(terms) for cat, terms in self.lexicon.items()}
+        for cat, terms in extra.items():
+            merged.setdefault(cat, []).extend(terms)
+        return SoapExtractor(merged)
+
+    def extract(self, transcript: str) -> SoapResult:
+        lines: list[str] = []
+        starts: list[int] = []
+        line_of_offset: list[int] = []  # index into `lines` for each raw line start, -1 if blank
+        for m in re.finditer(r"[^\n]+", transcript):
+            starts.append(m.start())
+            raw = m.group(0)
+            if raw.strip():
+                line_of_offset.append(len(lines))
+                lines.append(raw.strip("-•: ").strip())
+            else:
+                line_of_offset.append(-1)
+
+        lowered = transcript.lower()
+        if len(lowered) == len(transcript):
+            matches = self.pattern.finditer(lowered)
+        else:
+            lowered, matches = transcript, self._pattern_ci.finditer(transcript)
+
+        entities: list[Entity] = []
+        line_sections: dict[int, set[str]] = {}
+        categories = self._category
+        for m in matches:
+            start, end = m.span()
+            idx = line_of_offset[bisect_right(starts, start) - 1]
+            if idx < 0:
+                continue
+            key = m.group(0)
+            category = categories.get(key) or categories.get(_norm(key))
+            if category is None:
+                continue
+            section = SECTIONS[category]
+            value = None
+            if category == "vital":
+                v = _VALUE.match(transcript, end)
+                if v:
+                    value = v.group(1) + (v.group(2) or "")
+            entities.append(Entity(transcript[start:end], category, section, start, end, idx, value))
+            line_sections.setdefault(idx, set()).add(section)
+
+        sections: dict[str, list[str]] = {s: [] for s in ("subjective", "objective", "assessment", "plan")}
+        for idx in sorted(line_sections):
+            for section in sections:
+                if section in line_sections[idx]:
+                    sections[section].append(lines[idx])
+        return SoapResult(sections, entities)
+
+DEFAULT_EXTRACTOR = SoapExtractor(LEXICON)
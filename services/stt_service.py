@@ -1,9 +1,15 @@
 # app/services/stt_service.py
-from typing import Optional
-import tempfile, os, asyncio
+from typing import Awaitable, Callable, Optional
+import tempfile, os, asyncio, functools, time
 from transformers import pipeline
+from app.config import settings
+from app.core.metrics import ASR_BATCH_SIZE, ASR_INFERENCE, ASR_QUEUE_DEPTH
+from app.services.asr_workers import ASRWorkerPool, pipeline_rate, run_pipeline, warm_up
+from app.services.audio_decode import AudioDecodeError, decode_audio, sniff_suffix
+from app.services.transcript_cache import audio_digest, transcript_cache
 
 _ASR_PIPELINE = None
+_POOL: Optional[ASRWorkerPool] = None
 _MODEL_ID = os.getenv("ASR_MODEL_ID", "openai/whisper-base")  # override in env if you prefer
 
 def _get_asr():
@@ -13,17 +19,198 @@ def _get_asr():
         _ASR_PIPELINE = pipeline("automatic-speech-recognition", model=_MODEL_ID)
     return _ASR_PIPELINE
 
-async def transcribe_bytes(data: bytes, language: Optional[str] = None) -> str:
-    # Write to a temp file because some backends require a path
-    with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as f:
+def sampling_rate() -> int:
+    return _POOL.sampling_rate if _POOL is not None else pipeline_rate(_get_asr())
+
+def _infer_batch(inputs: list, language: Optional[str]) -> list[str]:
+    return run_pipeline(_get_asr(), inputs, language)
+
+async def _infer_local(inputs: list, language: Optional[str]) -> list[str]:
+    return await asyncio.to_thread(_infer_batch, inputs, language)
+
+class ASRBatcher:
+    """
+    Micro-batching scheduler in front of the ASR pipeline.
+    Requests are queued and flushed when `max_batch_size` is reached or `max_wait_ms`
+    has elapsed since the first queued item; each caller awaits its own result.
+    Up to `concurrency` batches run at once off the event loop (one per ASR worker),
+    grouped by language hint; while all are busy the queue keeps filling the next batch.
+    If the scheduling task dies, callers still queued get its exception (or are cancelled,
+    on aclose) and the next submit starts a fresh one.
+    """
+    def __init__(
+        self,
+        max_batch_size: int = 8,
+        max_wait_ms: int = 25,
+        infer: Callable[[list, Optional[str]], Awaitable[list[str]]] = _infer_local,
+        concurrency: int = 1,
+    ):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0, max_wait_ms) / 1000
+        self.infer = infer
+        self.concurrency = max(1, concurrency)
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight: set[asyncio.Task] = set()
+
+    def _ensure_started(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            batch: list = []
+            self._worker = asyncio.create_task(self._run(batch))
+            self._worker.add_done_callback(functools.partial(self._fail_pending, self._queue, batch))
+
+    @staticmethod
+    def _fail_pending(queue: asyncio.Queue, batch: list, worker: asyncio.Task):
+        # bound to this worker's queue: a submit may already have started the next one
+        error = None if worker.cancelled() else worker.exception()
+        items = list(batch)
+        batch.clear()
+        while not queue.empty():
+            items.append(queue.get_nowait())
+            ASR_QUEUE_DEPTH.dec()
+        for _, _, fut in items:
+            if fut.done():
+                continue
+            if error is None:
+                fut.cancel()
+            else:
+                fut.set_exception(error)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    async def submit(self, inputs, language: Optional[str] = None) -> str:
+        self._ensure_started()
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((inputs, language, fut))
+        ASR_QUEUE_DEPTH.inc()
+        return await fut
+
+    async def _run(self, batch: list):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            batch.append(await self._queue.get())
+            ASR_QUEUE_DEPTH.dec()
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    ASR_QUEUE_DEPTH.dec()
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._dispatch(list(batch)))
+            batch.clear()
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: list):
+        try:
+            await self._run_groups(batch)
+        finally:
+            self._slots.release()
+            for _, _, fut in batch:
+                if not fut.done():  # cancelled by aclose
+                    fut.cancel()
+
+    async def _run_groups(self, batch: list):
+        groups: dict[Optional[str], list] = {}
+        for item in batch:
+            if not item[2].done():  # skip callers that went away while queued
+                groups.setdefault(item[1], []).append(item)
+        for language, items in groups.items():
+            ASR_BATCH_SIZE.observe(len(items))
+            start = time.perf_counter()
+            try:
+                texts = await self.infer([i[0] for i in items], language)
+            except Exception as e:
+                for _, _, fut in items:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            finally:
+                ASR_INFERENCE.observe(time.perf_counter() - start)
+            for (_, _, fut), text in zip(items, texts):
+                if not fut.done():
+                    fut.set_result(text)
+
+    async def aclose(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for task in list(self._inflight):
+            task.cancel()
+
+_BATCHER = ASRBatcher(settings.ASR_MAX_BATCH_SIZE, settings.ASR_MAX_WAIT_MS)
+
+async def transcribe_bytes(data: bytes | memoryview, language: Optional[str] = None, digest: Optional[str] = None) -> str:
+    # Retried uploads of the same recording are served from the transcript cache
+    key = transcript_cache.key(digest or audio_digest(data), _MODEL_ID, language)
+    return await transcript_cache.get_or_compute(key, lambda: _transcribe_uncached(data, language))
+
+async def _transcribe_uncached(data: bytes | memoryview, language: Optional[str]) -> str:
+    # Decode in memory (no PHI on disk); pipeline accepts {"raw", "sampling_rate"} directly
+    rate = sampling_rate()
+    try:
+        audio = await asyncio.to_thread(decode_audio, data, rate)
+    except AudioDecodeError:
+        return await _transcribe_via_tempfile(data, language)
+    return await transcribe_array(audio, language)
+
+async def transcribe_array(audio, language: Optional[str] = None) -> str:
+    """Transcribe mono float32 samples already at the model's sampling rate."""
+    return await _BATCHER.submit({"raw": audio, "sampling_rate": sampling_rate()}, language)
+
+async def _transcribe_via_tempfile(data: bytes | memoryview, language: Optional[str]) -> str:
+    # Fallback for codecs that can't be decoded in memory: some backends require a path
+    with tempfile.NamedTemporaryFile(suffix=sniff_suffix(data) or ".webm", delete=False) as f:
         f.write(data)
         tmp_path = f.name
     try:
-        asr = _get_asr()
-        # Whisper supports language hints; many HF pipelines ignore it but safe to pass
-        result = await asyncio.to_thread(asr, tmp_path, generate_kwargs={"language": language} if language else None)
-        text = result["text"] if isinstance(result, dict) else str(result)
-        return text.strip()
+        return await _BATCHER.submit(tmp_path, language)
     finally:
         try: os.remove(tmp_path)
         except Exception: pass
+
+async def start_asr():
+    """Load and warm up the model at startup: in a process pool if ASR_WORKERS > 0, else in-process."""
+    global _POOL, _BATCHER
+    if settings.ASR_WORKERS > 0:
+        pool = ASRWorkerPool(_MODEL_ID, settings.ASR_WORKERS, settings.ASR_TORCH_THREADS)
+        await pool.start()
+        _POOL = pool
+        _BATCHER = ASRBatcher(settings.ASR_MAX_BATCH_SIZE, settings.ASR_MAX_WAIT_MS, pool.infer, pool.size)
+    else:
+        await asyncio.to_thread(lambda: warm_up(_get_asr()))
+
+def asr_status() -> dict:
+    if _POOL is not None:
+        status = _POOL.stats()
+    else:
+        loaded = _ASR_PIPELINE is not None
+        status = {"workers": 0, "ready_workers": int(loaded), "in_flight": _BATCHER.in_flight}
+    status["queue_depth"] = _BATCHER.queue_depth
+    status["transcript_cache"] = transcript_cache.stats()
+    return status
+
+async def shutdown_asr():
+    global _POOL
+    await _BATCHER.aclose()
+    if _POOL is not None:
+        await _POOL.aclose()
+        _POOL = None
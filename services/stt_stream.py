@@ -0,0 +1,105 @@
+# app/services/stt_stream.py
+"""
+Incremental transcription for live dictation.
+Audio is kept in a fixed-size buffer starting at the current (uncommitted) window.
+Every `step_s` of new audio the window is re-transcribed and emitted as a partial;
+once it reaches `window_s` the text is committed as a final segment and the window
+slides forward, keeping `overlap_s` of audio as context for the next one.
+"""
+from typing import Optional
+import re
+import numpy as np
+from app.config import settings
+from app.services.stt_service import transcribe_array
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+def _key(word: str) -> str:
+    return "".join(_WORD.findall(word.lower()))
+
+def _strip_overlap(prev: list[str], words: list[str], max_k: int = 20) -> list[str]:
+    # The overlap audio is transcribed twice; drop the longest prefix of `words` that repeats the tail of `prev`.
+    p = [_key(w) for w in prev[-max_k:]]
+    n = [_key(w) for w in words[:max_k]]
+    for k in range(min(len(p), len(n)), 0, -1):
+        if p[-k:] == n[:k]:
+            return words[k:]
+    return words
+
+class StreamingTranscriber:
+    def __init__(
+        self,
+        rate: int,
+        language: Optional[str] = None,
+        window_s: float = settings.STT_STREAM_WINDOW_S,
+        overlap_s: float = settings.STT_STREAM_OVERLAP_S,
+        step_s: float = settings.STT_STREAM_STEP_S,
+        max_buffer_s: float = settings.STT_STREAM_MAX_BUFFER_S,
+    ):
+        self.rate = rate
+        self.language = language
+        self.window = int(window_s * rate)
+        self.overlap = min(int(overlap_s * rate), self.window // 2)
+        self.step = max(1, int(step_s * rate))
+        self._buf = np.empty(max(int(max_buffer_s * rate), self.window + self.step), dtype=np.float32)
+        self._n = 0              # samples held in _buf
+        self._offset = 0         # absolute sample index of _buf[0]
+        self._since_decode = 0
+        self._committed: list[str] = []
+        self._committed_end = 0  # absolute sample index covered by final segments
+
+    @property
+    def ready(self) -> bool:
+        return self._since_decode >= self.step
+
+    def feed(self, samples: np.ndarray) -> bool:
+        """Append float32 samples; oldest audio is dropped if the buffer is full. Returns `ready`."""
+        cap = len(self._buf)
+        if len(samples) >= cap:
+            self._offset += self._n + len(samples) - cap
+            self._buf[:] = samples[-cap:]
+            self._n = cap
+        else:
+            drop = max(0, self._n + len(samples) - cap)
+            if drop:
+                self._buf[: self._n - drop] = self._buf[drop : self._n]
+                self._n -= drop
+                self._offset += drop
+            self._buf[self._n : self._n + len(samples)] = samples
+            self._n += len(samples)
+        self._since_decode += len(samples)
+        return self.ready
+
+    def _segment(self, kind: str, text: str, start: int, end: int) -> dict:
+        return {"type": kind, "text": text, "start": round(start / self.rate, 2), "end": round(end / self.rate, 2)}
+
+    async def step_once(self) -> list[dict]:
+        """Transcribe the current window; returns a partial, or a final segment once the window is full."""
+        n, start = self._n, self._offset
+        if n == 0:
+            return []
+        self._since_decode = 0
+        text = await transcribe_array(self._buf[:n].copy(), self.language)
+        words = _strip_overlap(self._committed, text.split())
+        if n < self.window:
+            return [self._segment("partial", " ".join(words), start, start + n)]
+        # Window full: commit and slide. Feeds may have run during inference, so work in absolute positions.
+        self._committed = (self._committed + words)[-50:]
+        self._committed_end = start + n
+        drop = min(self._n, max(0, start + n - self.overlap - self._offset))
+        self._buf[: self._n - drop] = self._buf[drop : self._n]
+        self._n -= drop
+        self._offset += drop
+        return [self._segment("final", " ".join(words), start, start + n)]
+
+    async def flush(self) -> list[dict]:
+        """Commit whatever is left at end of stream."""
+        n, start = self._n, self._offset
+        self._since_decode = 0
+        if start + n <= self._committed_end:
+            return []
+        text = await transcribe_array(self._buf[:n].copy(), self.language)
+        words = _strip_overlap(self._committed, text.split())
+        self._committed = (self._committed + words)[-50:]
+        self._committed_end = start + n
+        return [self._segment("final", " ".join(words), start, start + n)] if words else []
@@ -0,0 +1,128 @@
+# app/services/transcript_cache.py
+"""
+Content-addressed transcript cache: sha-256(audio) + ASR model + language -> transcript.
+Bounded in-process LRU in front of an optional Redis tier. Entries are Fernet-encrypted
+in both tiers (transcripts are PHI) and expire after TRANSCRIPT_CACHE_TTL_S.
+Concurrent requests for the same key share a single transcription, which runs in its
+own task: it outlives the request that started it and is cancelled only when every
+request waiting on it has gone.
+"""
+from typing import Awaitable, Callable, Optional
+from collections import OrderedDict
+import asyncio, base64, hashlib, time
+from cryptography.fernet import Fernet, InvalidToken
+from app.config import settings
+from app.core.metrics import redis_timer
+from app.core.redis_pool import get_redis
+from app.core.security import JWT_SECRET_KEY
+
+def _fernet() -> Fernet:
+    secret = settings.CACHE_ENCRYPTION_KEY or JWT_SECRET_KEY
+    return Fernet(base64.urlsafe_b64encode(hashlib.sha256(secret.encode()).digest()))
+
+def audio_digest(data: bytes | memoryview) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+class TranscriptCache:
+    def __init__(self, max_entries: int, ttl_s: int, use_redis: bool = False):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._lru: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._pending: dict[str, list] = {}  # key -> [task, waiters]
+        self._fernet = _fernet()
+        self._redis = get_redis() if use_redis else None
+        self.hits = self.misses = self.evictions = self.redis_hits = self.coalesced = 0
+
+    @staticmethod
+    def key(digest: str, model_id: str, language: Optional[str]) -> str:
+        return f"stt:{model_id}:{language or '-'}:{digest}"
+
+    def _get_local(self, key: str) -> Optional[str]:
+        entry = self._lru.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._lru[key]
+            return None
+        self._lru.move_to_end(key)
+        return self._fernet.decrypt(entry[1]).decode()
+
+    def _put_local(self, key: str, token: bytes, ttl_s: float):
+        self._lru[key] = (time.monotonic() + ttl_s, token)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, key: str) -> Optional[str]:
+        text = self._get_local(key)
+        if text is not None:
+            return text
+        if self._redis is None:
+            return None
+        try:
+            with redis_timer("transcript_cache_get"):
+                token = await self._redis.get(key)
+            if token is None:
+                return None
+            text = self._fernet.decrypt(token, ttl=self.ttl_s).decode()
+            with redis_timer("transcript_cache_ttl"):
+                ttl = await self._redis.ttl(key)
+        except InvalidToken:
+            return None
+        except Exception:
+            return None  # fail-open on Redis errors
+        self.redis_hits += 1
+        self._put_local(key, token, ttl if ttl and ttl > 0 else self.ttl_s)
+        return text
+
+    async def set(self, key: str, text: str):
+        token = self._fernet.encrypt(text.encode())
+        self._put_local(key, token, self.ttl_s)
+        if self._redis is not None:
+            try:
+                with redis_timer("transcript_cache_set"):
+                    await self._redis.set(key, token, ex=self.ttl_s)
+            except Exception:
+                pass
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        text = await self.get(key)
+        if text is not None:
+            self.hits += 1
+            return text
+        entry = self._pending.get(key)
+        if entry is None:
+            self.misses += 1
+            entry = self._pending[key] = [asyncio.create_task(self._compute(key, compute)), 0]
+            # a done callback also runs for a task cancelled before it started
+            entry[0].add_done_callback(lambda _: self._pending.pop(key) if self._pending.get(key) is entry else None)
+        else:
+            self.coalesced += 1
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                task.cancel()  # nobody is waiting for it any more
+
+    async def _compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        text = await compute()
+        await self.set(key, text)
+        return text
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._lru),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "redis_hits": self.redis_hits,
+            "coalesced": self.coalesced,
+        }
+
+transcript_cache = TranscriptCache(
+    settings.TRANSCRIPT_CACHE_SIZE, settings.TRANSCRIPT_CACHE_TTL_S, settings.TRANSCRIPT_CACHE_REDIS
+)
@@ -0,0 +1,331 @@
+# app/services/ws_hub.py
+"""
+Cross-worker websocket fan-out. Each uvicorn worker keeps a registry of its own
+sockets by topic (`user:<id>`, `session:<id>`) and holds ONE Redis pub/sub
+connection, subscribed to `ws:<topic>` for exactly the topics that have a local
+socket (reference counted), plus `ws:broadcast`. `publish()` goes through Redis, so
+a doctor with tabs on several workers gets the event in every tab.
+
+Per socket, events wait in a bounded outbox drained by a sender task:
+  - batching: everything queued when the sender wakes (after WS_FLUSH_MS) goes out
+    as one frame, `{"type": "batch", "events": [...]}`, up to WS_BATCH_MAX events
+  - coalescing: an event published with a `key` replaces a queued one with the same
+    key (progress, "patient list changed"), in place
+  - backpressure: a full outbox drops its oldest event and tells the client with
+    `{"type": "dropped", "count": n}`; a send that takes longer than
+    WS_SEND_TIMEOUT_S closes the socket (1013) so one laggard cannot pin memory
+
+Pub/sub is at-most-once: after a Redis reconnect every local socket gets
+`{"type": "resync"}` and should refetch what it shows. A message that is not what
+publish() sends is logged and skipped; it does not cost the connection.
+"""
+from typing import Awaitable, Callable, Optional
+from collections import OrderedDict
+import asyncio, itertools, json, logging
+
+from app.config import settings
+from app.core.metrics import WS_CONNECTIONS, WS_EVENTS, WS_SLOW_CLOSED, child
+
+logger = logging.getLogger(__name__)
+
+BROADCAST = "broadcast"
+_PREFIX = "ws:"
+_RESYNC = '{"type":"resync"}'
+_SLOW_CONSUMER = 1013  # "try again later"
+
+def _decode(data) -> tuple[Optional[str], str]:
+    """(key, payload) of a published message; ValueError if it is not one."""
+    try:
+        key, payload = json.loads(data)
+    except TypeError:
+        raise ValueError("not a [key, payload] pair")
+    if not isinstance(payload, str) or not (key is None or isinstance(key, str)):
+        raise ValueError("not a [key, payload] pair")
+    return key, payload
+
+class Subscriber:
+    """One websocket: its topics and its outbox."""
+    def __init__(
+        self,
+        user_id: str,
+        send: Callable[[str], Awaitable[None]],
+        close: Callable[[int], Awaitable[None]],
+        max_pending: int,
+        batch_max: int,
+        flush_s: float,
+        send_timeout_s: float,
+    ):
+        self.user_id = user_id
+        self.topics: set[str] = set()
+        self.max_pending = max(1, max_pending)
+        self.batch_max = max(1, batch_max)
+        self.flush_s = flush_s
+        self.send_timeout_s = send_timeout_s
+        self.frames = self.sent = self.coalesced = self.dropped = 0
+        self.closed = False
+        self._send, self._close = send, close
+        self._pending: OrderedDict = OrderedDict()  # key (or a sequence number) -> JSON text
+        self._seq = itertools.count()
+        self._unreported = 0
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def offer(self, payload: str, key: Optional[str] = None) -> str:
+        """Queue an already-encoded event; returns the outcome for metrics."""
+        if self.closed:
+            return "dropped"
+        outcome = "queued"
+        if key is not None and key in self._pending:
+            self._pending[key] = payload
+            self.coalesced += 1
+            outcome = "coalesced"
+        else:
+            if len(self._pending) >= self.max_pending:
+                self._pending.popitem(last=False)
+                self.dropped += 1
+                self._unreported += 1
+                outcome = "dropped"
+            self._pending[key if key is not None else next(self._seq)] = payload
+        self._wake.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return outcome
+
+    def _frame(self) -> tuple[str, int]:
+        n = min(self.batch_max, len(self._pending))
+        events = [self._pending.popitem(last=False)[1] for _ in range(n)]
+        if self._unreported:
+            events.insert(0, f'{{"type":"dropped","count":{self._unreported}}}')
+            self._unreported = 0
+        if len(events) == 1:
+            return events[0], n
+        return '{"type":"batch","events":[' + ",".join(events) + "]}", n
+
+    async def _run(self):
+        while not self.closed:
+            await self._wake.wait()
+            if self.flush_s:
+                await asyncio.sleep(self.flush_s)  # let a burst land in one frame
+            self._wake.clear()
+            while self._pending and not self.closed:
+                frame, n = self._frame()
+                try:
+                    await asyncio.wait_for(self._send(frame), self.send_timeout_s)
+                except asyncio.TimeoutError:
+                    WS_SLOW_CLOSED.inc()
+                    await self.close(_SLOW_CONSUMER)
+                    return
+                except Exception:
+                    self.closed = True  # socket already gone; the route unregisters it
+                    return
+                self.frames += 1
+                self.sent += n
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        self._pending.clear()
+        try:
+            await asyncio.wait_for(self._close(code), self.send_timeout_s)
+        except Exception:
+            pass
+
+    def stop(self):
+        self.closed = True
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+class FanoutHub:
+    def __init__(
+        self,
+        max_pending: int,
+        batch_max: int,
+        flush_ms: float,
+        send_timeout_s: float,
+        redis=None,
+        reconnect_s: float = 1.0,
+    ):
+        self.max_pending = max_pending
+        self.batch_max = batch_max
+        self.flush_s = max(0.0, flush_ms) / 1000
+        self.send_timeout_s = send_timeout_s
+        self.reconnect_s = reconnect_s
+        self.redis = redis
+        self.published = self.received = self.malformed = self.local_fallbacks = self.reconnects = 0
+        self._topics: dict[str, set[Subscriber]] = {}
+        self._pubsub = None
+        self._ready = asyncio.Event()
+        self._sub_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # -- registry --
+
+    async def connect(
+        self, user_id: str, send: Callable[[str], Awaitable[None]], close: Callable[[int], Awaitable[None]]
+    ) -> Subscriber:
+        sub = Subscriber(user_id, send, close, self.max_pending, self.batch_max, self.flush_s, self.send_timeout_s)
+        WS_CONNECTIONS.inc()
+        await self.subscribe(sub, f"user:{user_id}")
+        return sub
+
+    async def subscribe(self, sub: Subscriber, topic: str):
+        if topic in sub.topics:
+            return
+        sub.topics.add(topic)
+        subs = self._topics.setdefault(topic, set())
+        subs.add(sub)
+        if len(subs) == 1:
+            await self._channel("subscribe", topic)
+
+    async def unsubscribe(self, sub: Subscriber, topic: str):
+        if topic not in sub.topics:
+            return
+        sub.topics.discard(topic)
+        subs = self._topics.get(topic)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self._topics[topic]
+                await self._channel("unsubscribe", topic)
+
+    async def disconnect(self, sub: Subscriber):
+        sub.stop()
+        for topic in list(sub.topics):
+            await self.unsubscribe(sub, topic)
+        WS_CONNECTIONS.dec()
+
+    def connections(self, topic: str) -> int:
+        return len(self._topics.get(topic, ()))
+
+    # -- pub/sub --
+
+    async def _channel(self, op: str, topic: str):
+        # The reader resubscribes everything in _topics after a reconnect, so a failure
+        # here only delays this topic until then.
+        if self._sub_lock is None:
+            return  # not started: local delivery only
+        try:
+            async with self._sub_lock:
+                if not self._ready.is_set():
+                    return
+                if (topic in self._topics) == (op == "subscribe"):  # still wanted after waiting
+                    await getattr(self._pubsub, op)(_PREFIX + topic)
+        except Exception as e:
+            logger.warning("ws hub: %s %s failed: %s", op, topic, e)
+
+    async def publish(self, topic: str, event: dict, key: Optional[str] = None):
+        """Deliver `event` to every socket subscribed to `topic`, on any worker."""
+        payload = json.dumps(event, separators=(",", ":"), default=str)
+        self.published += 1
+        if self._task is not None:
+            try:
+                await self.redis.publish(_PREFIX + topic, json.dumps([key, payload]))
+                return
+            except Exception as e:
+                logger.warning("ws hub: publish failed, delivering locally only: %s", e)
+        self.local_fallbacks += 1
+        self._deliver(topic, payload, key)
+
+    def _deliver(self, topic: str, payload: str, key: Optional[str]):
+        subs = self._topics.get(topic, ())
+        if topic == BROADCAST:
+            subs = {s for group in self._topics.values() for s in group}
+        for sub in list(subs):
+            child(WS_EVENTS, sub.offer(payload, key)).inc()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            if self.redis is None:
+                from app.core.redis_pool import get_redis
+                self.redis = get_redis()
+            self._sub_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def _connect(self):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        async with self._sub_lock:
+            await pubsub.subscribe(_PREFIX + BROADCAST, *(_PREFIX + t for t in self._topics))
+            self._pubsub = pubsub
+            self._ready.set()
+
+    async def _run(self):
+        first = True
+        while True:
+            try:
+                await self._connect()
+                if not first:
+                    self.reconnects += 1
+                    for sub in {s for group in self._topics.values() for s in group}:
+                        sub.offer(_RESYNC, key="resync")
+                first = False
+                while True:
+                    msg = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if msg is None or msg.get("type") != "message":
+                        continue
+                    channel = msg["channel"]
+                    channel = channel.decode() if isinstance(channel, bytes) else channel
+                    try:
+                        key, payload = _decode(msg["data"])
+                    except ValueError as e:
+                        self.malformed += 1
+                        logger.warning("ws hub: skipping malformed message on %s: %s", channel, e)
+                        continue
+                    self.received += 1
+                    self._deliver(channel[len(_PREFIX):], payload, key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # once per outage, not once per retry
+                (logger.warning if self._ready.is_set() or first else logger.debug)(
+                    "ws hub: pub/sub connection lost, reconnecting: %s", e
+                )
+                first = False
+                self._ready.clear()
+                await self._drop_pubsub()
+                await asyncio.sleep(self.reconnect_s)
+
+    async def _drop_pubsub(self):
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is not None:
+            try:
+                await pubsub.close()
+            except Exception:
+                pass
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._ready.clear()
+        await self._drop_pubsub()
+        for sub in {s for group in self._topics.values() for s in group}:
+            await sub.close(1001)  # going away
+            sub.stop()
+
+    def stats(self) -> dict:
+        subs = {s for group in self._topics.values() for s in group}
+        return {
+            "connections": len(subs), "topics": len(self._topics), "connected": self._ready.is_set(),
+            "published": self.published, "received": self.received, "malformed": self.malformed,
+            "reconnects": self.reconnects,
+            "local_fallbacks": self.local_fallbacks,
+            "queued": sum(len(s._pending) for s in subs),
+        }
+
+ws_hub = FanoutHub(
+    settings.WS_SEND_QUEUE,
+    settings.WS_BATCH_MAX,
+    settings.WS_FLUSH_MS,
+    settings.WS_SEND_TIMEOUT_S,
+)
+
+async def publish_user(user_id: str, event: dict, key: Optional[str] = None):
+    await ws_hub.publish(f"user:{user_id}", event, key)
+
+async def publish_session(session_id: str, event: dict, key: Optional[str] = None):
+    await ws_hub.publish(f"session:{session_id}", event, key)
@@ -0,0 +1,92 @@
+# tests/test_audit_writer.py
+import glob
+import json
+import os
+import uuid
+
+import asyncpg
+import pytest
+
+from app.services.audit_service import AuditWriter
+
+GHOST = str(uuid.uuid5(uuid.NAMESPACE_URL, "dev-login"))  # no users row: FK violation
+
+
+class FakeDB:
+    """Stands in for the audit_log writer: rows for unknown users are refused like the FK does."""
+
+    def __init__(self):
+        self.rows = []
+        self.down = False
+
+    async def write(self, events: list):
+        if self.down:
+            raise ConnectionRefusedError("connection refused")
+        if any(e[0] == GHOST for e in events):
+            raise asyncpg.ForeignKeyViolationError("audit_log_user_id_fkey")
+        self.rows.extend(events)
+
+
+@pytest.fixture
+def db():
+    return FakeDB()
+
+
+@pytest.fixture
+def writer(db, tmp_path):
+    return AuditWriter(batch_size=10, spill_dir=str(tmp_path), write=db.write)
+
+
+def rejected(tmp_path) -> list:
+    lines = []
+    for path in glob.glob(os.path.join(tmp_path, "rejected", "*.jsonl")):
+        with open(path) as f:
+            lines += [json.loads(line) for line in f]
+    return lines
+
+
+def spilled(tmp_path) -> list:
+    return glob.glob(os.path.join(tmp_path, "audit-*.jsonl"))
+
+
+@pytest.mark.asyncio
+async def test_rejected_row_is_quarantined_and_the_rest_written(writer, db, tmp_path):
+    for i in range(5):
+        writer.record("login", user_id=GHOST if i == 2 else uuid.uuid4())
+    await writer.flush()
+
+    assert len(db.rows) == 4
+    assert [r["event"][0] for r in rejected(tmp_path)] == [GHOST]
+    assert "ForeignKeyViolationError" in rejected(tmp_path)[0]["error"]
+    assert spilled(tmp_path) == []
+    assert writer.stats()["written"] == 4 and writer.stats()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_unreachable_db_spills_and_replays(writer, db, tmp_path):
+    db.down = True
+    for _ in range(3):
+        writer.record("view_patient", user_id=uuid.uuid4())
+    await writer.flush()
+    assert db.rows == [] and len(spilled(tmp_path)) == 1 and rejected(tmp_path) == []
+
+    db.down = False
+    writer.record("view_patient", user_id=uuid.uuid4())
+    await writer.flush()
+    assert len(db.rows) == 4 and spilled(tmp_path) == []
+    assert writer.stats()["replayed"] == 3
+
+
+@pytest.mark.asyncio
+async def test_poison_spill_file_does_not_block_replay(writer, db, tmp_path):
+    db.down = True
+    writer.record("login", user_id=GHOST)
+    await writer.flush()
+    writer.record("login", user_id=uuid.uuid4())
+    await writer.flush()
+    assert len(spilled(tmp_path)) == 2
+
+    db.down = False
+    await writer.flush()  # nothing queued: replays the spill files
+    assert len(db.rows) == 1 and len(rejected(tmp_path)) == 1
+    assert spilled(tmp_path) == []
@@ -0,0 +1,137 @@
+# tests/test_calendar_index.py
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import calendar
+from app.core.exceptions import APIException, api_exception_handler
+from app.deps.auth import CurrentUser, get_current_user
+from app.services import calendar_index as ci
+
+DOCTOR = str(uuid.uuid4())
+
+
+class Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __iter__(self):
+        return iter(type("Row", (), {"_mapping": r})() for r in self.rows)
+
+    def mappings(self):
+        return self
+
+    def one(self):
+        return self.rows[0]
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+
+class FakePool:
+    """SessionLocal over an in-memory appointments table, `size` connections, 1 s checkout timeout."""
+
+    def __init__(self, size: int):
+        self.connections = asyncio.Semaphore(size)
+        self.rows = []
+        self.lock = asyncio.Lock()  # the advisory lock
+
+    def __call__(self):
+        return FakeSession(self)
+
+
+class FakeSession:
+    def __init__(self, pool: FakePool):
+        self.pool = pool
+        self.locked = False
+
+    async def __aenter__(self):
+        await asyncio.wait_for(self.pool.connections.acquire(), 1)
+        return self
+
+    async def __aexit__(self, *exc):
+        if self.locked:
+            self.pool.lock.release()
+        self.pool.connections.release()
+
+    async def execute(self, stmt, params=None):
+        sql = str(stmt)
+        await asyncio.sleep(0)
+        if "pg_advisory_xact_lock" in sql:
+            await self.pool.lock.acquire()
+            self.locked = True
+        elif sql.startswith("INSERT INTO appointments"):
+            row = {
+                "id": uuid.uuid4(), "appointment_datetime": params["start"], "duration_minutes": params["duration"],
+                "status": "scheduled", "updated_at": datetime.now(),
+            }
+            self.pool.rows.append(row)
+            return Result([row])
+        elif "FROM appointments" in sql:
+            since = params.get("since")
+            return Result([r for r in self.pool.rows if since is None or r["updated_at"] > since])
+        return Result([])
+
+    async def commit(self):
+        if self.locked:
+            self.pool.lock.release()
+            self.locked = False
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = FakePool(size=1)
+    monkeypatch.setattr(ci, "SessionLocal", pool)
+    monkeypatch.setattr(ci, "calendar_index", ci.CalendarCache(16, 900))
+    return pool
+
+
+def visit(start: datetime) -> dict:
+    return {
+        "title": "visit", "start": start, "duration": 30, "patient_id": None, "description": None,
+        "appointment_type": None, "location": None, "is_virtual": False,
+    }
+
+
+def next_workday_9am() -> datetime:
+    day = datetime.now().date() + timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=9)
+
+
+@pytest.mark.asyncio
+async def test_bookings_do_not_wait_on_a_second_connection(pool):
+    start = next_workday_9am()
+    booked = await asyncio.gather(*(ci.book(DOCTOR, visit(start + timedelta(minutes=30 * i))) for i in range(8)))
+    assert len({b["id"] for b in booked}) == 8 and len(pool.rows) == 8
+
+
+@pytest.mark.asyncio
+async def test_concurrent_bookings_of_one_slot_admit_one(pool):
+    start = next_workday_9am()
+    results = await asyncio.gather(*(ci.book(DOCTOR, visit(start)) for _ in range(5)), return_exceptions=True)
+    assert sum(isinstance(r, dict) for r in results) == 1
+    assert all(r.status_code == 409 for r in results if isinstance(r, APIException))
+
+
+def test_far_off_search_does_not_grow_the_gap_tree():
+    today = ci.to_minute(datetime.now()) // ci.DAY
+    cal = ci.DoctorCalendar(ci.CalendarCache.hours(), today)
+    far = ci.to_minute(datetime(9999, 1, 1, 17))
+    cal.slots(far, 600, 5, 366)
+    assert cal._cap <= 2048  # two horizons of days, rounded up to a power of two
+
+
+def test_availability_after_beyond_the_horizon_is_rejected():
+    app = FastAPI()
+    app.add_exception_handler(APIException, api_exception_handler)
+    app.include_router(calendar.router, prefix="/api/v1/calendar")
+    app.dependency_overrides[get_current_user] = lambda: CurrentUser(id=DOCTOR, email="dr@example.org", role="doctor")
+    with TestClient(app) as client:
+        resp = client.get("/api/v1/calendar/availability/next", params={"after": "9999-01-01T17:00", "duration_minutes": 600})
+    assert resp.status_code == 422
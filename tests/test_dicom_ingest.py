@@ -0,0 +1,159 @@
+# tests/test_dicom_ingest.py
+import asyncio
+import os
+
+import numpy as np
+import pydicom
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.sequence import Sequence
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+from app.services import dicom_ingest
+from app.services.dicom_workers import process_slice
+
+SALT = "test-salt"
+
+
+def write_slice(path: str, trailing: bool = True) -> str:
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.file_meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.2"
+    ds.SOPClassUID = ds.file_meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = ds.file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    ds.StudyInstanceUID, ds.SeriesInstanceUID = generate_uid(), generate_uid()
+    ds.Modality, ds.PatientName, ds.PatientID = "CT", "Doe^Jane", "MRN-1234"
+    referenced = Dataset()
+    referenced.ReferencedSOPInstanceUID = "1.2.3.4.5"
+    referenced.PatientName = "Doe^Jane"
+    referenced.add_new(0x00111001, "LO", "nested private")
+    ds.ReferencedImageSequence = Sequence([referenced])
+    ds.Rows = ds.Columns = 8
+    ds.BitsAllocated = ds.BitsStored = 16
+    ds.HighBit, ds.PixelRepresentation, ds.SamplesPerPixel = 15, 0, 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.PixelData = np.arange(64, dtype=np.uint16).tobytes()
+    if trailing:
+        ds.add_new(0x7FE10010, "LO", "Jane Doe trailing private")
+        ds.add_new(0xFFFCFFFC, "OB", b"\0" * 16)  # DataSetTrailingPadding
+        ds.add_new(0x7FE30010, "SQ", Sequence([Dataset()]))
+        ds[0x7FE30010].value[0].PatientID = "MRN-1234"
+    ds.is_little_endian, ds.is_implicit_VR = True, False
+    pydicom.dcmwrite(path, ds, write_like_original=False)
+    return path
+
+
+def test_slice_is_stripped_at_any_depth_and_after_pixel_data(tmp_path):
+    src = write_slice(str(tmp_path / "in.dcm"))
+    row = process_slice(src, str(tmp_path), "patient", SALT, 0)
+
+    assert not os.path.exists(src)
+    raw = open(tmp_path / row["file_path"], "rb").read()
+    assert b"Doe^Jane" not in raw and b"MRN-1234" not in raw and b"Jane Doe" not in raw
+    ds = pydicom.dcmread(tmp_path / row["file_path"])
+    assert ds.PatientIdentityRemoved == "YES"
+    item = ds.ReferencedImageSequence[0]
+    assert "PatientName" not in item and (0x0011, 0x1001) not in item
+    assert item.ReferencedSOPInstanceUID != "1.2.3.4.5"
+    assert ds.pixel_array.tolist() == np.arange(64).reshape(8, 8).tolist()
+    assert (0x7FE1, 0x0010) not in ds and "DataSetTrailingPadding" not in ds
+
+
+def test_failed_write_leaves_no_temp_file(tmp_path, monkeypatch):
+    src = write_slice(str(tmp_path / "in.dcm"))
+
+    def broken(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr("app.services.dicom_workers._write_trailing", broken)
+    with pytest.raises(OSError):
+        process_slice(src, str(tmp_path), "patient", SALT, 0)
+    left = [f for _, _, files in os.walk(tmp_path) for f in files]
+    assert not any(f.endswith(".tmp") for f in left)
+
+
+def multipart(files: dict, boundary: str = "b0undary") -> tuple[str, list[bytes]]:
+    chunks = []
+    for name, data in files.items():
+        chunks.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="files"; filename="{name}"\r\n'
+            f"Content-Type: application/dicom\r\n\r\n".encode() + data + b"\r\n"
+        )
+    return f"multipart/form-data; boundary={boundary}", chunks
+
+
+@pytest.fixture
+def ingest(tmp_path, monkeypatch):
+    pool = dicom_ingest.DicomWorkerPool(0)
+    monkeypatch.setattr(dicom_ingest.settings, "DICOM_STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(dicom_ingest, "get_dicom_pool", lambda: pool)
+    monkeypatch.setattr(dicom_ingest, "uid_salt", lambda: SALT)
+
+    async def owns(user_id, patient_id):
+        return True
+
+    monkeypatch.setattr(dicom_ingest, "_owns_patient", owns)
+    yield tmp_path
+    pool._executor.shutdown(wait=True)
+
+
+def files_under(root) -> list[str]:
+    return [os.path.join(d, f) for d, _, files in os.walk(root) for f in files]
+
+
+@pytest.mark.asyncio
+async def test_aborted_upload_leaves_nothing_on_disk(ingest, tmp_path_factory):
+    src = tmp_path_factory.mktemp("src")
+    ctype, chunks = multipart({f"{i}.dcm": open(write_slice(str(src / f"{i}.dcm")), "rb").read() for i in range(4)})
+
+    async def body():
+        for chunk in chunks:
+            yield chunk
+        raise ConnectionResetError("client went away")
+
+    with pytest.raises(ConnectionResetError):
+        await dicom_ingest.ingest_study(body(), ctype, "doctor", "patient", None)
+    assert files_under(ingest) == []
+
+
+@pytest.mark.asyncio
+async def test_failed_insert_removes_outputs(ingest, tmp_path_factory, monkeypatch):
+    src = tmp_path_factory.mktemp("src")
+    ctype, chunks = multipart({f"{i}.dcm": open(write_slice(str(src / f"{i}.dcm")), "rb").read() for i in range(3)})
+
+    async def body():
+        for chunk in chunks + [b"--b0undary--\r\n"]:
+            yield chunk
+
+    async def insert(*args):
+        raise RuntimeError("database down")
+
+    monkeypatch.setattr(dicom_ingest, "_insert_rows", insert)
+    with pytest.raises(RuntimeError):
+        await dicom_ingest.ingest_study(body(), ctype, "doctor", "patient", None)
+    assert files_under(ingest) == []
+
+
+@pytest.mark.asyncio
+async def test_cancelled_upload_waits_for_running_slice(ingest, tmp_path_factory):
+    src = tmp_path_factory.mktemp("src")
+    ctype, chunks = multipart({"0.dcm": open(write_slice(str(src / "0.dcm")), "rb").read()})
+    stalled = asyncio.Event()
+
+    async def body():
+        for chunk in chunks + [b"--b0undary--\r\n"]:
+            yield chunk
+        stalled.set()
+        await asyncio.sleep(3600)
+
+    task = asyncio.create_task(dicom_ingest.ingest_study(body(), ctype, "doctor", "patient", None))
+    await stalled.wait()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    for _ in range(100):  # cleanup carries on in a thread after the cancellation
+        if not files_under(ingest):
+            break
+        await asyncio.sleep(0.05)
+    assert files_under(ingest) == []
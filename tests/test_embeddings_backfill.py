@@ -0,0 +1,82 @@
+# tests/test_embeddings_backfill.py
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.ai import embeddings
+
+
+class FakeService:
+    encoded = 0
+
+    async def embed(self, texts: list) -> np.ndarray:
+        self.encoded += len(texts)
+        return np.zeros((len(texts), 4), dtype=np.float32)
+
+
+class FakeStore:
+    def __init__(self, ids=()):
+        self.rows = set(ids)
+
+    def add(self, ids, vecs, doctor_id, patient_id):
+        self.rows.update(ids)
+
+    def ids(self):
+        return list(self.rows)
+
+    def remove(self, ids):
+        gone = self.rows & set(ids)
+        self.rows -= gone
+        return len(gone)
+
+
+def documents(fail_after: int = None):
+    async def read(table, yield_per):
+        for i in range(10):
+            if i == fail_after:
+                raise ConnectionResetError("connection lost mid-stream")
+            yield table, i, "doctor", "patient", f"note {i}"
+    return read
+
+
+def reread(bodies: dict):
+    async def read(table, yield_per):
+        for i, body in bodies.items():
+            yield table, i, "doctor", "patient", body
+    return read
+
+
+@pytest.mark.asyncio
+async def test_backfill_embeds_every_row(monkeypatch):
+    monkeypatch.setattr(embeddings, "_documents", documents())
+    store = FakeStore()
+    stats = await embeddings.backfill(FakeService(), store, ["chat_messages"], batch_texts=3)
+    assert stats["documents"] == 10 and len(store.rows) == 10
+
+
+@pytest.mark.asyncio
+async def test_reindex_drops_chunks_that_no_longer_exist(monkeypatch):
+    store = FakeStore(["chat_messages:1:0", "chat_messages:1:1", "chat_messages:1:2", "chat_messages:2:0",
+                       "chat_messages:3:0", "lab_results:1:0"])
+    # doc 1 shrank to one chunk, doc 2 was emptied, doc 3 deleted; lab_results is not reindexed
+    monkeypatch.setattr(embeddings, "_documents", reread({1: "short now", 2: ""}))
+    stats = await embeddings.backfill(FakeService(), store, ["chat_messages"])
+    assert store.rows == {"chat_messages:1:0", "lab_results:1:0"} and stats["removed"] == 4
+
+
+@pytest.mark.asyncio
+async def test_failed_run_removes_nothing(monkeypatch):
+    store = FakeStore(["chat_messages:42:0"])
+    monkeypatch.setattr(embeddings, "_documents", documents(fail_after=3))
+    with pytest.raises(ConnectionResetError):
+        await embeddings.backfill(FakeService(), store, ["chat_messages"], batch_texts=1)
+    assert "chat_messages:42:0" in store.rows
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fail_after", [0, 4, 7])
+async def test_reader_failure_is_raised_not_hung(monkeypatch, fail_after):
+    monkeypatch.setattr(embeddings, "_documents", documents(fail_after))
+    with pytest.raises(ConnectionResetError):
+        await asyncio.wait_for(embeddings.backfill(FakeService(), FakeStore(), ["chat_messages"], batch_texts=1), 5)
@@ -0,0 +1,101 @@
+# tests/test_lab_trends.py
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services import lab_trends as lt
+
+DOCTOR, PATIENT = str(uuid.uuid4()), str(uuid.uuid4())
+
+
+class Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __iter__(self):
+        return iter(type("Row", (), {"_mapping": r})() for r in self.rows)
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+
+class FakeLabs:
+    """SessionLocal over an in-memory lab_results table; `rows` is what has committed."""
+
+    def __init__(self):
+        self.rows = []
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def execute(self, stmt, params=None):
+        sql = str(stmt)
+        if "FROM patients" in sql:
+            return Result([1])
+        if "FROM lab_results" in sql:
+            since = params.get("since")
+            return Result([dict(r) for r in self.rows if since is None or r["updated_at"] > since])
+        return Result([])
+
+    def add(self, value: float, days_ago: int, stamp: datetime) -> dict:
+        row = {
+            "id": uuid.uuid4(), "test_name": "Potassium", "test_date": datetime(2026, 1, 1) - timedelta(days=days_ago),
+            "reference_range": "3.5-5.1", "results": {"value": value, "unit": "mmol/L"}, "updated_at": stamp,
+        }
+        self.rows.append(row)
+        return row
+
+
+@pytest.fixture
+def labs(monkeypatch):
+    labs = FakeLabs()
+    monkeypatch.setattr(lt, "SessionLocal", labs)
+    return labs
+
+
+@pytest.fixture
+def cache():
+    return lt.LabTrendCache(16, 900)
+
+
+def latest(history) -> float:
+    return history.report()["analytes"][0]["latest"]
+
+
+@pytest.mark.asyncio
+async def test_rows_seen_again_in_the_overlap_are_not_edits(labs, cache):
+    now = datetime(2026, 1, 1, 12)
+    labs.add(4.0, 10, now - timedelta(seconds=5))
+    labs.add(4.2, 5, now)
+    await cache.get(DOCTOR, PATIENT)
+    await cache.get(DOCTOR, PATIENT)
+    assert cache.stats()["full_loads"] == 1 and cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_row_committed_with_an_older_stamp_is_picked_up(labs, cache):
+    now = datetime(2026, 1, 1, 12)
+    labs.add(4.0, 10, now)
+    await cache.get(DOCTOR, PATIENT)
+    labs.add(5.9, 0, now - timedelta(seconds=10))  # stamped before the watermark, committed after
+    history = await cache.get(DOCTOR, PATIENT)
+    assert latest(history) == 5.9 and len(history.v) == 2
+    assert cache.stats()["full_loads"] == 1 and cache.stats()["incremental"] == 1
+
+
+@pytest.mark.asyncio
+async def test_edited_row_forces_a_rebuild(labs, cache):
+    now = datetime(2026, 1, 1, 12)
+    row = labs.add(4.0, 0, now)
+    await cache.get(DOCTOR, PATIENT)
+    row.update(results={"value": 6.8, "unit": "mmol/L"}, updated_at=now + timedelta(minutes=1))
+    history = await cache.get(DOCTOR, PATIENT)
+    assert latest(history) == 6.8 and len(history.v) == 1
+    assert cache.stats()["full_loads"] == 2
@@ -0,0 +1,121 @@
+# tests/test_llm_client.py
+import asyncio
+
+import httpx
+import pytest
+
+from app.ai.llm_client import HTTPProvider, LLMClient, LLMError, OpenAIProvider
+from app.benchmarks.llm_client import standin
+
+PROMPT = "Transcript 1: patient reports chest pain, BP 135/85"
+
+
+@pytest.fixture
+def upstream():
+    """make(latency_ms, error_rate, seed, **client_kwargs) -> (stand-in app, LLMClient)"""
+    clients = []
+
+    def make(latency_ms: float = 20, error_rate: float = 0.0, seed: int = 1, **kwargs):
+        app = standin(latency_ms, error_rate, seed)
+        http = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), timeout=10)
+        clients.append(http)
+        kwargs.setdefault("backoff_base_s", 0.001)
+        return app, LLMClient(OpenAIProvider("http://standin/v1", "test", "standin", http=http), **kwargs)
+
+    yield make
+    for http in clients:
+        asyncio.run(http.aclose())  # in-process transport: no sockets tied to the test's loop
+
+
+async def collect(chunks) -> str:
+    return "".join([c async for c in chunks])
+
+
+def test_provider_is_abstract():
+    with pytest.raises(TypeError):
+        HTTPProvider("http://standin/v1", "test", "standin")
+
+
+@pytest.mark.asyncio
+async def test_identical_streams_share_one_upstream_call(upstream):
+    app, client = upstream()
+    texts = await asyncio.gather(*(collect(client.stream(PROMPT)) for _ in range(8)))
+    assert len(set(texts)) == 1 and texts[0].startswith("Draft for: ")
+    assert app.state.calls == 1
+    assert client.stats()["coalesced"] == 7 and client.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_complete_joins_a_running_stream(upstream):
+    app, client = upstream()
+    streamed = asyncio.create_task(collect(client.stream(PROMPT)))
+    await asyncio.sleep(0)
+    assert await client.complete(PROMPT) == await streamed
+    assert app.state.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_reader_leaving_does_not_cut_off_the_others(upstream):
+    app, client = upstream()
+    leaver, stayer = client.stream(PROMPT), client.stream(PROMPT)
+    first, rest = await asyncio.gather(anext(leaver), collect(stayer))
+    await leaver.aclose()
+    assert rest.startswith(first) and len(rest) > len(first)
+    assert app.state.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_last_reader_leaving_aborts_upstream(upstream):
+    app, client = upstream(latency_ms=500)
+    reader = asyncio.create_task(collect(client.stream(PROMPT)))
+    await asyncio.sleep(0.05)
+    reader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await reader
+    await asyncio.sleep(0)
+    assert client.stats()["in_flight"] == 0 and client.stats()["cached"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cache_evicts_least_recently_used(upstream):
+    app, client = upstream(cache_size=2)
+    for i in (1, 2, 3):
+        await client.complete(f"prompt {i}")
+    await client.complete("prompt 3")
+    assert app.state.calls == 3 and client.hits == 1
+    await client.complete("prompt 1")  # evicted by prompt 3
+    assert app.state.calls == 4
+    assert await collect(client.stream("prompt 1")) and app.state.calls == 4
+
+
+@pytest.mark.asyncio
+async def test_cache_entries_expire(upstream):
+    app, client = upstream(cache_ttl_s=0)
+    await client.complete(PROMPT)
+    await client.complete(PROMPT)
+    assert app.state.calls == 2 and client.hits == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["complete", "stream"])
+async def test_retries_transient_errors(upstream, mode):
+    # seed 3 at a 60% error rate: 503, 503, then 200
+    app, client = upstream(error_rate=0.6, seed=3, max_retries=3)
+    text = await (client.complete(PROMPT) if mode == "complete" else collect(client.stream(PROMPT)))
+    assert text.startswith("Draft for: ")
+    assert app.state.calls == 3 and client.retries == 2
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries(upstream):
+    app, client = upstream(error_rate=1.0, max_retries=2)
+    with pytest.raises(LLMError) as failed:
+        await collect(client.stream(PROMPT))
+    assert failed.value.status == 503 and app.state.calls == 3 and client.retries == 2
+
+
+def test_backoff_is_jittered_capped_and_honours_retry_after():
+    client = LLMClient(OpenAIProvider("http://standin/v1", "test", "standin"), backoff_base_s=0.5, backoff_max_s=2.0)
+    delays = [client._backoff(5, LLMError("standin", "HTTP 503", 503)) for _ in range(200)]
+    assert max(delays) <= 2.0 and min(delays) < 1.0
+    assert client._backoff(0, LLMError("standin", "HTTP 429", 429, retry_after=3.0)) == 3.0
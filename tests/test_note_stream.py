@@ -0,0 +1,145 @@
+# tests/test_note_stream.py
+import json
+import time
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.ai.llm_client import FakeLLMBackend, set_llm_backend
+from app.api import medical, websocket
+from app.core.exceptions import APIException, api_exception_handler
+from app.core.metrics import LLM_NOTE_CANCELLED
+from app.core.security import create_access_token
+from app.deps.auth import CurrentUser, get_current_user
+from app.services.note_stream import note_slots
+
+TRANSCRIPT = "Patient reports chest pain since yesterday. Blood pressure 150/90. Start aspirin."
+
+
+@pytest.fixture
+def user(monkeypatch):
+    async def not_revoked(digest):
+        return False
+
+    monkeypatch.setattr(websocket, "is_token_revoked", not_revoked)
+    uid = str(uuid.uuid4())
+    yield uid, create_access_token({"sub": uid})
+    assert note_slots.active(uid) == 0
+
+
+@pytest.fixture
+def client(user):
+    uid, _ = user
+    app = FastAPI()
+    app.add_exception_handler(APIException, api_exception_handler)
+    app.include_router(medical.router, prefix="/api/v1/medical")
+    app.include_router(websocket.router, prefix="/api/v1/ws")
+    app.dependency_overrides[get_current_user] = lambda: CurrentUser(id=uid, email="dr@example.org", role="doctor")
+    with TestClient(app) as client:
+        yield client
+    set_llm_backend(None)
+
+
+def fake(first_token_s: float = 0.0, token_s: float = 0.0) -> FakeLLMBackend:
+    backend = FakeLLMBackend(first_token_s, token_s)
+    set_llm_backend(backend)
+    return backend
+
+
+def sse_events(body: str) -> list[tuple[str, dict]]:
+    events = []
+    for frame in body.strip().split("\n\n"):
+        kind, data = frame.split("\n")
+        events.append((kind.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def wait_released(uid: str):
+    for _ in range(100):  # the app runs on the test client's event loop thread
+        if note_slots.active(uid) == 0:
+            return
+        time.sleep(0.02)
+
+
+def test_sse_frames(client, user):
+    fake()
+    resp = client.post("/api/v1/medical/note-from-transcript/stream", json={"transcript": TRANSCRIPT})
+    assert resp.status_code == 200 and resp.headers["content-type"].startswith("text/event-stream")
+    events = sse_events(resp.text)
+    assert all(kind == ev["type"] for kind, ev in events)
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == "section" and kinds[-1] == "done" and "delta" in kinds
+    assert set(events[-1][1]["soap"]) == {"subjective", "objective", "assessment", "plan"}
+
+
+def test_ws_frames(client, user):
+    fake()
+    _, token = user
+    with client.websocket_connect("/api/v1/ws/note") as ws:
+        ws.send_json({"type": "start", "token": token, "transcript": TRANSCRIPT})
+        events = []
+        while not events or events[-1]["type"] != "done":
+            events.append(ws.receive_json())
+    assert events[0]["type"] == "section" and {e["type"] for e in events} >= {"delta", "section_done"}
+
+
+def test_per_user_cap(client, user):
+    uid, token = user
+    held = [note_slots.acquire(uid) for _ in range(note_slots.per_user)]
+    try:
+        resp = client.post("/api/v1/medical/note-from-transcript/stream", json={"transcript": TRANSCRIPT})
+        assert resp.status_code == 429
+        with client.websocket_connect("/api/v1/ws/note") as ws:
+            ws.send_json({"type": "start", "token": token, "transcript": TRANSCRIPT})
+            assert ws.receive_json()["type"] == "error"
+            with pytest.raises(WebSocketDisconnect) as closed:
+                ws.receive_json()
+            assert closed.value.code == 4429
+    finally:
+        for slot in held:
+            slot.release()
+
+
+def test_disconnect_cancels_generation(client, user):
+    uid, token = user
+    backend = fake(token_s=0.5)  # the full draft would take tens of seconds
+    cancelled = LLM_NOTE_CANCELLED._value.get()
+    with client.websocket_connect("/api/v1/ws/note") as ws:
+        ws.send_json({"type": "start", "token": token, "transcript": TRANSCRIPT})
+        assert ws.receive_json()["type"] == "section"
+        assert note_slots.active(uid) == 1
+        ws.close(1001)
+        wait_released(uid)  # before leaving the block, which would cancel the app outright
+        assert note_slots.active(uid) == 0 and backend.calls == 1
+    assert LLM_NOTE_CANCELLED._value.get() == cancelled + 1
+
+
+def test_cancel_message(client, user):
+    _, token = user
+    fake(token_s=0.05)
+    with client.websocket_connect("/api/v1/ws/note") as ws:
+        ws.send_json({"type": "start", "token": token, "transcript": TRANSCRIPT})
+        ws.receive_json()
+        ws.send_json({"type": "cancel"})
+        while (ev := ws.receive_json())["type"] != "cancelled":
+            assert ev["type"] in ("section", "delta", "section_done")
+
+
+@pytest.mark.parametrize("start", [{"type": "start", "token": 42}, {"type": "start"}, ["start"]])
+def test_malformed_start_is_a_policy_violation(client, start):
+    with client.websocket_connect("/api/v1/ws/note") as ws:
+        ws.send_json(start)
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+    assert closed.value.code == 1008
+
+
+def test_bad_token(client):
+    with client.websocket_connect("/api/v1/ws/note") as ws:
+        ws.send_json({"type": "start", "token": "not-a-jwt"})
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+    assert closed.value.code == 4401
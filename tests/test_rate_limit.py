@@ -0,0 +1,75 @@
+# tests/test_rate_limit.py
+import uuid
+
+import fakeredis
+import pytest
+from jose import jwt
+from starlette.responses import PlainTextResponse
+
+from app.core import middleware
+from app.core.security import create_access_token
+
+TOKEN_ROUTE = "/api/v1/auth/token"
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setattr(middleware, "get_redis", lambda: client)
+    return client
+
+
+@pytest.fixture
+def limited(redis):
+    return middleware.RateLimitMiddleware(PlainTextResponse("ok"))
+
+
+async def call(app, path: str, token: str = None, ip: str = "10.0.0.1") -> int:
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    scope = {"type": "http", "method": "POST", "path": path, "headers": headers, "client": (ip, 40000)}
+    status = None
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+def forged(sub: str) -> str:
+    return jwt.encode({"sub": sub}, "not-the-server-key", algorithm="HS256")
+
+
+@pytest.mark.asyncio
+async def test_forged_subjects_do_not_get_fresh_login_buckets(limited):
+    limit = middleware.settings.RATE_LIMIT_ROUTES[TOKEN_ROUTE]
+    statuses = [await call(limited, TOKEN_ROUTE, forged(uuid.uuid4().hex)) for _ in range(limit + 1)]
+    assert statuses[:limit] == [200] * limit
+    assert statuses[-1] == 429
+
+
+@pytest.mark.asyncio
+async def test_login_route_is_per_ip_even_with_valid_tokens(limited):
+    limit = middleware.settings.RATE_LIMIT_ROUTES[TOKEN_ROUTE]
+    tokens = [create_access_token({"sub": str(uuid.uuid4())}) for _ in range(limit + 1)]
+    statuses = [await call(limited, TOKEN_ROUTE, t) for t in tokens]
+    assert statuses[-1] == 429
+    assert await call(limited, TOKEN_ROUTE, tokens[0], ip="10.0.0.2") == 200
+
+
+@pytest.mark.asyncio
+async def test_forged_victim_subject_does_not_drain_victims_bucket(limited, redis):
+    limited.user_limit = 5
+    victim = str(uuid.uuid4())
+    for i in range(20):
+        await call(limited, "/api/v1/patients", forged(victim), ip=f"10.0.1.{i}")
+    assert not await redis.exists(f"rl:user:{victim}")
+
+    real = create_access_token({"sub": victim})
+    statuses = [await call(limited, "/api/v1/patients", real) for _ in range(6)]
+    assert statuses == [200] * 5 + [429]
@@ -0,0 +1,64 @@
+# tests/test_stt_batcher.py
+import asyncio
+
+import pytest
+
+from app.services.stt_service import ASRBatcher
+
+
+async def echo(inputs: list, language):
+    await asyncio.sleep(0.01)
+    return [f"text {i}" for i in inputs]
+
+
+class Crashing(ASRBatcher):
+    """Scheduler that dies after taking the first request off the queue."""
+
+    async def _run(self, batch: list):
+        batch.append(await self._queue.get())
+        await asyncio.sleep(0.01)
+        raise RuntimeError("scheduler bug")
+
+
+@pytest.mark.asyncio
+async def test_requests_are_batched():
+    batcher = ASRBatcher(max_batch_size=4, max_wait_ms=20, infer=echo)
+    texts = await asyncio.gather(*(batcher.submit(i) for i in range(4)))
+    assert texts == [f"text {i}" for i in range(4)]
+    await batcher.aclose()
+
+
+@pytest.mark.asyncio
+async def test_dead_worker_fails_every_pending_caller():
+    batcher = Crashing(max_batch_size=4, max_wait_ms=1000, infer=echo)
+    results = await asyncio.wait_for(
+        asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True), 1
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert batcher.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_next_submit_restarts_the_worker():
+    batcher = ASRBatcher(max_batch_size=4, max_wait_ms=1000, infer=echo)
+    waiting = asyncio.gather(*(batcher.submit(i) for i in range(2)), return_exceptions=True)
+    await asyncio.sleep(0.01)
+    batcher._worker.cancel()
+    results = await asyncio.wait_for(waiting, 1)
+    assert all(isinstance(r, asyncio.CancelledError) for r in results)
+    batcher.max_wait = 0
+    assert await batcher.submit(7) == "text 7"
+    await batcher.aclose()
+
+
+@pytest.mark.asyncio
+async def test_aclose_does_not_strand_running_batches():
+    async def slow(inputs, language):
+        await asyncio.sleep(5)
+
+    batcher = ASRBatcher(max_batch_size=1, max_wait_ms=0, infer=slow)
+    running = asyncio.ensure_future(batcher.submit(1))
+    await asyncio.sleep(0.01)
+    await batcher.aclose()
+    with pytest.raises(asyncio.CancelledError):
+        await asyncio.wait_for(running, 1)
@@ -0,0 +1,70 @@
+# tests/test_token_revocation.py
+import uuid
+
+import fakeredis
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from jose import jwt
+
+from app.api import auth
+from app.core import redis_pool
+from app.core.security import (
+    JWT_ALGORITHM, JWT_SECRET_KEY, create_access_token, is_token_revoked, revoke_token, token_cache, token_digest,
+)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = fakeredis.FakeServer()
+    client = fakeredis.aioredis.FakeRedis(server=server)
+    monkeypatch.setattr(redis_pool, "get_redis", lambda: client)
+    return server
+
+
+@pytest.fixture
+def token():
+    token = create_access_token({"sub": str(uuid.uuid4())})
+    token_cache.decode(token)
+    return token
+
+
+@pytest.mark.asyncio
+async def test_revoked_token_is_denylisted(server, token):
+    await revoke_token(token)
+    assert await is_token_revoked(token_digest(token))
+    assert token_digest(token) not in token_cache._lru
+
+
+@pytest.mark.asyncio
+async def test_revoke_with_redis_down_still_drops_the_cached_token(server, token):
+    server.connected = False
+    await revoke_token(token)  # logout must not fail
+    assert token_digest(token) not in token_cache._lru
+
+
+@pytest.fixture
+def client(server):
+    app = FastAPI()
+    app.include_router(auth.router, prefix="/api/v1/auth")
+    with TestClient(app) as client:
+        yield client
+
+
+def logout(client, token: str) -> int:
+    return client.post("/api/v1/auth/logout", headers={"Authorization": f"Bearer {token}"}).status_code
+
+
+def test_logout(client, server, token):
+    assert logout(client, token) == 204
+    assert fakeredis.FakeRedis(server=server).keys("jwt:revoked:*")
+
+
+@pytest.mark.parametrize("forged", [
+    "garbage",
+    jwt.encode({"sub": str(uuid.uuid4()), "exp": 253402300799}, "not-our-key", algorithm=JWT_ALGORITHM),
+    jwt.encode({"sub": str(uuid.uuid4()), "exp": "never"}, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM),
+])
+def test_logout_rejects_tokens_that_do_not_verify(client, server, forged):
+    assert logout(client, forged) == 401
+    assert fakeredis.FakeRedis(server=server).keys("jwt:revoked:*") == []
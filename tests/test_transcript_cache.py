@@ -0,0 +1,73 @@
+# tests/test_transcript_cache.py
+import asyncio
+
+import pytest
+
+from app.services.transcript_cache import TranscriptCache
+
+KEY = TranscriptCache.key("abc123", "whisper-small", "en")
+
+
+@pytest.fixture
+def cache():
+    return TranscriptCache(16, 60)
+
+
+class Transcriber:
+    def __init__(self, delay: float = 0.05, error: Exception = None):
+        self.delay, self.error = delay, error
+        self.calls = self.cancelled = 0
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error:
+            raise self.error
+        return "chest pain since yesterday"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_transcription(cache):
+    asr = Transcriber()
+    texts = await asyncio.gather(*(cache.get_or_compute(KEY, asr) for _ in range(5)))
+    assert set(texts) == {"chest pain since yesterday"} and asr.calls == 1
+    assert cache.stats()["coalesced"] == 4
+    assert await cache.get_or_compute(KEY, asr) == texts[0] and cache.hits == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_fail_followers(cache):
+    asr = Transcriber()
+    leader = asyncio.create_task(cache.get_or_compute(KEY, asr))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(cache.get_or_compute(KEY, asr))
+    await asyncio.sleep(0)
+    leader.cancel()
+    assert await follower == "chest pain since yesterday"
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    assert asr.calls == 1 and asr.cancelled == 0
+
+
+@pytest.mark.asyncio
+async def test_transcription_is_cancelled_once_nobody_waits(cache):
+    asr = Transcriber(delay=5)
+    waiters = [asyncio.create_task(cache.get_or_compute(KEY, asr)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    for w in waiters:
+        w.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+    await asyncio.sleep(0)
+    assert asr.cancelled == 1 and cache._pending == {}
+
+
+@pytest.mark.asyncio
+async def test_failure_reaches_every_waiter_and_is_not_cached(cache):
+    asr = Transcriber(error=RuntimeError("model crashed"))
+    results = await asyncio.gather(*(cache.get_or_compute(KEY, asr) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(r, RuntimeError) for r in results) and asr.calls == 1
+    assert await cache.get(KEY) is None and cache._pending == {}
@@ -0,0 +1,34 @@
+# tests/test_vector_store.py
+import numpy as np
+import pytest
+
+from app.ai.vector_store import VectorStore
+from app.benchmarks.vector_search import dataset, recall
+
+DIM, ROWS, DOCTORS = 32, 20_000, 50
+
+
+@pytest.fixture(scope="module")
+def store():
+    data = dataset(ROWS, DIM, clusters=200)
+    ids = np.array([str(i) for i in range(ROWS)])
+    store = VectorStore(DIM, capacity=ROWS, index="ivf", ann_min_rows=0, nprobe=4)
+    for d in range(DOCTORS):
+        store.add(ids[d::DOCTORS].tolist(), data[d::DOCTORS], doctor_id=f"doc{d}")
+    store.build_index()
+    return store, data
+
+
+def test_ivf_recall_for_a_doctor_with_a_small_share_of_rows(store):
+    store, data = store
+    rnd = np.random.default_rng(1)
+    queries = data[rnd.choice(np.arange(0, ROWS, DOCTORS), size=50)] + 0.3 * rnd.normal(size=(50, DIM)).astype(np.float32)
+    exact = store.search(queries, "doc0", 10, exact=True)
+    approx = store.search(queries, "doc0", 10)
+    assert recall(approx, exact) >= 0.95
+
+
+def test_results_stay_within_the_doctor(store):
+    store, data = store
+    hits = store.search(data[7], "doc3", 10)
+    assert len(hits) == 10 and all(int(id_) % DOCTORS == 3 for id_, _ in hits)
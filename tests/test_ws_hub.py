@@ -0,0 +1,148 @@
+# tests/test_ws_hub.py
+import asyncio
+import json
+
+import fakeredis
+import pytest
+
+from app.services.ws_hub import FanoutHub
+
+
+class Socket:
+    """Records frames; `delay` stands in for a client that reads slowly."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.frames: list = []
+        self.closed_with = None
+
+    async def send(self, text: str):
+        await asyncio.sleep(self.delay)
+        self.frames.append(json.loads(text))
+
+    async def close(self, code: int):
+        self.closed_with = code
+
+    def events(self) -> list:
+        out = []
+        for frame in self.frames:
+            out += frame["events"] if frame["type"] == "batch" else [frame]
+        return out
+
+
+async def until(condition, timeout: float = 3.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def hubs(server):
+    """make(**kwargs) -> a started FanoutHub on the shared fake Redis (one per "worker")"""
+    started = []
+
+    def make(max_pending=256, batch_max=64, flush_ms=0, send_timeout_s=1.0):
+        hub = FanoutHub(
+            max_pending, batch_max, flush_ms, send_timeout_s,
+            redis=fakeredis.aioredis.FakeRedis(server=server), reconnect_s=0.05,
+        )
+        hub.start()
+        started.append(hub)
+        return hub
+
+    yield make
+    loop = asyncio.get_event_loop()
+    for hub in started:
+        loop.run_until_complete(hub.close())
+
+
+async def ready(*hubs):
+    await until(lambda: all(h.stats()["connected"] for h in hubs))
+
+
+@pytest.mark.asyncio
+async def test_event_reaches_sockets_on_other_workers(hubs):
+    a, b = hubs(), hubs()
+    await ready(a, b)
+    on_a, on_b = Socket(), Socket()
+    await a.connect("doctor-1", on_a.send, on_a.close)
+    await b.connect("doctor-1", on_b.send, on_b.close)
+    await b.publish("user:doctor-1", {"type": "note_saved", "id": 1})
+    await until(lambda: on_a.events() and on_b.events())
+    assert on_a.events() == on_b.events() == [{"type": "note_saved", "id": 1}]
+
+
+@pytest.mark.asyncio
+async def test_keyed_events_coalesce_while_queued(hubs):
+    a = hubs(flush_ms=200)
+    await ready(a)
+    sock = Socket()
+    await a.connect("doctor-1", sock.send, sock.close)
+    for pct in (10, 20, 30):
+        await a.publish("user:doctor-1", {"type": "progress", "pct": pct}, key="upload")
+    await a.publish("user:doctor-1", {"type": "other"})
+    await until(lambda: len(sock.events()) == 2)
+    assert sock.events() == [{"type": "progress", "pct": 30}, {"type": "other"}]
+    assert len(sock.frames) == 1
+
+
+@pytest.mark.asyncio
+async def test_full_outbox_drops_oldest_and_says_so(hubs):
+    a = hubs(max_pending=3, flush_ms=200)
+    await ready(a)
+    sock = Socket()
+    await a.connect("doctor-1", sock.send, sock.close)
+    for i in range(5):
+        await a.publish("user:doctor-1", {"type": "tick", "i": i})
+    await until(lambda: len(sock.events()) == 4)
+    assert sock.events() == [{"type": "dropped", "count": 2}] + [{"type": "tick", "i": i} for i in (2, 3, 4)]
+
+
+@pytest.mark.asyncio
+async def test_slow_consumer_is_closed_with_1013(hubs):
+    a = hubs(send_timeout_s=0.05)
+    await ready(a)
+    slow, fast = Socket(delay=1.0), Socket()
+    await a.connect("doctor-1", slow.send, slow.close)
+    await a.connect("doctor-1", fast.send, fast.close)
+    await a.publish("user:doctor-1", {"type": "tick"})
+    await until(lambda: slow.closed_with is not None and fast.events())
+    assert slow.closed_with == 1013 and fast.closed_with is None
+
+
+@pytest.mark.asyncio
+async def test_reconnect_sends_resync(hubs, server):
+    a, b = hubs(), hubs()
+    await ready(a, b)
+    sock = Socket()
+    await a.connect("doctor-1", sock.send, sock.close)
+    server.connected = False
+    await until(lambda: not a.stats()["connected"])
+    server.connected = True
+    await until(lambda: {"type": "resync"} in sock.events())
+    await ready(a)
+    await b.publish("user:doctor-1", {"type": "after"})  # subscriptions were restored
+    await until(lambda: {"type": "after"} in sock.events())
+    assert a.stats()["reconnects"] == 1
+
+
+@pytest.mark.asyncio
+async def test_malformed_message_is_skipped_without_reconnecting(hubs, server):
+    a = hubs()
+    await ready(a)
+    sock = Socket()
+    await a.connect("doctor-1", sock.send, sock.close)
+    raw = fakeredis.aioredis.FakeRedis(server=server)
+    for junk in (b"not json", b"42", b'["k", {"not": "a string"}]', b"[1, 2, 3]", b"\xff\xfe"):
+        await raw.publish("ws:user:doctor-1", junk)
+    await a.publish("user:doctor-1", {"type": "fine"})
+    await until(lambda: sock.events())
+    assert sock.events() == [{"type": "fine"}]
+    assert a.stats()["malformed"] == 5 and a.stats()["reconnects"] == 0
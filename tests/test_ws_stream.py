@@ -0,0 +1,63 @@
+# tests/test_ws_stream.py
+import uuid
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.api import websocket
+from app.core.security import create_access_token
+from app.services import stt_service, stt_stream
+
+
+@pytest.fixture
+def token(monkeypatch):
+    async def not_revoked(digest):
+        return False
+
+    monkeypatch.setattr(websocket, "is_token_revoked", not_revoked)
+    monkeypatch.setattr(stt_service, "sampling_rate", lambda: 16000)
+    return create_access_token({"sub": str(uuid.uuid4())})
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(websocket.router, prefix="/api/v1/ws")
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.mark.parametrize("rate", ["fast", 0, -16000, 44100.0, True, 10**9])
+def test_bad_sample_rate_is_a_policy_violation(client, token, rate):
+    with client.websocket_connect("/api/v1/ws/stream") as ws:
+        assert ws.receive_text() == "connected"
+        ws.send_json({"type": "start", "token": token, "sample_rate": rate})
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+    assert closed.value.code == 1008
+
+
+@pytest.mark.parametrize("extra", [{}, {"sample_rate": None}, {"sample_rate": 44100}])
+def test_valid_start(client, token, extra):
+    with client.websocket_connect("/api/v1/ws/stream") as ws:
+        assert ws.receive_text() == "connected"
+        ws.send_json({"type": "start", "token": token, **extra})
+        assert ws.receive_json() == {"type": "ready"}
+
+
+def test_transcription_failure_is_reported(client, token, monkeypatch):
+    async def broken(audio, language):
+        raise RuntimeError("model crashed")
+
+    monkeypatch.setattr(stt_stream, "transcribe_array", broken)
+    with client.websocket_connect("/api/v1/ws/stream") as ws:
+        assert ws.receive_text() == "connected"
+        ws.send_json({"type": "start", "token": token})
+        assert ws.receive_json() == {"type": "ready"}
+        ws.send_bytes((np.ones(4000) * 1000).astype("<i2").tobytes())  # 0.25 s: below one step
+        ws.send_json({"type": "stop"})
+        assert ws.receive_json()["type"] == "error"
+        assert ws.receive_json() == {"type": "end"}